@@ -1,22 +1,42 @@
 from __future__ import annotations
 
 import argparse
+import importlib
 import logging
 import sys
 
 from .build_full import run_full_build
 from .build_incremental import run_incremental_build
+from .build_rolling import run_rolling_build
 from .config import BuildMode, Settings
+from .profiling import PROFILE_MODES, run_profiled
+from .utils import setup_logging
+
+_COMMANDS = {
+    "apply": "vademecum_builder.apply",
+    "bench": "vademecum_builder.bench",
+    "history": "vademecum_builder.history",
+    "lookup": "vademecum_builder.lookup_index",
+    "merge": "vademecum_builder.merge",
+    "plan": "vademecum_builder.plan",
+    "microbench": "vademecum_builder.microbench",
+    "search": "vademecum_builder.search_index",
+    "standin": "vademecum_builder.standin",
+    "sync": "vademecum_builder.chunks",
+    "verify": "vademecum_builder.verify",
+    "watch": "vademecum_builder.watch",
+}
 
 
 def _build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(
         prog="vademecum_builder",
-        description="Construye datasets offline de vademécum CIMA (FULL o INCREMENTAL).",
+        description="Construye datasets offline de vademécum CIMA (FULL, INCREMENTAL o ROLLING).",
+        epilog="Comandos adicionales: " + ", ".join(sorted(_COMMANDS)),
     )
     parser.add_argument(
         "--mode",
-        choices=[BuildMode.FULL.value, BuildMode.INCREMENTAL.value],
+        choices=[mode.value for mode in BuildMode],
         default=None,
         help="Modo de construcción. Si se omite, usa MODE y por defecto full.",
     )
@@ -35,6 +55,49 @@ def _build_parser() -> argparse.ArgumentParser:
         default=None,
         help="Ruta de state. Por defecto STATE_PATH o <out-dir>/state.json.",
     )
+    parser.add_argument(
+        "--profile",
+        choices=PROFILE_MODES,
+        default=None,
+        help=(
+            "Perfila el build: cprofile (cProfile + tracemalloc) o sample (muestreo de pilas, "
+            "bajo coste). Escribe en <out-dir>/profile/."
+        ),
+    )
+    parser.add_argument(
+        "--profile-top",
+        type=int,
+        default=25,
+        help="Nº de entradas en los informes de funciones y asignaciones. Por defecto: 25",
+    )
+    parser.add_argument(
+        "--limit-medicamentos",
+        type=int,
+        default=None,
+        help="Procesa como mucho N medicamentos (muestra representativa). Usa LIMIT_MEDICAMENTOS.",
+    )
+    parser.add_argument(
+        "--shard",
+        default=None,
+        help=(
+            "Nodo i/N de un FULL distribuido: escribe solo el parcial de su partición en "
+            "<out-dir>/partials/. Usa BUILD_SHARD. Se combinan con el comando merge."
+        ),
+    )
+    parser.add_argument(
+        "--archive",
+        default=None,
+        help="Archiva cada respuesta cruda de CIMA en este directorio. Usa ARCHIVE_DIR.",
+    )
+    parser.add_argument(
+        "--replay",
+        default=None,
+        metavar="ARCHIVE",
+        help=(
+            "Sirve todas las respuestas de CIMA desde un archivo creado con --archive, sin red. "
+            "Usa REPLAY_ARCHIVE."
+        ),
+    )
     parser.add_argument(
         "--log-level",
         default="INFO",
@@ -44,13 +107,14 @@ def _build_parser() -> argparse.ArgumentParser:
 
 
 def main(argv: list[str] | None = None) -> int:
-    parser = _build_parser()
-    args = parser.parse_args(argv)
+    raw_args = sys.argv[1:] if argv is None else argv
+    if raw_args and raw_args[0] in _COMMANDS:
+        command = importlib.import_module(_COMMANDS[raw_args[0]])
+        return int(command.main(raw_args[1:]))
 
-    logging.basicConfig(
-        level=getattr(logging, str(args.log_level).upper(), logging.INFO),
-        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
-    )
+    parser = _build_parser()
+    args = parser.parse_args(raw_args)
+    setup_logging(args.log_level)
 
     try:
         settings = Settings.from_sources(
@@ -58,14 +122,29 @@ def main(argv: list[str] | None = None) -> int:
             cli_version=args.version,
             cli_out_dir=args.out_dir,
             cli_state_path=args.state_path,
+            cli_limit_medicamentos=args.limit_medicamentos,
+            cli_shard=args.shard,
+            cli_archive=args.archive,
+            cli_replay=args.replay,
         )
     except ValueError as exc:
         logging.getLogger(__name__).error("Configuración inválida: %s", exc)
         return 2
 
-    if settings.mode is BuildMode.FULL:
-        return run_full_build(settings)
-    return run_incremental_build(settings)
+    builds = {
+        BuildMode.FULL: run_full_build,
+        BuildMode.INCREMENTAL: run_incremental_build,
+        BuildMode.ROLLING: run_rolling_build,
+    }
+    build = builds[settings.mode]
+    if args.profile:
+        return run_profiled(
+            lambda: build(settings),
+            mode=args.profile,
+            out_dir=settings.out_dir / "profile",
+            top=args.profile_top,
+        )
+    return build(settings)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,346 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import io
+import json
+import logging
+import sqlite3
+import sys
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+from .utils import setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 2000
+COLUMNS = (
+    "cn",
+    "nregistro",
+    "nombre",
+    "lab",
+    "atc",
+    "forma",
+    "via",
+    "ft",
+    "pros",
+    "financiado",
+    "precio",
+    "updated_at",
+    "source",
+    "hash",
+)
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS presentaciones (
+    cn TEXT PRIMARY KEY,
+    nregistro TEXT,
+    nombre TEXT,
+    lab TEXT,
+    atc TEXT,
+    forma TEXT,
+    via TEXT,
+    ft TEXT,
+    pros TEXT,
+    financiado INTEGER,
+    precio REAL,
+    updated_at TEXT,
+    source TEXT,
+    hash TEXT
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+# Carga masiva en una sola transacción: el WAL y synchronous=NORMAL evitan un fsync por página y
+# la caché grande mantiene el índice de la clave primaria en memoria.
+_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA cache_size=-65536",
+)
+
+
+@dataclass(frozen=True)
+class ApplyResult:
+    version: str
+    mode: str
+    file: str
+    upserts: int
+    deletes: int
+    seconds: float
+
+    @property
+    def rows_per_second(self) -> float:
+        total = self.upserts + self.deletes
+        return round(total / self.seconds, 1) if self.seconds else 0.0
+
+
+def apply_manifest(
+    db_path: Path,
+    manifest_path: Path,
+    *,
+    artifacts_dir: Path | None = None,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+) -> ApplyResult | None:
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    artifacts_dir = artifacts_dir or manifest_path.parent
+    version = str(manifest["version"])
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        for pragma in _PRAGMAS:
+            conn.execute(pragma)
+        conn.executescript(_SCHEMA)
+        local_version = _meta(conn, "version")
+        if local_version == version:
+            LOGGER.info("La base de datos ya está en la versión %s", version)
+            return None
+
+        entry = _select_artifact(manifest, local_version)
+        deleted_path = artifacts_dir / entry["deleted_file"] if entry.get("deleted_file") else None
+        started = time.perf_counter()
+        conn.execute("BEGIN")
+        try:
+            if entry["mode"] == "full":
+                conn.execute("DELETE FROM presentaciones")
+            # Un full particionado se aplica shard a shard, cada uno con su propio sha256.
+            parts = entry.get("shards") or [entry]
+            upserts = sum(
+                _apply_upserts(
+                    conn,
+                    artifacts_dir / part["file"],
+                    expected_sha256=str(part["sha256"]),
+                    batch_size=batch_size,
+                )
+                for part in parts
+            )
+            deletes = _apply_deletes(conn, deleted_path, batch_size) if deleted_path else 0
+            conn.execute(
+                "INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)",
+                (version,),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return ApplyResult(
+            version=version,
+            mode=entry["mode"],
+            file=entry["file"] or ", ".join(part["file"] for part in parts),
+            upserts=upserts,
+            deletes=deletes,
+            seconds=round(time.perf_counter() - started, 3),
+        )
+    finally:
+        conn.close()
+
+
+def _select_artifact(manifest: dict[str, Any], local_version: str | None) -> dict[str, Any]:
+    main = {
+        "mode": manifest["mode"],
+        "file": manifest.get("file"),
+        "deleted_file": manifest.get("deleted_file"),
+        "sha256": manifest.get("sha256"),
+        "shards": manifest.get("shards"),
+    }
+    if manifest["mode"] == "full":
+        return main
+    if local_version is None:
+        raise ValueError("La base de datos está vacía: aplica primero un artefacto full.")
+    # El delta normal solo vale desde la versión inmediatamente anterior; si la base local viene
+    # de más atrás y no hay puesta al día para ella, aplicarlo perdería las versiones saltadas.
+    if manifest.get("previous_version") == local_version:
+        return main
+    for catchup in manifest.get("catchup") or []:
+        if catchup.get("from_version") == local_version:
+            LOGGER.info("Aplicando delta de puesta al día desde %s", local_version)
+            return {**catchup, "mode": "catchup"}
+    raise ValueError(
+        f"No hay delta desde la versión local {local_version} "
+        f"(el delta parte de {manifest.get('previous_version')}): aplica un artefacto full."
+    )
+
+
+def _apply_upserts(
+    conn: sqlite3.Connection,
+    path: Path,
+    *,
+    expected_sha256: str,
+    batch_size: int,
+) -> int:
+    applied = 0
+    with path.open("rb") as raw:
+        hashing = _HashingReader(raw)
+        with io.TextIOWrapper(gzip.GzipFile(fileobj=hashing), encoding="utf-8") as text:
+            # Las líneas de un delta por campos traen columnas distintas: se agrupan por columnas
+            # para que cada grupo sea un único executemany.
+            groups: dict[tuple[str, ...], list[tuple[Any, ...]]] = {}
+            pending = 0
+            for line in text:
+                if not line.strip():
+                    continue
+                row = _row_from_record(json.loads(line))
+                groups.setdefault(tuple(row), []).append(tuple(row.values()))
+                pending += 1
+                if pending >= batch_size:
+                    applied += _flush_upserts(conn, groups)
+                    groups, pending = {}, 0
+            applied += _flush_upserts(conn, groups)
+        hashing.drain()
+    if hashing.hexdigest() != expected_sha256:
+        raise ValueError(
+            f"sha256 no coincide para {path.name}: "
+            f"esperado {expected_sha256}, obtenido {hashing.hexdigest()}"
+        )
+    return applied
+
+
+def _flush_upserts(
+    conn: sqlite3.Connection,
+    groups: dict[tuple[str, ...], list[tuple[Any, ...]]],
+) -> int:
+    applied = 0
+    for columns, rows in groups.items():
+        if not set(COLUMNS) <= set(columns):
+            # Línea de un delta por campos: solo puede completar una fila que ya existe.
+            missing = _missing_cns(conn, [str(row[columns.index("cn")]) for row in rows])
+            if missing:
+                raise ValueError(
+                    f"Parche para {len(missing)} CN ausentes en la base local "
+                    f"(p. ej. {', '.join(sorted(missing)[:5])}): aplica un artefacto full."
+                )
+        updates = ", ".join(f"{column} = excluded.{column}" for column in columns if column != "cn")
+        sql = (
+            f"INSERT INTO presentaciones ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))}) "
+            f"ON CONFLICT (cn) DO UPDATE SET {updates}"
+        )
+        # Upsert sin efecto si el contenido local ya es el publicado.
+        sql += " WHERE excluded.hash IS NULL OR presentaciones.hash IS NOT excluded.hash"
+        conn.executemany(sql, rows)
+        applied += len(rows)
+    return applied
+
+
+def _missing_cns(conn: sqlite3.Connection, cns: list[str]) -> set[str]:
+    missing = set(cns)
+    for batch in _batched(iter(cns), 500):
+        placeholders = ", ".join("?" * len(batch))
+        rows = conn.execute(f"SELECT cn FROM presentaciones WHERE cn IN ({placeholders})", batch)
+        missing.difference_update(row[0] for row in rows)
+    return missing
+
+
+def _apply_deletes(conn: sqlite3.Connection, path: Path, batch_size: int) -> int:
+    deleted = 0
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for batch in _batched((line.strip() for line in handle if line.strip()), batch_size):
+            conn.executemany("DELETE FROM presentaciones WHERE cn = ?", [(cn,) for cn in batch])
+            deleted += len(batch)
+    return deleted
+
+
+def _row_from_record(record: dict[str, Any]) -> dict[str, Any]:
+    row: dict[str, Any] = {}
+    for key, value in record.items():
+        if key == "docs":
+            docs = value or {}
+            row["ft"] = docs.get("ft")
+            row["pros"] = docs.get("pros")
+        elif key == "atc":
+            row["atc"] = json.dumps(value, ensure_ascii=False) if value is not None else None
+        elif key in COLUMNS:
+            row[key] = value
+    # Sin hash publicado, el local deja de ser válido para omitir parches posteriores.
+    row.setdefault("hash", None)
+    return row
+
+
+def _meta(conn: sqlite3.Connection, key: str) -> str | None:
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return str(row[0]) if row else None
+
+
+def _batched(items: Iterator[str], size: int) -> Iterator[list[str]]:
+    batch: list[str] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class _HashingReader(io.RawIOBase):
+    # Calcula el sha256 de los bytes comprimidos mientras GzipFile los consume.
+    def __init__(self, raw: BinaryIO) -> None:
+        self._raw = raw
+        self._sha = hashlib.sha256()
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer: Any) -> int:
+        data = self._raw.read(len(buffer))
+        self._sha.update(data)
+        buffer[: len(data)] = data
+        return len(data)
+
+    def drain(self) -> None:
+        for chunk in iter(lambda: self._raw.read(1024 * 1024), b""):
+            self._sha.update(chunk)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder apply",
+        description=(
+            "Aplica el artefacto anunciado en manifest.json (full, delta o puesta al día) a una "
+            "base de datos SQLite. Implementación de referencia para clientes."
+        ),
+    )
+    parser.add_argument("--db", required=True, help="Base de datos SQLite de destino.")
+    parser.add_argument(
+        "--manifest",
+        default="./out/manifest.json",
+        help="Ruta de manifest.json. Por defecto: ./out/manifest.json",
+    )
+    parser.add_argument(
+        "--artifacts-dir",
+        default=None,
+        help="Directorio de los .gz. Por defecto, el del manifest.",
+    )
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        result = apply_manifest(
+            Path(args.db),
+            Path(args.manifest),
+            artifacts_dir=Path(args.artifacts_dir) if args.artifacts_dir else None,
+            batch_size=args.batch_size,
+        )
+    except ValueError as exc:
+        LOGGER.error("%s", exc)
+        return 1
+    if result is not None:
+        report = {**asdict(result), "rows_per_second": result.rows_per_second}
+        sys.stdout.write(json.dumps(report, ensure_ascii=False, indent=2) + "\n")
+    return 0
@@ -0,0 +1,88 @@
+from __future__ import annotations
+
+import gzip
+import json
+import logging
+import threading
+from collections.abc import Mapping
+from pathlib import Path
+from typing import Any
+from urllib.parse import urlencode
+
+LOGGER = logging.getLogger(__name__)
+
+ARCHIVE_DATA = "responses.gz"
+ARCHIVE_INDEX = "index.jsonl"
+
+
+class ArchiveMissError(LookupError):
+    pass
+
+
+def request_key(path: str, params: Mapping[str, Any] | None) -> str:
+    query = urlencode(sorted((params or {}).items()))
+    return f"{path}?{query}" if query else path
+
+
+def open_archive(directory: Path | None) -> "ResponseArchive | None":
+    return ResponseArchive(directory) if directory is not None else None
+
+
+class ResponseArchive:
+    # Archivo de respuestas crudas de CIMA: cada respuesta es un miembro gzip independiente
+    # añadido al final de responses.gz (zcat lo lee entero) y una línea en index.jsonl con su
+    # posición. Solo se añade; si una petición se archiva dos veces, gana la última.
+    def __init__(self, directory: Path) -> None:
+        self.directory = directory
+        self.data_path = directory / ARCHIVE_DATA
+        self.index_path = directory / ARCHIVE_INDEX
+        self._lock = threading.Lock()
+        self._index: dict[str, tuple[int, int]] | None = None
+
+    def put(self, path: str, params: Mapping[str, Any] | None, content: bytes) -> None:
+        key = request_key(path, params)
+        member = gzip.compress(content, mtime=0)
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            with self.data_path.open("ab") as data:
+                offset = data.tell()
+                data.write(member)
+            # El índice se escribe después de los datos: una línea nunca apunta a bytes a medias.
+            with self.index_path.open("a", encoding="utf-8") as index:
+                index.write(json.dumps({"k": key, "o": offset, "n": len(member)}) + "\n")
+            if self._index is not None:
+                self._index[key] = (offset, len(member))
+
+    def get(self, path: str, params: Mapping[str, Any] | None) -> bytes:
+        key = request_key(path, params)
+        entry = self._load_index().get(key)
+        if entry is None:
+            raise ArchiveMissError(f"Respuesta no archivada en {self.directory}: {key}")
+        offset, length = entry
+        with self.data_path.open("rb") as data:
+            data.seek(offset)
+            return gzip.decompress(data.read(length))
+
+    def __len__(self) -> int:
+        return len(self._load_index())
+
+    def _load_index(self) -> dict[str, tuple[int, int]]:
+        with self._lock:
+            if self._index is None:
+                self._index = _read_index(self.index_path)
+            return self._index
+
+
+def _read_index(path: Path) -> dict[str, tuple[int, int]]:
+    index: dict[str, tuple[int, int]] = {}
+    if not path.exists():
+        return index
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            try:
+                raw = json.loads(line)
+                index[str(raw["k"])] = (int(raw["o"]), int(raw["n"]))
+            except (ValueError, KeyError):
+                # Línea truncada por un build interrumpido: se trata como no archivada.
+                LOGGER.warning("Entrada de índice inválida ignorada en %s", path)
+    return index
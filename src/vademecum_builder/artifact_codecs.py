@@ -0,0 +1,189 @@
+from __future__ import annotations
+
+import gzip
+import io
+import logging
+import lzma
+from collections.abc import Iterable
+from contextlib import ExitStack
+from pathlib import Path
+from typing import Any, BinaryIO, TextIO, cast
+
+from .metrics import BuildMetrics
+from .utils import file_size, sha256_file
+
+LOGGER = logging.getLogger(__name__)
+
+CODECS = ("gzip", "xz", "zstd")
+CODEC_SUFFIXES = {"gzip": ".gz", "xz": ".xz", "zstd": ".zst"}
+XZ_PRESET = 9
+ZSTD_LEVEL = 19
+# Diccionario zstd entrenado con las primeras líneas del artefacto (registros JSON pequeños y muy
+# parecidos entre sí); se publica junto al fichero porque el cliente lo necesita para descomprimir.
+ZSTD_DICT_SIZE = 112 * 1024
+ZSTD_SAMPLE_BYTES = 8 * 1024 * 1024
+_READ_CHUNK = 1024 * 1024
+
+
+def parse_codecs(raw: str) -> tuple[str, ...]:
+    # gzip va siempre primero: es el artefacto canónico que describen `file` y `sha256`.
+    names = [item.strip().lower() for item in raw.split(",") if item.strip()]
+    unknown = sorted(set(names) - set(CODECS))
+    if unknown:
+        raise ValueError(f"OUTPUT_CODECS inválido: {', '.join(unknown)}")
+    if "zstd" in names:
+        try:
+            _zstandard()
+        except RuntimeError as exc:
+            raise ValueError(f"OUTPUT_CODECS: {exc}") from exc
+    return ("gzip", *(codec for codec in CODECS[1:] if codec in names))
+
+
+def encoded_path(path: Path, codec: str) -> Path:
+    # vademecum_full.jsonl.gz -> vademecum_full.jsonl.xz
+    return path.with_name(path.name.removesuffix(".gz") + CODEC_SUFFIXES[codec])
+
+
+def dictionary_path(path: Path) -> Path:
+    return path.with_name(path.name.removesuffix(".gz") + ".zdict")
+
+
+def open_binary_writer(path: Path, codec: str, dictionary: bytes | None = None) -> BinaryIO:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if codec == "gzip":
+        return cast(BinaryIO, gzip.GzipFile(path, "wb", mtime=0))
+    if codec == "xz":
+        return cast(BinaryIO, lzma.LZMAFile(path, "wb", preset=XZ_PRESET))
+    if codec == "zstd":
+        zstandard = _zstandard()
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL, dict_data=dict_data)
+        writer: BinaryIO = compressor.stream_writer(path.open("wb"), closefd=True)
+        return writer
+    raise ValueError(f"Códec no soportado: {codec}")
+
+
+def open_text_writer(path: Path, codec: str) -> TextIO:
+    return io.TextIOWrapper(open_binary_writer(path, codec), encoding="utf-8", newline="\n")
+
+
+def open_text_reader(path: Path, codec: str, dictionary: bytes | None = None) -> TextIO:
+    raw: BinaryIO
+    if codec == "gzip":
+        raw = cast(BinaryIO, gzip.open(path, "rb"))
+    elif codec == "xz":
+        raw = cast(BinaryIO, lzma.open(path, "rb"))
+    elif codec == "zstd":
+        zstandard = _zstandard()
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        raw = zstandard.ZstdDecompressor(dict_data=dict_data).stream_reader(
+            path.open("rb"), closefd=True
+        )
+    else:
+        raise ValueError(f"Códec no soportado: {codec}")
+    return io.TextIOWrapper(raw, encoding="utf-8", newline="\n")
+
+
+def open_decompressor(source: BinaryIO, codec: str, dictionary: bytes | None = None) -> BinaryIO:
+    # Descomprime un flujo ya abierto; quien lo abrió lo cierra.
+    if codec == "gzip":
+        return cast(BinaryIO, gzip.GzipFile(fileobj=source, mode="rb"))
+    if codec == "xz":
+        return cast(BinaryIO, lzma.LZMAFile(source, "rb"))
+    if codec == "zstd":
+        zstandard = _zstandard()
+        dict_data = zstandard.ZstdCompressionDict(dictionary) if dictionary else None
+        reader: BinaryIO = zstandard.ZstdDecompressor(dict_data=dict_data).stream_reader(source)
+        return reader
+    raise ValueError(f"Códec no soportado: {codec}")
+
+
+def write_encodings(
+    source: Path,
+    codecs: Iterable[str],
+    *,
+    metrics: BuildMetrics,
+) -> list[dict[str, Any]]:
+    # Recodifica el artefacto gzip final a los demás códecs en una sola pasada: se descomprime una
+    # vez y cada bloque alimenta a todos los codificadores. Se parte del gzip ya cerrado porque el
+    # pool de procesos lo escribe como miembros precomprimidos y la deduplicación puede compactarlo.
+    extra = [codec for codec in codecs if codec != "gzip"]
+    if not extra:
+        return []
+    dictionary: bytes | None = None
+    with ExitStack() as stack, metrics.stage("compression"):
+        reader = cast(BinaryIO, stack.enter_context(gzip.open(source, "rb")))
+        head = reader.read(ZSTD_SAMPLE_BYTES) if "zstd" in extra else b""
+        if head:
+            dictionary = _train_dictionary(head)
+        if dictionary is not None:
+            dictionary_path(source).write_bytes(dictionary)
+        elif "zstd" in extra:
+            # Un diccionario de una ejecución anterior ya no corresponde al nuevo .zst.
+            dictionary_path(source).unlink(missing_ok=True)
+        writers = [
+            stack.enter_context(open_binary_writer(encoded_path(source, codec), codec, dictionary))
+            for codec in extra
+        ]
+        for chunk in _chunks(head, reader):
+            for writer in writers:
+                writer.write(chunk)
+
+    entries: list[dict[str, Any]] = []
+    for codec in extra:
+        path = encoded_path(source, codec)
+        entry = _file_entry(path, metrics)
+        entry = {"codec": codec, **entry}
+        if codec == "zstd" and dictionary is not None:
+            dict_entry = _file_entry(dictionary_path(source), metrics)
+            entry["dictionary"] = dict_entry["file"]
+            entry["dictionary_sha256"] = dict_entry["sha256"]
+        entries.append(entry)
+    return entries
+
+
+def encodings_entry(
+    file_name: str,
+    sha256: str,
+    size: int,
+    extra: list[dict[str, Any]],
+) -> list[dict[str, Any]]:
+    # Lista completa para el manifest, con el gzip canónico delante; vacía si solo hay gzip.
+    if not extra:
+        return []
+    return [{"codec": "gzip", "file": file_name, "sha256": sha256, "size": size}, *extra]
+
+
+def _chunks(head: bytes, reader: BinaryIO) -> Iterable[bytes]:
+    if head:
+        yield head
+    yield from iter(lambda: reader.read(_READ_CHUNK), b"")
+
+
+def _train_dictionary(head: bytes) -> bytes | None:
+    zstandard = _zstandard()
+    samples = [line for line in head.split(b"\n") if line]
+    try:
+        trained = zstandard.train_dictionary(ZSTD_DICT_SIZE, samples)
+    except zstandard.ZstdError as exc:
+        # Con pocos registros no hay muestras suficientes: se comprime sin diccionario.
+        LOGGER.info("Sin diccionario zstd (%s muestras): %s", len(samples), exc)
+        return None
+    data: bytes = trained.as_bytes()
+    return data
+
+
+def _file_entry(path: Path, metrics: BuildMetrics) -> dict[str, Any]:
+    with metrics.stage("hashing"):
+        sha = sha256_file(path)
+    size = file_size(path)
+    metrics.add_bytes_written(path.name, size)
+    return {"file": path.name, "sha256": sha, "size": size}
+
+
+def _zstandard() -> Any:
+    try:
+        import zstandard  # type: ignore
+    except ImportError as exc:
+        raise RuntimeError("zstandard no instalado para el códec zstd") from exc
+    return zstandard
@@ -0,0 +1,186 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+from dataclasses import replace
+from datetime import date, timedelta
+from multiprocessing.connection import Connection
+from pathlib import Path
+from typing import Any
+
+import requests
+
+from .build_full import run_full_build
+from .build_incremental import run_incremental_build
+from .config import BuildMode, Settings
+from .standin import STATS_PATH, StandinConfig, StandinServer, add_config_arguments
+from .standin import config_from_args as standin_config_from_args
+from .utils import peak_rss_bytes, setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder bench",
+        description=(
+            "Ejecuta run_full_build y run_incremental_build contra el stand-in local de CIMA "
+            "y mide el rendimiento de extremo a extremo."
+        ),
+    )
+    add_config_arguments(parser)
+    parser.add_argument(
+        "--out-dir",
+        default=None,
+        help="Directorio de salida. Por defecto, un directorio temporal.",
+    )
+    parser.add_argument("--version", default="2026-01-01", help="Versión del build full.")
+    parser.add_argument("--transform-workers", type=int, default=0)
+    parser.add_argument("--http-max-retries", type=int, default=5)
+    parser.add_argument(
+        "--skip-incremental",
+        action="store_true",
+        help="Mide solo el build full.",
+    )
+    parser.add_argument("--report", default=None, help="Ruta donde guardar el informe JSON.")
+    parser.add_argument("--log-level", default="WARNING")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    config = standin_config_from_args(args)
+    if args.out_dir:
+        report = run_benchmark(config, Path(args.out_dir).resolve(), args)
+    else:
+        with tempfile.TemporaryDirectory(prefix="vademecum-bench-") as tmp:
+            report = run_benchmark(config, Path(tmp), args)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.report:
+        Path(args.report).write_text(text, encoding="utf-8")
+    sys.stdout.write(text + "\n")
+    return 0 if all(phase["exit_code"] == 0 for phase in report["phases"]) else 1
+
+
+def run_benchmark(
+    config: StandinConfig,
+    out_dir: Path,
+    args: argparse.Namespace,
+) -> dict[str, Any]:
+    # El stand-in corre en otro proceso para no competir por el GIL con el build medido.
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(config, child_conn), daemon=True)
+    server.start()
+    try:
+        base_url = parent_conn.recv()
+        settings = Settings(
+            mode=BuildMode.FULL,
+            out_dir=out_dir,
+            version=args.version,
+            nomenclator_url=None,
+            nomenclator_path=None,
+            http_timeout=30,
+            http_max_retries=args.http_max_retries,
+            state_path=out_dir / "state.json",
+            max_error_ids=2000,
+            cima_base_url=base_url,
+            transform_workers=args.transform_workers,
+        )
+        phases = [_run_phase("full", settings, base_url, args.log_level)]
+        if not args.skip_incremental:
+            next_version = (date.fromisoformat(args.version) + timedelta(days=7)).isoformat()
+            incremental = replace(settings, mode=BuildMode.INCREMENTAL, version=next_version)
+            phases.append(_run_phase("incremental", incremental, base_url, args.log_level))
+    finally:
+        server.terminate()
+        server.join()
+
+    return {
+        "standin": {
+            "size": config.size,
+            "page_size": config.page_size,
+            "latency_ms": config.latency_ms,
+            "slow_rate": config.slow_rate,
+            "rate_429": config.rate_429,
+            "rate_5xx": config.rate_5xx,
+        },
+        "transform_workers": args.transform_workers,
+        "phases": phases,
+    }
+
+
+def _run_phase(name: str, settings: Settings, base_url: str, log_level: str) -> dict[str, Any]:
+    # Cada fase corre en un proceso nuevo (spawn, sin heredar la memoria del padre) para que
+    # ru_maxrss sea el pico de esa fase y no el de todo el benchmark.
+    before = _standin_requests(base_url)
+    parent_conn, child_conn = multiprocessing.Pipe(duplex=False)
+    phase = multiprocessing.get_context("spawn").Process(
+        target=_build_phase, args=(settings, log_level, child_conn)
+    )
+    phase.start()
+    child_conn.close()
+    try:
+        exit_code, wall, peak_rss = parent_conn.recv()
+    except EOFError:
+        # El proceso murió sin informar (p. ej. OOM): la fase cuenta como fallida.
+        phase.join()
+        exit_code, wall, peak_rss = phase.exitcode or 1, 0.0, 0
+    phase.join()
+    after = _standin_requests(base_url)
+
+    manifest = json.loads((settings.out_dir / "manifest.json").read_text(encoding="utf-8"))
+    stats = manifest.get("stats") or {}
+    by_status = {
+        key: after.get(key, 0) - before.get(key, 0)
+        for key in after
+        if after.get(key, 0) != before.get(key, 0)
+    }
+    total_requests = sum(by_status.values())
+    records = int(stats.get("presentaciones_emitidas") or 0)
+    result = {
+        "phase": name,
+        "exit_code": exit_code,
+        "wall_seconds": round(wall, 3),
+        "requests": total_requests,
+        "requests_by_status": by_status,
+        "requests_per_second": round(total_requests / wall, 2) if wall else 0.0,
+        "records": records,
+        "records_per_second": round(records / wall, 2) if wall else 0.0,
+        "bytes_out": int(manifest.get("size") or 0)
+        + sum(int(shard["size"]) for shard in manifest.get("shards") or []),
+        "peak_rss_bytes": peak_rss,
+    }
+    LOGGER.info("Fase %s completada: %s", name, result)
+    return result
+
+
+def _build_phase(settings: Settings, log_level: str, conn: Connection) -> None:
+    setup_logging(log_level)
+    started = time.perf_counter()
+    if settings.mode is BuildMode.FULL:
+        exit_code = run_full_build(settings)
+    else:
+        exit_code = run_incremental_build(settings)
+    conn.send((exit_code, time.perf_counter() - started, peak_rss_bytes()))
+    conn.close()
+
+
+def _serve(config: StandinConfig, conn: Connection) -> None:
+    server = StandinServer(config)
+    conn.send(server.url)
+    conn.close()
+    server.serve_forever()
+
+
+def _standin_requests(base_url: str) -> dict[str, int]:
+    response = requests.get(f"{base_url}{STATS_PATH}", timeout=10)
+    response.raise_for_status()
+    return {str(k): int(v) for k, v in response.json()["requests"].items()}
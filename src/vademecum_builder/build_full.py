@@ -1,21 +1,48 @@
 from __future__ import annotations
 
+import gzip
+import json
 import logging
+from collections.abc import Iterator, Mapping, Sequence
+from contextlib import ExitStack, nullcontext
 from dataclasses import replace
+from functools import partial
+from itertools import compress
+from pathlib import Path
+from typing import Any, Protocol, TextIO
 
+from .archive import open_archive
+from .artifact_codecs import (
+    CODEC_SUFFIXES,
+    dictionary_path,
+    encoded_path,
+    encodings_entry,
+    write_encodings,
+)
+from .chunks import ChunkInfo, rechunk
 from .cima_client import CimaClient
 from .config import Settings
-from .incremental import BuildStats, map_presentaciones_from_medicamento, record_from_cima
+from .dedupe import DuplicateResolver, Rank, compact_jsonl, registration_rank
+from .freshness import FRESHNESS_FILE, FreshnessStore, payload_hash
+from .history import HISTORY_FILE, append_run, run_record_from_stats
+from .incremental import BuildStats, apply_nomenclator, base_records_from_medicamento
+from .lookup_index import ATC_INDEX_FILE, LAB_INDEX_FILE, LookupIndexBuilder
 from .manifest import Manifest, write_manifest
-from .nomenclator_loader import load_nomenclator
+from .metrics import BuildMetrics, write_textfile
+from .nomenclator_loader import NomenclatorData, NomenclatorEntry, load_nomenclator
+from .partials import PARTIALS_DIR, PartialItem, PartialMeta, partial_line
+from .profiles import ProfileFanout
+from .record_store import RECORDS_FILE, RecordStore, published_row
+from .search_index import SEARCH_INDEX_FILE, SearchIndexBuilder
+from .shards import SHARDED_LAYOUT, ShardedOutput, ShardInfo, shard_of
 from .state import StateData, save_state
+from .transform import RawMedicamento, iter_batches, transform_in_pool
 from .utils import (
     dumps_json_line,
     ensure_dir,
     file_size,
     iso_to_ddmmyyyy,
     iso_utc_now_z,
-    normalize_cn,
     open_gzip_jsonl_writer,
     sha256_file,
 )
@@ -23,75 +50,230 @@ from .utils import (
 LOGGER = logging.getLogger(__name__)
 
 
+class RecordSink(Protocol):
+    # Salidas adicionales alimentadas con los mismos registros que el artefacto principal.
+    # `retract` retira registros ya añadidos que un CN duplicado desplaza antes del siguiente add.
+    def add(self, records: Sequence[dict[str, Any]]) -> None: ...
+
+    def retract(self, records: Sequence[dict[str, Any]]) -> None: ...
+
+
+class _PreservedUpdatedAtSinks:
+    # Con FULL_CHUNKS el fichero principal conserva el `updated_at` previo de lo que no cambió
+    # (ver `rechunk`); perfiles e índices deben recibir la misma fecha.
+    def __init__(self, sinks: Sequence[RecordSink], record_store: RecordStore) -> None:
+        self._sinks = sinks
+        self._record_store = record_store
+
+    def add(self, records: Sequence[dict[str, Any]]) -> None:
+        previous = self._record_store.previous_updated_at(records)
+        if previous:
+            records = [
+                {**record, "updated_at": previous[record["cn"]]}
+                if record["cn"] in previous
+                else record
+                for record in records
+            ]
+        for sink in self._sinks:
+            sink.add(records)
+
+    def retract(self, records: Sequence[dict[str, Any]]) -> None:
+        for sink in self._sinks:
+            sink.retract(records)
+
+
+class FullWriter(Protocol):
+    def __call__(
+        self,
+        *,
+        nomenclator_map: Mapping[str, NomenclatorEntry],
+        main_file: Path,
+        metrics: BuildMetrics,
+        freshness: FreshnessStore,
+        record_store: RecordStore,
+        sharded: ShardedOutput | None,
+        sinks: Sequence[RecordSink],
+        dedupe: DuplicateResolver,
+    ) -> tuple[BuildStats, list[str]]: ...
+
+
 def run_full_build(settings: Settings) -> int:
     ensure_dir(settings.out_dir)
+    metrics = BuildMetrics()
 
     client = CimaClient(
         base_url=settings.cima_base_url,
         timeout=settings.http_timeout,
         max_retries=settings.http_max_retries,
+        metrics=metrics,
+        archive=open_archive(settings.archive_dir),
+        replay=open_archive(settings.replay_dir),
     )
+    if settings.partition is not None:
+        return _run_partial_build(settings, client=client, metrics=metrics)
 
-    nomenclator_data = load_nomenclator(
-        url=settings.nomenclator_url,
-        path=settings.nomenclator_path,
-        out_dir=settings.out_dir,
-        timeout=settings.http_timeout,
+    with metrics.stage("nomenclator_load"):
+        nomenclator_data = load_nomenclator(
+            url=settings.nomenclator_url,
+            path=settings.nomenclator_path,
+            out_dir=settings.out_dir,
+            timeout=settings.http_timeout,
+        )
+    write_full = _write_full_with_pool if settings.transform_workers > 0 else _write_full_serial
+    return complete_full_build(
+        settings,
+        metrics=metrics,
+        nomenclator_data=nomenclator_data,
+        write=partial(write_full, settings=settings, client=client),
     )
-    nomenclator_map = nomenclator_data.by_cn if nomenclator_data else {}
 
+
+def complete_full_build(
+    settings: Settings,
+    *,
+    metrics: BuildMetrics,
+    nomenclator_data: NomenclatorData | None,
+    write: FullWriter,
+    extra_metrics: Mapping[str, int] | None = None,
+) -> int:
+    # Parte común del FULL de un nodo y del merge de parciales: escribe el artefacto a través de
+    # `write` y actualiza almacenes, manifest, state, métricas e histórico.
+    ensure_dir(settings.out_dir)
+    nomenclator_map = nomenclator_data.by_cn if nomenclator_data else {}
     main_file = settings.out_dir / "vademecum_full.jsonl.gz"
     manifest_file = settings.out_dir / "manifest.json"
 
-    stats = BuildStats()
-    failed_ids: list[str] = []
-
-    with open_gzip_jsonl_writer(main_file) as writer:
-        for med_item in client.iter_medicamentos():
-            nregistro = str(med_item.get("nregistro") or med_item.get("nRegistro") or "").strip()
-            if not nregistro:
-                continue
-
-            try:
-                med_payload = client.get_medicamento(nregistro)
-            except Exception as exc:
-                LOGGER.exception("Error al solicitar medicamento nregistro=%s: %s", nregistro, exc)
-                stats = replace(stats, errores=stats.errores + 1)
-                if len(failed_ids) < settings.max_error_ids:
-                    failed_ids.append(nregistro)
-                continue
-
-            stats = replace(stats, medicamentos_procesados=stats.medicamentos_procesados + 1)
-            presentaciones = map_presentaciones_from_medicamento(med_payload)
-            for presentacion in presentaciones:
-                cn_raw = (
-                    presentacion.get("cn")
-                    or presentacion.get("codigoNacional")
-                    or presentacion.get("codigo_nacional")
-                    or presentacion.get("codigo")
+    run_started = iso_utc_now_z()
+    sharded = None
+    if settings.full_shards > 0:
+        _remove_unsharded_full(main_file)
+        sharded = ShardedOutput(settings.out_dir, settings.full_shards)
+    profiles = None
+    if settings.profiles:
+        profiles = ProfileFanout(
+            settings.profiles,
+            settings.out_dir,
+            version=settings.version,
+            delta=False,
+            metrics=metrics,
+        )
+    index_builders: list[SearchIndexBuilder | LookupIndexBuilder] = []
+    if settings.search_index:
+        index_builders.append(
+            SearchIndexBuilder(settings.out_dir / SEARCH_INDEX_FILE, metrics=metrics)
+        )
+    if settings.lookup_indexes:
+        for kind, file_name in (("atc", ATC_INDEX_FILE), ("lab", LAB_INDEX_FILE)):
+            index_builders.append(
+                LookupIndexBuilder(kind, settings.out_dir / file_name, metrics=metrics)
+            )
+    sinks: list[RecordSink] = [profiles] if profiles is not None else []
+    sinks.extend(index_builders)
+    with (
+        FreshnessStore(settings.store_path(FRESHNESS_FILE)) as freshness,
+        RecordStore(settings.store_path(RECORDS_FILE)) as record_store,
+        sharded or nullcontext(),
+        profiles or nullcontext(),
+        ExitStack() as index_stack,
+    ):
+        for builder in index_builders:
+            index_stack.enter_context(builder)
+        if settings.full_chunks:
+            record_store.snapshot_published()
+            if sinks and sharded is None:
+                sinks = [_PreservedUpdatedAtSinks(sinks, record_store)]
+        record_store.clear()
+        record_store.reset_chain(settings.version)
+        dedupe = DuplicateResolver(record_store)
+        stats, failed_ids = write(
+            nomenclator_map=nomenclator_map,
+            main_file=main_file,
+            metrics=metrics,
+            freshness=freshness,
+            record_store=record_store,
+            sharded=sharded,
+            sinks=sinks,
+            dedupe=dedupe,
+        )
+        shards = sharded.close() if sharded is not None else []
+        if dedupe.duplicates:
+            LOGGER.warning(
+                "CN duplicados=%s (sustituidos por un registro preferente=%s)",
+                dedupe.duplicates,
+                dedupe.superseded,
+            )
+            stats = replace(
+                stats,
+                presentaciones_emitidas=stats.presentaciones_emitidas - dedupe.redundant_lines,
+            )
+        keep = dedupe.keep_occurrences()
+        if keep:
+            with metrics.stage("compression"):
+                if sharded is not None:
+                    shards = _compact_shards(settings.out_dir, shards, keep)
+                else:
+                    compact_jsonl(main_file, keep)
+        chunks: list[ChunkInfo] = []
+        if settings.full_chunks and sharded is None:
+            with metrics.stage("compression"):
+                chunks = rechunk(
+                    main_file,
+                    previous_updated_at=record_store.unchanged_updated_at,
+                    on_preserved=record_store.put_published,
                 )
-                cn = normalize_cn(cn_raw)
-                nom_entry = nomenclator_map.get(cn) if cn else None
+        profile_entries = profiles.close() if profiles is not None else []
+        indexes: list[dict[str, Any]] = []
+        for builder in index_builders:
+            with metrics.stage("indexing"):
+                builder.close()
+            indexes.append(_index_entry(builder.kind, builder.path, builder.records, metrics))
+        freshness.prune_not_seen_since(run_started)
+        if nomenclator_data is not None:
+            with metrics.stage("nomenclator_diff"):
+                record_store.diff_nomenclator(nomenclator_data.by_cn)
 
-                rec = record_from_cima(
-                    nregistro=nregistro,
-                    med_payload=med_payload,
-                    presentacion=presentacion,
-                    updated_at=settings.version,
-                    nomenclator=nom_entry,
-                )
-                if not rec:
-                    continue
-                writer.write(dumps_json_line(rec))
-                stats = replace(stats, presentaciones_emitidas=stats.presentaciones_emitidas + 1)
-
-    sha = sha256_file(main_file)
-    size = file_size(main_file)
+    if sharded is not None:
+        # Compresión y hash se hicieron en los hilos de cada shard (tiempo sumado entre hilos).
+        metrics.add_stage_time("compression", sharded.compression_seconds)
+        metrics.add_stage_time("hashing", sharded.hashing_seconds)
+        for shard in shards:
+            metrics.add_bytes_written(shard.file, shard.size)
+        shards = [
+            replace(
+                shard,
+                encodings=encodings_entry(
+                    shard.file,
+                    shard.sha256,
+                    shard.size,
+                    write_encodings(
+                        settings.out_dir / shard.file, settings.output_codecs, metrics=metrics
+                    ),
+                ),
+            )
+            for shard in shards
+        ]
+        # Sin fichero canónico: los clientes que solo leen `file` fallan en vez de aplicar 1/N.
+        main_name: str | None = None
+        sha: str | None = None
+        size: int | None = None
+        encodings: list[dict[str, Any]] = []
+    else:
+        with metrics.stage("hashing"):
+            sha = sha256_file(main_file)
+        size = file_size(main_file)
+        metrics.add_bytes_written(main_file.name, size)
+        main_name = main_file.name
+        encodings = encodings_entry(
+            main_name,
+            sha,
+            size,
+            write_encodings(main_file, settings.output_codecs, metrics=metrics),
+        )
 
     manifest = Manifest(
         version=settings.version,
         mode="full",
-        file=main_file.name,
+        file=main_name,
         deleted_file=None,
         sha256=sha,
         size=size,
@@ -106,9 +288,16 @@ def run_full_build(settings: Settings) -> int:
             "presentaciones_emitidas": stats.presentaciones_emitidas,
             "presentaciones_eliminadas": 0,
             "errores": stats.errores,
+            "cn_duplicados": dedupe.duplicates,
+            **_add_counters(metrics.summary(), extra_metrics or {}),
         },
+        shards=[shard.to_raw() for shard in shards],
+        profiles=profile_entries,
+        indexes=indexes,
+        encodings=encodings,
+        chunks=[chunk.to_raw() for chunk in chunks],
+        layout=SHARDED_LAYOUT if sharded is not None else None,
     )
-    write_manifest(manifest_file, manifest)
 
     state = StateData(
         last_success_version=settings.version,
@@ -118,7 +307,14 @@ def run_full_build(settings: Settings) -> int:
         stats_last_run=manifest.stats,
         failed_nregistro_last_run=failed_ids,
     )
-    save_state(settings.state_path, state)
+    with metrics.stage("state_write"):
+        write_manifest(manifest_file, manifest)
+        save_state(settings.state_path, state)
+    write_textfile(settings.metrics_textfile(), metrics, {"mode": "full"})
+    append_run(
+        settings.store_path(HISTORY_FILE),
+        run_record_from_stats("full", settings.version, manifest.stats),
+    )
 
     LOGGER.info(
         "FULL completado version=%s medicamentos=%s presentaciones=%s errores=%s",
@@ -128,3 +324,307 @@ def run_full_build(settings: Settings) -> int:
         stats.errores,
     )
     return 0
+
+
+def _write_full_serial(
+    *,
+    settings: Settings,
+    client: CimaClient,
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    main_file: Path,
+    metrics: BuildMetrics,
+    freshness: FreshnessStore,
+    record_store: RecordStore,
+    sharded: ShardedOutput | None,
+    sinks: Sequence[RecordSink],
+    dedupe: DuplicateResolver,
+) -> tuple[BuildStats, list[str]]:
+    stats = BuildStats()
+    failed_ids: list[str] = []
+
+    with ExitStack() as stack:
+        writer = None if sharded else stack.enter_context(open_gzip_jsonl_writer(main_file))
+        for nregistro in _iter_nregistros(client, settings.limit_medicamentos):
+            try:
+                med_payload = client.get_medicamento(nregistro)
+            except Exception as exc:
+                LOGGER.exception("Error al solicitar medicamento nregistro=%s: %s", nregistro, exc)
+                stats = replace(stats, errores=stats.errores + 1)
+                freshness.mark_unfetched(nregistro)
+                if len(failed_ids) < settings.max_error_ids:
+                    failed_ids.append(nregistro)
+                continue
+
+            stats = replace(stats, medicamentos_procesados=stats.medicamentos_procesados + 1)
+            with metrics.stage("record_mapping"):
+                base_records = base_records_from_medicamento(
+                    nregistro=nregistro,
+                    med_payload=med_payload,
+                    updated_at=settings.version,
+                )
+            emitted = write_medicamento(
+                nregistro=nregistro,
+                digest=payload_hash(med_payload),
+                rank=registration_rank(nregistro, med_payload),
+                base_records=base_records,
+                nomenclator_map=nomenclator_map,
+                writer=writer,
+                sharded=sharded,
+                sinks=sinks,
+                dedupe=dedupe,
+                freshness=freshness,
+                record_store=record_store,
+                metrics=metrics,
+            )
+            stats = replace(stats, presentaciones_emitidas=stats.presentaciones_emitidas + emitted)
+    return stats, failed_ids
+
+
+def write_medicamento(
+    *,
+    nregistro: str,
+    digest: str,
+    rank: Rank,
+    base_records: list[dict[str, Any]],
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    writer: TextIO | None,
+    sharded: ShardedOutput | None,
+    sinks: Sequence[RecordSink],
+    dedupe: DuplicateResolver,
+    freshness: FreshnessStore,
+    record_store: RecordStore,
+    metrics: BuildMetrics,
+) -> int:
+    freshness.mark_fetched(nregistro, digest, iso_utc_now_z())
+    with metrics.stage("record_mapping"):
+        records = [
+            apply_nomenclator(base, nomenclator_map.get(base["cn"])) for base in base_records
+        ]
+    with metrics.stage("serialization"):
+        lines = [dumps_json_line(rec) for rec in records]
+    rows = list(map(published_row, records, lines))
+    keep, retracted = dedupe.resolve(rows, {nregistro: rank})
+    if not all(keep):
+        base_records = list(compress(base_records, keep))
+        records = list(compress(records, keep))
+        lines = list(compress(lines, keep))
+        rows = list(compress(rows, keep))
+    record_store.put_many(base_records)
+    if sharded is not None:
+        sharded.add_lines(records, lines)
+    elif writer is not None:
+        with metrics.stage("compression"):
+            writer.write("".join(lines))
+    for sink in sinks:
+        if retracted:
+            sink.retract(retracted)
+        sink.add(records)
+    record_store.put_published(rows, {nregistro: rank})
+    return len(records)
+
+
+def _write_full_with_pool(
+    *,
+    settings: Settings,
+    client: CimaClient,
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    main_file: Path,
+    metrics: BuildMetrics,
+    freshness: FreshnessStore,
+    record_store: RecordStore,
+    sharded: ShardedOutput | None,
+    sinks: Sequence[RecordSink],
+    dedupe: DuplicateResolver,
+) -> tuple[BuildStats, list[str]]:
+    stats = BuildStats()
+    failed_ids: list[str] = []
+
+    def _record_failure(nregistro: str) -> None:
+        nonlocal stats
+        stats = replace(stats, errores=stats.errores + 1)
+        freshness.mark_unfetched(nregistro)
+        if len(failed_ids) < settings.max_error_ids:
+            failed_ids.append(nregistro)
+
+    def _iter_raw() -> Iterator[RawMedicamento]:
+        for nregistro in _iter_nregistros(client, settings.limit_medicamentos):
+            try:
+                payload = client.get_medicamento_raw(nregistro)
+            except Exception as exc:
+                LOGGER.exception("Error al solicitar medicamento nregistro=%s: %s", nregistro, exc)
+                _record_failure(nregistro)
+                continue
+            yield RawMedicamento(nregistro=nregistro, payload=payload)
+
+    LOGGER.info("Transformación en paralelo con %s procesos", settings.transform_workers)
+    main_file.parent.mkdir(parents=True, exist_ok=True)
+    wrote_member = sharded is not None
+    with ExitStack() as stack:
+        handle = None if sharded else stack.enter_context(main_file.open("wb"))
+        for batch in transform_in_pool(
+            iter_batches(_iter_raw()),
+            workers=settings.transform_workers,
+            nomenclator_map=nomenclator_map,
+            updated_at=settings.version,
+            shards=sharded.shards if sharded else 0,
+        ):
+            for nregistro in batch.failed:
+                LOGGER.error("Respuesta JSON inválida para medicamento nregistro=%s", nregistro)
+                _record_failure(nregistro)
+            # Tiempos de CPU sumados entre procesos, no tiempo de reloj.
+            metrics.add_stage_time("record_mapping", batch.mapping_seconds)
+            metrics.add_stage_time("serialization", batch.serialization_seconds)
+            metrics.add_stage_time("compression", batch.compression_seconds)
+            freshness.mark_many_fetched(batch.hashes, iso_utc_now_z())
+            # Los miembros gzip del lote ya incluyen los duplicados perdedores: se escriben igual
+            # y la compactación final los retira.
+            ranks = dict(batch.ranks)
+            keep, retracted = dedupe.resolve(batch.published, ranks, losers_written=True)
+            record_store.put_serialized(compress(batch.base_records, keep))
+            published = list(compress(batch.published, keep))
+            record_store.put_published(published, ranks)
+            if sinks:
+                # Los registros llegan ya serializados desde el pool.
+                records = [json.loads(row[2]) for row in published]
+                for sink in sinks:
+                    if retracted:
+                        sink.retract(retracted)
+                    sink.add(records)
+            stats = replace(
+                stats,
+                medicamentos_procesados=stats.medicamentos_procesados + batch.medicamentos,
+                presentaciones_emitidas=stats.presentaciones_emitidas + batch.presentaciones,
+            )
+            if sharded is not None:
+                sharded.add_members(batch.shard_data, batch.shard_counts)
+            elif handle is not None and batch.data:
+                handle.write(batch.data)
+                wrote_member = True
+        if handle is not None and not wrote_member:
+            handle.write(gzip.compress(b"", mtime=0))
+    return stats, failed_ids
+
+
+def _iter_nregistros(client: CimaClient, limit: int | None = None) -> Iterator[str]:
+    emitted = 0
+    for med_item in client.iter_medicamentos():
+        nregistro = str(med_item.get("nregistro") or med_item.get("nRegistro") or "").strip()
+        if not nregistro:
+            continue
+        yield nregistro
+        emitted += 1
+        if limit is not None and emitted >= limit:
+            LOGGER.warning("Límite de %s medicamentos alcanzado; artefactos parciales.", limit)
+            return
+
+
+def _run_partial_build(settings: Settings, *, client: CimaClient, metrics: BuildMetrics) -> int:
+    # Un nodo de un FULL distribuido: solo descarga los nregistro de su partición y guarda los
+    # registros base con su posición en el listado; `merge` aplica el nomenclátor y publica.
+    partition = settings.partition
+    assert partition is not None
+    directory = settings.out_dir / PARTIALS_DIR
+    stats = BuildStats()
+    failed_ids: list[str] = []
+    LOGGER.info("FULL parcial %s", partition)
+
+    with open_gzip_jsonl_writer(partition.data_path(directory)) as writer:
+        for ordinal, nregistro in enumerate(_iter_nregistros(client, settings.limit_medicamentos)):
+            if not partition.owns(nregistro):
+                continue
+            try:
+                med_payload = client.get_medicamento(nregistro)
+            except Exception as exc:
+                LOGGER.exception("Error al solicitar medicamento nregistro=%s: %s", nregistro, exc)
+                stats = replace(stats, errores=stats.errores + 1)
+                # Sin tope: el merge los necesita todos para no podarlos del almacén de frescura.
+                failed_ids.append(nregistro)
+                continue
+
+            with metrics.stage("record_mapping"):
+                base_records = base_records_from_medicamento(
+                    nregistro=nregistro,
+                    med_payload=med_payload,
+                    updated_at=settings.version,
+                )
+            item = PartialItem(
+                ordinal=ordinal,
+                nregistro=nregistro,
+                payload_hash=payload_hash(med_payload),
+                base_records=base_records,
+                rank=registration_rank(nregistro, med_payload),
+            )
+            with metrics.stage("serialization"):
+                line = partial_line(item)
+            with metrics.stage("compression"):
+                writer.write(line)
+            stats = replace(
+                stats,
+                medicamentos_procesados=stats.medicamentos_procesados + 1,
+                presentaciones_emitidas=stats.presentaciones_emitidas + len(base_records),
+            )
+
+    PartialMeta(
+        version=settings.version,
+        partition=str(partition),
+        cima_base=settings.cima_base_url,
+        medicamentos_procesados=stats.medicamentos_procesados,
+        presentaciones_emitidas=stats.presentaciones_emitidas,
+        errores=stats.errores,
+        failed_nregistro=failed_ids,
+        metrics=metrics.summary(),
+    ).write(partition.meta_path(directory))
+    write_textfile(
+        settings.metrics_textfile(),
+        metrics,
+        {"mode": "full", "partition": str(partition)},
+    )
+    LOGGER.info(
+        "FULL parcial %s completado medicamentos=%s presentaciones=%s errores=%s",
+        partition,
+        stats.medicamentos_procesados,
+        stats.presentaciones_emitidas,
+        stats.errores,
+    )
+    return 0
+
+
+def _remove_unsharded_full(main_file: Path) -> None:
+    # Un full sin particionar de una ejecución anterior no debe quedar junto a los shards.
+    for path in (
+        main_file,
+        *(encoded_path(main_file, codec) for codec in CODEC_SUFFIXES if codec != "gzip"),
+        dictionary_path(main_file),
+    ):
+        if path.exists():
+            LOGGER.info("Eliminando full sin particionar anterior: %s", path.name)
+            path.unlink()
+
+
+def _compact_shards(
+    out_dir: Path,
+    shards: list[ShardInfo],
+    keep: Mapping[str, int],
+) -> list[ShardInfo]:
+    # Un CN cae siempre en el mismo shard: solo se reescriben los que tienen CN duplicados.
+    touched = {shard_of(cn, len(shards)) for cn in keep}
+    compacted: list[ShardInfo] = []
+    for shard in shards:
+        if shard.index in touched:
+            path = out_dir / shard.file
+            records = compact_jsonl(path, keep)
+            shard = replace(shard, sha256=sha256_file(path), size=file_size(path), records=records)
+        compacted.append(shard)
+    return compacted
+
+
+def _index_entry(kind: str, path: Path, records: int, metrics: BuildMetrics) -> dict[str, Any]:
+    with metrics.stage("hashing"):
+        sha = sha256_file(path)
+    size = file_size(path)
+    metrics.add_bytes_written(path.name, size)
+    return {"kind": kind, "file": path.name, "sha256": sha, "size": size, "records": records}
+
+
+def _add_counters(summary: dict[str, int], extra: Mapping[str, int]) -> dict[str, int]:
+    return {key: value + extra.get(key, 0) for key, value in summary.items()}
@@ -1,14 +1,37 @@
 from __future__ import annotations
 
 import logging
-from dataclasses import replace
+from collections.abc import Mapping
+from dataclasses import dataclass, replace
+from typing import Any, TextIO
 
+from .archive import open_archive
+from .artifact_codecs import encodings_entry, write_encodings
 from .build_full import run_full_build
-from .cima_client import CimaClient
+from .catchup import write_catchups
+from .change_feed import (
+    CHANGE_FEED_DIR,
+    FeedCheckpoint,
+    clear_change_feed,
+    fetch_change_feed,
+)
+from .cima_client import CimaChange, CimaClient
 from .config import Settings
-from .incremental import BuildStats, map_presentaciones_from_medicamento, record_from_cima
+from .freshness import FRESHNESS_FILE, FreshnessStore, payload_hash
+from .history import HISTORY_FILE, append_run, run_record_from_stats
+from .incremental import (
+    BuildStats,
+    apply_nomenclator,
+    base_records_from_medicamento,
+    map_presentaciones_from_medicamento,
+    presentacion_cn,
+)
 from .manifest import Manifest, write_manifest
-from .nomenclator_loader import load_nomenclator
+from .metrics import BuildMetrics, write_textfile
+from .nomenclator_loader import NomenclatorData, NomenclatorEntry, load_nomenclator
+from .patch import patch_from
+from .profiles import ProfileFanout
+from .record_store import RECORDS_FILE, RecordStore, published_row
 from .state import StateData, load_state, save_state
 from .utils import (
     dumps_json_line,
@@ -25,7 +48,30 @@ from .utils import (
 LOGGER = logging.getLogger(__name__)
 
 
+@dataclass(frozen=True)
+class WarmResources:
+    # Cliente y nomenclátor que el modo watch mantiene entre ejecuciones.
+    client: CimaClient
+    nomenclator: NomenclatorData | None
+
+
 def run_incremental_build(settings: Settings) -> int:
+    return run_delta_build(settings, rolling=False)
+
+
+def run_delta_build(
+    settings: Settings,
+    *,
+    rolling: bool,
+    warm: WarmResources | None = None,
+) -> int:
+    # rolling=True: además del registroCambios revalida un presupuesto de los registros más
+    # antiguos del almacén de frescura y solo publica los que cambian de hash.
+    # Con `warm` (modo watch) la ejecución es un micro-delta: el registroCambios del día se repite
+    # en cada sondeo, así que solo se publica lo que cambió de hash y no se publica nada si no hay
+    # cambios.
+    micro = warm is not None
+    label = "watch" if micro else "rolling" if rolling else "incremental"
     ensure_dir(settings.out_dir)
 
     prior_state = load_state(settings.state_path)
@@ -33,61 +79,113 @@ def run_incremental_build(settings: Settings) -> int:
         LOGGER.warning("state.json ausente o inválido. Se hará fallback a FULL.")
         return run_full_build(settings)
 
-    client = CimaClient(
-        base_url=settings.cima_base_url,
-        timeout=settings.http_timeout,
-        max_retries=settings.http_max_retries,
-    )
-    nomenclator_data = load_nomenclator(
-        url=settings.nomenclator_url,
-        path=settings.nomenclator_path,
-        out_dir=settings.out_dir,
-        timeout=settings.http_timeout,
-    )
+    metrics = BuildMetrics()
+    nomenclator_data: NomenclatorData | None
+    if warm is not None:
+        client = warm.client
+        client.bind_metrics(metrics)
+        nomenclator_data = warm.nomenclator
+    else:
+        client = CimaClient(
+            base_url=settings.cima_base_url,
+            timeout=settings.http_timeout,
+            max_retries=settings.http_max_retries,
+            metrics=metrics,
+            archive=open_archive(settings.archive_dir),
+            replay=open_archive(settings.replay_dir),
+        )
+        with metrics.stage("nomenclator_load"):
+            nomenclator_data = load_nomenclator(
+                url=settings.nomenclator_url,
+                path=settings.nomenclator_path,
+                out_dir=settings.out_dir,
+                timeout=settings.http_timeout,
+            )
     nomenclator_map = nomenclator_data.by_cn if nomenclator_data else {}
 
-    delta_file = settings.out_dir / f"vademecum_delta_{settings.version}.jsonl.gz"
+    patch = settings.delta_format == "patch"
+    delta_kind = "patch" if patch else "delta"
+    delta_file = settings.out_dir / f"vademecum_{delta_kind}_{settings.version}.jsonl.gz"
     deleted_file = settings.out_dir / f"deleted_{settings.version}.txt.gz"
     manifest_file = settings.out_dir / "manifest.json"
 
     stats = BuildStats()
     failed_ids: list[str] = []
 
-    changes = client.get_registro_cambios(prior_state.last_incremental_date)
-    LOGGER.info(
-        "registroCambios fecha=%s rows=%s",
-        prior_state.last_incremental_date,
-        len(changes),
+    since = prior_state.last_incremental_date
+    spool_dir = settings.store_path(CHANGE_FEED_DIR)
+
+    def save_checkpoint(checkpoint: FeedCheckpoint) -> None:
+        save_state(settings.state_path, replace(prior_state, change_feed=checkpoint.to_raw()))
+
+    changes = fetch_change_feed(
+        client,
+        since,
+        spool_dir=spool_dir,
+        workers=settings.change_feed_workers,
+        checkpoint=(
+            FeedCheckpoint.from_raw(prior_state.change_feed) if prior_state.change_feed else None
+        ),
+        on_checkpoint=save_checkpoint,
     )
+    LOGGER.info("registroCambios fecha=%s nregistros=%s", since, len(changes))
+    if settings.limit_medicamentos is not None and len(changes) > settings.limit_medicamentos:
+        LOGGER.warning(
+            "Límite de %s cambios aplicado; artefactos parciales.",
+            settings.limit_medicamentos,
+        )
+        changes = changes[: settings.limit_medicamentos]
 
     with (
+        FreshnessStore(settings.store_path(FRESHNESS_FILE)) as freshness,
+        RecordStore(settings.store_path(RECORDS_FILE)) as record_store,
         open_gzip_jsonl_writer(delta_file) as delta_writer,
         open_gzip_text_writer(deleted_file) as deleted_writer,
+        ProfileFanout(
+            settings.profiles,
+            settings.out_dir,
+            version=settings.version,
+            delta=True,
+            metrics=metrics,
+        ) as profiles,
     ):
-        for change in changes:
-            tipo = change.tipo_cambio.strip().lower()
-            nregistro = change.nregistro
+        work: list[tuple[str, CimaChange | None]] = [
+            (change.nregistro, change) for change in changes
+        ]
+        if rolling:
+            budget = settings.rolling_budget_for(freshness.count())
+            if settings.limit_medicamentos is not None:
+                budget = min(budget, max(settings.limit_medicamentos - len(work), 0))
+            stale = freshness.stalest(budget, exclude={change.nregistro for change in changes})
+            LOGGER.info("Revalidación rolling presupuesto=%s seleccionados=%s", budget, len(stale))
+            work.extend((nregistro, None) for nregistro in stale)
+            stats = replace(stats, revalidados=len(stale))
 
-            if "baja" in tipo:
+        emitted_cns: set[str] = set()
+        upserted_cns: list[str] = []
+        deleted_cns: list[str] = []
+        for nregistro, change in work:
+            if change is not None and "baja" in change.tipo_cambio.strip().lower():
+                if micro and freshness.is_deleted(nregistro):
+                    continue
+                freshness.mark_deleted(nregistro, iso_utc_now_z())
+                record_store.delete_nregistro(nregistro)
                 try:
                     med_payload = client.get_medicamento(nregistro)
                     presentaciones = map_presentaciones_from_medicamento(med_payload)
                     deleted_count = 0
                     for p in presentaciones:
-                        cn = normalize_cn(
-                            p.get("cn")
-                            or p.get("codigoNacional")
-                            or p.get("codigo_nacional")
-                            or p.get("codigo")
-                        )
+                        cn = presentacion_cn(p)
                         if not cn:
                             continue
                         deleted_writer.write(f"{cn}\n")
+                        deleted_cns.append(cn)
                         deleted_count += 1
                     if deleted_count == 0 and change.cn:
                         cn_fallback = normalize_cn(change.cn)
                         if cn_fallback:
                             deleted_writer.write(f"{cn_fallback}\n")
+                            deleted_cns.append(cn_fallback)
                             deleted_count = 1
                     stats = replace(
                         stats,
@@ -107,6 +205,7 @@ def run_incremental_build(settings: Settings) -> int:
                             cn_fallback,
                         )
                         deleted_writer.write(f"{cn_fallback}\n")
+                        deleted_cns.append(cn_fallback)
                         stats = replace(
                             stats,
                             presentaciones_eliminadas=stats.presentaciones_eliminadas + 1,
@@ -123,36 +222,103 @@ def run_incremental_build(settings: Settings) -> int:
             except Exception as exc:
                 LOGGER.exception("Error al solicitar medicamento nregistro=%s: %s", nregistro, exc)
                 stats = replace(stats, errores=stats.errores + 1)
+                if change is None:
+                    freshness.mark_attempted(nregistro, iso_utc_now_z())
                 if len(failed_ids) < settings.max_error_ids:
                     failed_ids.append(nregistro)
                 continue
 
             stats = replace(stats, medicamentos_procesados=stats.medicamentos_procesados + 1)
-            presentaciones = map_presentaciones_from_medicamento(med_payload)
-            for p in presentaciones:
-                cn_raw = (
-                    p.get("cn")
-                    or p.get("codigoNacional")
-                    or p.get("codigo_nacional")
-                    or p.get("codigo")
-                )
-                cn = normalize_cn(cn_raw)
-                nom_entry = nomenclator_map.get(cn) if cn else None
-
-                record = record_from_cima(
+            digest = payload_hash(med_payload)
+            previous_digest = freshness.content_hash(nregistro)
+            freshness.mark_fetched(nregistro, digest, iso_utc_now_z())
+            if (rolling or micro) and previous_digest == digest:
+                stats = replace(stats, sin_cambios=stats.sin_cambios + 1)
+                continue
+            with metrics.stage("record_mapping"):
+                base_records = base_records_from_medicamento(
                     nregistro=nregistro,
                     med_payload=med_payload,
-                    presentacion=p,
                     updated_at=settings.version,
-                    nomenclator=nom_entry,
                 )
-                if not record:
-                    continue
-                delta_writer.write(dumps_json_line(record))
-                stats = replace(stats, presentaciones_emitidas=stats.presentaciones_emitidas + 1)
+                records = [
+                    apply_nomenclator(base, nomenclator_map.get(base["cn"]))
+                    for base in base_records
+                ]
+            record_store.replace_nregistro(nregistro, base_records)
+            emitted_cns.update(record["cn"] for record in records)
+            written, unchanged = _publish(
+                records,
+                record_store=record_store,
+                delta_writer=delta_writer,
+                profiles=profiles,
+                patch=patch,
+                metrics=metrics,
+                upserted=upserted_cns,
+            )
+            stats = replace(
+                stats,
+                presentaciones_emitidas=stats.presentaciones_emitidas + written,
+                presentaciones_sin_cambios=stats.presentaciones_sin_cambios + unchanged,
+            )
+
+        if nomenclator_data is not None:
+            stats = _write_nomenclator_updates(
+                settings=settings,
+                record_store=record_store,
+                nomenclator_map=nomenclator_map,
+                skip_cns=emitted_cns,
+                delta_writer=delta_writer,
+                profiles=profiles,
+                patch=patch,
+                metrics=metrics,
+                stats=stats,
+                upserted=upserted_cns,
+            )
 
-    sha = sha256_file(delta_file)
+        profiles.delete(deleted_cns)
+        profile_entries = profiles.close()
+        nothing_new = micro and not upserted_cns and not deleted_cns
+        catchups: list[dict[str, Any]] = []
+        if not nothing_new:
+            record_store.record_chain(settings.version, upserted_cns, deleted_cns)
+            catchups = write_catchups(
+                settings=settings, record_store=record_store, metrics=metrics
+            )
+
+    if nothing_new:
+        # Nada que publicar: se descartan los ficheros vacíos y solo avanza la fecha del
+        # registroCambios; manifest y cadena de versiones siguen en el último micro-delta.
+        for name in [delta_file.name, deleted_file.name, *_profile_files(profile_entries)]:
+            (settings.out_dir / name).unlink(missing_ok=True)
+        save_state(
+            settings.state_path,
+            replace(
+                prior_state,
+                last_incremental_date=iso_to_ddmmyyyy(settings.version[:10]),
+                change_feed=None,
+            ),
+        )
+        clear_change_feed(spool_dir)
+        LOGGER.info(
+            "WATCH sin cambios version=%s meds=%s sin_cambios=%s",
+            settings.version,
+            stats.medicamentos_procesados,
+            stats.sin_cambios,
+        )
+        return 0
+
+    with metrics.stage("hashing"):
+        sha = sha256_file(delta_file)
     size = file_size(delta_file)
+    metrics.add_bytes_written(delta_file.name, size)
+    encodings = encodings_entry(
+        delta_file.name,
+        sha,
+        size,
+        write_encodings(delta_file, settings.output_codecs, metrics=metrics),
+    )
+    metrics.add_bytes_written(deleted_file.name, file_size(deleted_file))
 
     manifest = Manifest(
         version=settings.version,
@@ -163,6 +329,7 @@ def run_incremental_build(settings: Settings) -> int:
         size=size,
         generated_at=iso_utc_now_z(),
         base_version=prior_state.last_full_version,
+        previous_version=prior_state.last_success_version,
         source_versions={
             "cima_base": settings.cima_base_url,
             "nomenclator": nomenclator_data.source_ref if nomenclator_data else "none",
@@ -172,22 +339,39 @@ def run_incremental_build(settings: Settings) -> int:
             "presentaciones_emitidas": stats.presentaciones_emitidas,
             "presentaciones_eliminadas": stats.presentaciones_eliminadas,
             "errores": stats.errores,
+            "revalidados": stats.revalidados,
+            "sin_cambios": stats.sin_cambios,
+            "actualizadas_nomenclator": stats.actualizadas_nomenclator,
+            "presentaciones_sin_cambios": stats.presentaciones_sin_cambios,
+            **metrics.summary(),
         },
+        delta_format=settings.delta_format,
+        catchup=catchups,
+        profiles=profile_entries,
+        encodings=encodings,
     )
-    write_manifest(manifest_file, manifest)
 
     new_state = StateData(
         last_success_version=settings.version,
         last_full_version=prior_state.last_full_version,
-        last_incremental_date=iso_to_ddmmyyyy(settings.version),
+        last_incremental_date=iso_to_ddmmyyyy(settings.version[:10]),
         total_presentaciones_full=prior_state.total_presentaciones_full,
         stats_last_run=manifest.stats,
         failed_nregistro_last_run=failed_ids,
     )
-    save_state(settings.state_path, new_state)
+    with metrics.stage("state_write"):
+        write_manifest(manifest_file, manifest)
+        save_state(settings.state_path, new_state)
+    clear_change_feed(spool_dir)
+    write_textfile(settings.metrics_textfile(), metrics, {"mode": label})
+    append_run(
+        settings.store_path(HISTORY_FILE),
+        run_record_from_stats(label, settings.version, manifest.stats),
+    )
 
     LOGGER.info(
-        "INCREMENTAL completado version=%s meds=%s emitidos=%s eliminados=%s errores=%s",
+        "%s completado version=%s meds=%s emitidos=%s eliminados=%s errores=%s",
+        label.upper(),
         settings.version,
         stats.medicamentos_procesados,
         stats.presentaciones_emitidas,
@@ -195,3 +379,104 @@ def run_incremental_build(settings: Settings) -> int:
         stats.errores,
     )
     return 0
+
+
+def _profile_files(entries: list[dict[str, Any]]) -> list[str]:
+    files = [str(entry["file"]) for entry in entries]
+    files.extend(str(entry["deleted_file"]) for entry in entries if "deleted_file" in entry)
+    return files
+
+
+def _write_nomenclator_updates(
+    *,
+    settings: Settings,
+    record_store: RecordStore,
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    skip_cns: set[str],
+    delta_writer: TextIO,
+    profiles: ProfileFanout,
+    patch: bool,
+    metrics: BuildMetrics,
+    stats: BuildStats,
+    upserted: list[str],
+) -> BuildStats:
+    # Precio y financiación solo llegan por el nomenclátor: se emiten los CN cuya entrada cambió
+    # respecto al último snapshot, reconstruidos desde el almacén de registros sin llamar a CIMA.
+    with metrics.stage("nomenclator_diff"):
+        seeded = record_store.has_nomenclator_snapshot()
+        diff = record_store.diff_nomenclator(nomenclator_map)
+    if not seeded:
+        LOGGER.info("Sin snapshot previo del nomenclátor; se guarda sin emitir cambios.")
+        return stats
+
+    records: list[dict[str, Any]] = []
+    for base in record_store.iter_base_records(diff.cns):
+        if base["cn"] in skip_cns:
+            continue
+        base["updated_at"] = settings.version
+        with metrics.stage("record_mapping"):
+            records.append(apply_nomenclator(base, nomenclator_map.get(base["cn"])))
+
+    written, unchanged = _publish(
+        records,
+        record_store=record_store,
+        delta_writer=delta_writer,
+        profiles=profiles,
+        patch=patch,
+        metrics=metrics,
+        upserted=upserted,
+    )
+    LOGGER.info(
+        "Nomenclátor: cambios=%s retirados=%s presentaciones actualizadas=%s",
+        len(diff.changed),
+        len(diff.removed),
+        written,
+    )
+    return replace(
+        stats,
+        presentaciones_emitidas=stats.presentaciones_emitidas + written,
+        presentaciones_sin_cambios=stats.presentaciones_sin_cambios + unchanged,
+        actualizadas_nomenclator=stats.actualizadas_nomenclator + written,
+    )
+
+
+def _publish(
+    records: list[dict[str, Any]],
+    *,
+    record_store: RecordStore,
+    delta_writer: TextIO,
+    profiles: ProfileFanout,
+    patch: bool,
+    metrics: BuildMetrics,
+    upserted: list[str],
+) -> tuple[int, int]:
+    # Devuelve (líneas escritas, registros omitidos por no cambiar respecto a lo publicado) y
+    # añade a `upserted` los CN escritos.
+    with metrics.stage("serialization"):
+        lines = [dumps_json_line(record) for record in records]
+        rows = list(map(published_row, records, lines))
+        written_cns = [record["cn"] for record in records]
+        unchanged = 0
+        if patch:
+            written_cns = []
+            previous = record_store.published_for(record["cn"] for record in records)
+            patch_lines: list[str] = []
+            for record, row in zip(records, rows, strict=True):
+                prior = previous.get(record["cn"])
+                if prior is not None and prior[1] == row[3]:
+                    unchanged += 1
+                    continue
+                prior_record = prior[0] if prior is not None else None
+                patch_lines.append(dumps_json_line(patch_from(prior_record, record, row[3])))
+                written_cns.append(record["cn"])
+            lines = patch_lines
+    with metrics.stage("compression"):
+        delta_writer.write("".join(lines))
+    if patch:
+        written = set(written_cns)
+        profiles.add([record for record in records if record["cn"] in written])
+    else:
+        profiles.add(records)
+    record_store.put_published(rows)
+    upserted.extend(written_cns)
+    return len(lines), unchanged
@@ -0,0 +1,27 @@
+from __future__ import annotations
+
+import logging
+
+from .build_full import run_full_build
+from .build_incremental import run_delta_build
+from .config import Settings
+from .freshness import FRESHNESS_FILE, FreshnessStore
+from .state import load_state
+
+LOGGER = logging.getLogger(__name__)
+
+
+def run_rolling_build(settings: Settings) -> int:
+    prior_state = load_state(settings.state_path)
+    if prior_state is None or not prior_state.last_incremental_date:
+        LOGGER.warning("state.json ausente o inválido. Se hará fallback a FULL.")
+        return run_full_build(settings)
+
+    with FreshnessStore(settings.store_path(FRESHNESS_FILE)) as freshness:
+        known = freshness.count()
+    if known == 0:
+        # Sin almacén de frescura no hay nada que revalidar: el FULL lo siembra.
+        LOGGER.warning("Almacén de frescura vacío. Se hará fallback a FULL.")
+        return run_full_build(settings)
+
+    return run_delta_build(settings, rolling=True)
@@ -0,0 +1,86 @@
+from __future__ import annotations
+
+import logging
+from typing import Any
+
+from .config import Settings
+from .metrics import BuildMetrics
+from .patch import DELTA_FORMATS
+from .record_store import RecordStore
+from .utils import file_size, open_gzip_jsonl_writer, open_gzip_text_writer, sha256_file
+
+LOGGER = logging.getLogger(__name__)
+
+
+def write_catchups(
+    *,
+    settings: Settings,
+    record_store: RecordStore,
+    metrics: BuildMetrics,
+) -> list[dict[str, Any]]:
+    # Para cada versión anterior retenida se precalcula un único delta hasta la versión actual.
+    # La versión inmediatamente anterior no lo necesita: le basta el delta de esta ejecución.
+    older = [version for version in record_store.chain_versions() if version < settings.version]
+    retained = older[-settings.catchup_retention :] if settings.catchup_retention > 0 else []
+    if retained:
+        record_store.prune_chain(retained[0])
+
+    entries: list[dict[str, Any]] = []
+    for from_version in retained[:-1]:
+        entries.append(
+            _write_catchup(
+                settings=settings,
+                record_store=record_store,
+                metrics=metrics,
+                from_version=from_version,
+            )
+        )
+    if entries:
+        LOGGER.info(
+            "Deltas de puesta al día generados=%s desde versiones %s",
+            len(entries),
+            ", ".join(entry["from_version"] for entry in entries),
+        )
+    return entries
+
+
+def _write_catchup(
+    *,
+    settings: Settings,
+    record_store: RecordStore,
+    metrics: BuildMetrics,
+    from_version: str,
+) -> dict[str, Any]:
+    suffix = f"{from_version}_{settings.version}"
+    upserts_file = settings.out_dir / f"vademecum_catchup_{suffix}.jsonl.gz"
+    deleted_file = settings.out_dir / f"deleted_catchup_{suffix}.txt.gz"
+    upserts = deletes = 0
+    with (
+        metrics.stage("catchup"),
+        open_gzip_jsonl_writer(upserts_file) as upserts_writer,
+        open_gzip_text_writer(deleted_file) as deleted_writer,
+    ):
+        for cn, record in record_store.iter_squashed(from_version):
+            if record is None:
+                deleted_writer.write(f"{cn}\n")
+                deletes += 1
+            else:
+                upserts_writer.write(record + "\n")
+                upserts += 1
+
+    with metrics.stage("hashing"):
+        sha = sha256_file(upserts_file)
+    size = file_size(upserts_file)
+    metrics.add_bytes_written(upserts_file.name, size)
+    metrics.add_bytes_written(deleted_file.name, file_size(deleted_file))
+    # Registros completos aunque el delta normal sea `patch`: el cliente lo lee de la entrada.
+    return {
+        "from_version": from_version,
+        "delta_format": DELTA_FORMATS[0],
+        "file": upserts_file.name,
+        "deleted_file": deleted_file.name,
+        "sha256": sha,
+        "size": size,
+        "upserts": upserts,
+        "deletes": deletes,
+    }
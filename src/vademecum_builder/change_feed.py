@@ -0,0 +1,215 @@
+from __future__ import annotations
+
+import heapq
+import json
+import logging
+import math
+import shutil
+from collections.abc import Callable, Iterable, Iterator
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, Protocol
+
+from .cima_client import ChangePage, CimaChange
+
+LOGGER = logging.getLogger(__name__)
+
+CHANGE_FEED_DIR = "change_feed"
+MAX_FEED_RESTARTS = 3
+
+
+class ChangeFeedClient(Protocol):
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage: ...
+
+
+class ChangeFeedError(RuntimeError):
+    pass
+
+
+class _FeedChanged(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class FeedCheckpoint:
+    # Solo vale para el mismo `since` y el mismo totalFilas/tamaño de página: si el feed creció,
+    # las páginas ya no delimitan las mismas filas y se descargan de nuevo.
+    since: str
+    total: int
+    page_size: int
+    completed: tuple[int, ...]
+
+    def to_raw(self) -> dict[str, Any]:
+        return {**asdict(self), "completed": list(self.completed)}
+
+    @staticmethod
+    def from_raw(raw: dict[str, Any]) -> "FeedCheckpoint | None":
+        try:
+            return FeedCheckpoint(
+                since=str(raw["since"]),
+                total=int(raw["total"]),
+                page_size=int(raw["page_size"]),
+                completed=tuple(int(page) for page in raw["completed"]),
+            )
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+def fetch_change_feed(
+    client: ChangeFeedClient,
+    since: str,
+    *,
+    spool_dir: Path,
+    workers: int,
+    checkpoint: FeedCheckpoint | None,
+    on_checkpoint: Callable[[FeedCheckpoint], None],
+) -> list[CimaChange]:
+    # Si el feed crece durante la descarga las filas se desplazan entre páginas; se vuelve a
+    # empezar desde la primera página hasta MAX_FEED_RESTARTS veces.
+    for _ in range(MAX_FEED_RESTARTS + 1):
+        try:
+            pages = _fetch_pages(
+                client,
+                since,
+                spool_dir=spool_dir,
+                workers=workers,
+                checkpoint=checkpoint,
+                on_checkpoint=on_checkpoint,
+            )
+        except _FeedChanged as exc:
+            LOGGER.warning("registroCambios cambió durante la descarga (%s); se reinicia", exc)
+            checkpoint = None
+            continue
+        return latest_per_registration(_merge_pages(spool_dir, pages))
+    raise ChangeFeedError(
+        f"registroCambios cambió en {MAX_FEED_RESTARTS + 1} descargas seguidas; reintenta más tarde"
+    )
+
+
+def _fetch_pages(
+    client: ChangeFeedClient,
+    since: str,
+    *,
+    spool_dir: Path,
+    workers: int,
+    checkpoint: FeedCheckpoint | None,
+    on_checkpoint: Callable[[FeedCheckpoint], None],
+) -> int:
+    # La primera página da totalFilas; el resto se pide en paralelo y cada página terminada se
+    # vuelca a disco y se anota en el checkpoint. Si alguna falla (tras un segundo intento), la
+    # siguiente ejecución solo pide las que faltan.
+    first = client.get_registro_cambios_page(since)
+    page_size = first.page_size or len(first.changes)
+    pages = math.ceil(first.total / page_size) if first.total and page_size else 1
+
+    completed: set[int] = set()
+    if (
+        checkpoint is not None
+        and (checkpoint.since, checkpoint.total, checkpoint.page_size)
+        == (since, first.total, page_size)
+    ):
+        completed = {page for page in checkpoint.completed if _page_path(spool_dir, page).exists()}
+        if completed:
+            LOGGER.info("registroCambios: %s páginas recuperadas del checkpoint", len(completed))
+    else:
+        shutil.rmtree(spool_dir, ignore_errors=True)
+    spool_dir.mkdir(parents=True, exist_ok=True)
+
+    def done(page: int, result: ChangePage) -> None:
+        _spool(spool_dir, page, result.changes)
+        completed.add(page)
+        on_checkpoint(
+            FeedCheckpoint(
+                since=since,
+                total=first.total or 0,
+                page_size=page_size,
+                completed=tuple(sorted(completed)),
+            )
+        )
+
+    done(1, first)
+    pending = [page for page in range(2, pages + 1) if page not in completed]
+    if pending:
+        LOGGER.info(
+            "registroCambios fecha=%s páginas=%s pendientes=%s en paralelo=%s",
+            since,
+            pages,
+            len(pending),
+            workers,
+        )
+    for attempt in (1, 2):
+        failed: list[int] = []
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = {
+                pool.submit(client.get_registro_cambios_page, since, page): page
+                for page in pending
+            }
+            for future in as_completed(futures):
+                page = futures[future]
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    LOGGER.warning(
+                        "registroCambios página=%s intento=%s fallida: %s", page, attempt, exc
+                    )
+                    failed.append(page)
+                    continue
+                if result.total != first.total:
+                    for other in futures:
+                        other.cancel()
+                    raise _FeedChanged(
+                        f"página {page}: totalFilas={result.total}, página 1: {first.total}"
+                    )
+                done(page, result)
+        pending = sorted(failed)
+        if not pending:
+            break
+    if pending:
+        raise ChangeFeedError(
+            f"Páginas del registroCambios sin descargar: {', '.join(map(str, pending))}"
+        )
+    return pages
+
+
+def latest_per_registration(changes: Iterable[CimaChange]) -> list[CimaChange]:
+    # Tras un hueco largo un mismo nregistro aparece varias veces; basta con su último cambio
+    # (una baja posterior anula una modificación y al revés). Se conserva el orden temporal.
+    latest: dict[str, tuple[int, CimaChange]] = {}
+    for position, change in enumerate(changes):
+        latest[change.nregistro] = (position, change)
+    return [change for _, change in sorted(latest.values(), key=lambda item: item[0])]
+
+
+def clear_change_feed(spool_dir: Path) -> None:
+    shutil.rmtree(spool_dir, ignore_errors=True)
+
+
+def _merge_pages(spool_dir: Path, pages: int) -> Iterator[CimaChange]:
+    # Cada página está ordenada por fecha; la mezcla mantiene el orden de página a igual fecha
+    # (o sin fecha), así que sin fechas el resultado es el orden del propio feed.
+    streams = [_read_page(spool_dir, page) for page in range(1, pages + 1)]
+    yield from heapq.merge(*streams, key=_time_key)
+
+
+def _time_key(change: CimaChange) -> int:
+    return change.fecha if change.fecha is not None else 0
+
+
+def _spool(spool_dir: Path, page: int, changes: list[CimaChange]) -> None:
+    path = _page_path(spool_dir, page)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with tmp_path.open("w", encoding="utf-8") as handle:
+        for change in sorted(changes, key=_time_key):
+            handle.write(json.dumps(asdict(change), ensure_ascii=False) + "\n")
+    tmp_path.replace(path)
+
+
+def _read_page(spool_dir: Path, page: int) -> Iterator[CimaChange]:
+    with _page_path(spool_dir, page).open("r", encoding="utf-8") as handle:
+        for line in handle:
+            yield CimaChange(**json.loads(line))
+
+
+def _page_path(spool_dir: Path, page: int) -> Path:
+    return spool_dir / f"page-{page:05d}.jsonl"
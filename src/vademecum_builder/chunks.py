@@ -0,0 +1,261 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import hashlib
+import json
+import logging
+import sys
+import zlib
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Any, BinaryIO
+
+import requests
+
+from .record_store import published_row
+from .shards import SHARDED_LAYOUT
+from .utils import dumps_json_line, setup_logging, sha256_file
+
+LOGGER = logging.getLogger(__name__)
+
+CHUNK_MIN_BYTES = 16 * 1024
+CHUNK_MAX_BYTES = 1024 * 1024
+# Corte cuando los 8 bits bajos del hash rodante son cero: ≈ 1 de cada 256 registros pasado el
+# mínimo. El hash solo depende de los últimos 8 registros, así que tras un cambio los cortes
+# vuelven a coincidir con los de la versión anterior.
+_BOUNDARY_MASK = 0xFF
+_PRESERVE_BATCH = 1000
+
+
+@dataclass(frozen=True)
+class ChunkInfo:
+    sha256: str
+    offset: int
+    size: int
+    records: int
+
+    def to_raw(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class ChunkWriter:
+    # Escribe el JSONL como miembros gzip independientes con cortes definidos por el contenido:
+    # un registro igual produce el mismo miembro (mtime=0) y por tanto el mismo sha256.
+    def __init__(self, handle: BinaryIO) -> None:
+        self._handle = handle
+        self._buffer: list[bytes] = []
+        self._buffered = 0
+        self._rolling = 0
+        self._offset = 0
+        self.chunks: list[ChunkInfo] = []
+
+    def add(self, line: bytes) -> None:
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self._rolling = ((self._rolling << 1) + zlib.crc32(line)) & 0xFFFFFFFF
+        if self._buffered >= CHUNK_MAX_BYTES or (
+            self._buffered >= CHUNK_MIN_BYTES and not self._rolling & _BOUNDARY_MASK
+        ):
+            self._cut()
+
+    def close(self) -> list[ChunkInfo]:
+        if self._buffer or not self.chunks:
+            self._cut()
+        return self.chunks
+
+    def _cut(self) -> None:
+        member = gzip.compress(b"".join(self._buffer), mtime=0)
+        self._handle.write(member)
+        self.chunks.append(
+            ChunkInfo(
+                sha256=hashlib.sha256(member).hexdigest(),
+                offset=self._offset,
+                size=len(member),
+                records=len(self._buffer),
+            )
+        )
+        self._offset += len(member)
+        self._buffer = []
+        self._buffered = 0
+        self._rolling = 0
+
+
+PreviousLookup = Callable[[list[str]], Mapping[str, str]]
+
+
+def rechunk(
+    path: Path,
+    *,
+    previous_updated_at: PreviousLookup,
+    on_preserved: Callable[[list[tuple[str, str, str, str]]], None],
+) -> list[ChunkInfo]:
+    # Reescribe el full en chunks. Un registro cuyo contenido no cambió respecto al full anterior
+    # conserva su `updated_at`: si no, todas las líneas cambiarían en cada build y ningún chunk
+    # podría reutilizarse. `on_preserved` recibe las filas publicadas corregidas.
+    tmp_path = path.with_name(path.name + ".tmp")
+    with gzip.open(path, "rb") as source, tmp_path.open("wb") as handle:
+        writer = ChunkWriter(handle)
+        for batch in _batches(source):
+            records = [json.loads(line) for line in batch]
+            previous = previous_updated_at([str(record["cn"]) for record in records])
+            preserved: list[tuple[str, str, str, str]] = []
+            for index, record in enumerate(records):
+                updated_at = previous.get(str(record["cn"]))
+                if updated_at is not None and updated_at != record.get("updated_at"):
+                    record["updated_at"] = updated_at
+                    text = dumps_json_line(record)
+                    batch[index] = text.encode("utf-8")
+                    preserved.append(published_row(record, text))
+            if preserved:
+                on_preserved(preserved)
+            for line in batch:
+                writer.add(line)
+        chunks = writer.close()
+    tmp_path.replace(path)
+    return chunks
+
+
+def _batches(source: Iterable[bytes]) -> Iterator[list[bytes]]:
+    batch: list[bytes] = []
+    for line in source:
+        if not line.strip():
+            continue
+        batch.append(line)
+        if len(batch) >= _PRESERVE_BATCH:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@dataclass(frozen=True)
+class SyncResult:
+    version: str
+    file: str
+    chunks: int
+    reused_chunks: int
+    downloaded_bytes: int
+    reused_bytes: int
+
+
+class _Remote:
+    # Origen de los artefactos: URL base (peticiones Range) o directorio local.
+    def __init__(self, base: str, timeout: int) -> None:
+        self.base = base.rstrip("/")
+        self.timeout = timeout
+        self._http = base.startswith(("http://", "https://"))
+        self._session = requests.Session() if self._http else None
+
+    def read(self, name: str, offset: int | None = None, size: int | None = None) -> bytes:
+        if self._session is not None:
+            headers = {}
+            if offset is not None and size is not None:
+                headers["Range"] = f"bytes={offset}-{offset + size - 1}"
+            response = self._session.get(
+                f"{self.base}/{name}", headers=headers, timeout=self.timeout
+            )
+            response.raise_for_status()
+            if "Range" in headers and response.status_code != 206:
+                raise ValueError(f"El servidor no admite peticiones Range para {name}")
+            return response.content
+        with (Path(self.base) / name).open("rb") as handle:
+            if offset is None or size is None:
+                return handle.read()
+            handle.seek(offset)
+            return handle.read(size)
+
+
+def sync_full(dest: Path, source: str, *, timeout: int = 60) -> SyncResult:
+    # Actualiza en `dest` el full publicado en `source` reutilizando los chunks del full local
+    # anterior: solo se descargan los chunks con un sha256 que no esté ya en disco.
+    remote = _Remote(source, timeout)
+    manifest = json.loads(remote.read("manifest.json"))
+    if manifest.get("mode") != "full":
+        raise ValueError("sync solo admite manifests de un full")
+    if manifest.get("layout") == SHARDED_LAYOUT:
+        raise ValueError("sync no admite fulls particionados: descarga cada fichero de shards")
+    name = str(manifest["file"])
+    dest.mkdir(parents=True, exist_ok=True)
+    tmp_path = dest / (name + ".tmp")
+    downloaded = reused = reused_chunks = 0
+    chunks = [ChunkInfo(**raw) for raw in manifest.get("chunks") or []]
+    local_path, local = _local_chunks(dest)
+    with ExitStack() as stack:
+        out = stack.enter_context(tmp_path.open("wb"))
+        previous = stack.enter_context(local_path.open("rb")) if local_path else None
+        if not chunks:
+            data = remote.read(name)
+            downloaded += len(data)
+            out.write(data)
+        for chunk in chunks:
+            known = local.get(chunk.sha256)
+            if previous is not None and known is not None:
+                previous.seek(known.offset)
+                data = previous.read(known.size)
+                reused += len(data)
+                reused_chunks += 1
+            else:
+                data = remote.read(name, chunk.offset, chunk.size)
+                downloaded += len(data)
+            if hashlib.sha256(data).hexdigest() != chunk.sha256:
+                raise ValueError(f"sha256 inesperado en el chunk de offset {chunk.offset}")
+            out.write(data)
+
+    if sha256_file(tmp_path) != manifest["sha256"]:
+        tmp_path.unlink()
+        raise ValueError(f"sha256 inesperado en {name}")
+    tmp_path.replace(dest / name)
+    (dest / "manifest.json").write_text(
+        json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    return SyncResult(
+        version=str(manifest["version"]),
+        file=name,
+        chunks=len(chunks),
+        reused_chunks=reused_chunks,
+        downloaded_bytes=downloaded,
+        reused_bytes=reused,
+    )
+
+
+def _local_chunks(dest: Path) -> tuple[Path | None, dict[str, ChunkInfo]]:
+    # Full local descrito por su manifest y sus chunks indexados por sha256.
+    manifest_path = dest / "manifest.json"
+    if not manifest_path.exists():
+        return None, {}
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    path = dest / str(manifest.get("file") or "")
+    if manifest.get("mode") != "full" or not path.is_file():
+        return None, {}
+    chunks = (ChunkInfo(**raw) for raw in manifest.get("chunks") or [])
+    return path, {chunk.sha256: chunk for chunk in chunks}
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder sync",
+        description=(
+            "Descarga el full publicado reutilizando los chunks del full local anterior "
+            "(solo se piden por Range los chunks que faltan)."
+        ),
+    )
+    parser.add_argument("source", help="URL base o directorio con manifest.json y el full.")
+    parser.add_argument("--dest", default="./vademecum", help="Directorio local del full.")
+    parser.add_argument("--timeout", type=int, default=60)
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+    try:
+        result = sync_full(Path(args.dest), args.source, timeout=args.timeout)
+    except (ValueError, OSError, requests.RequestException) as exc:
+        LOGGER.error("No se pudo sincronizar: %s", exc)
+        return 1
+    sys.stdout.write(json.dumps(asdict(result), ensure_ascii=False, indent=2) + "\n")
+    return 0
@@ -1,15 +1,24 @@
 from __future__ import annotations
 
+import json
 import logging
+import time
 from collections.abc import Iterator
 from dataclasses import dataclass
-from typing import Any, cast
+from types import TracebackType
+from typing import Any, Self, cast
+from urllib.parse import urlsplit
 
 import requests
 from requests import Session
 from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import ConnectionPool
+from urllib3.response import BaseHTTPResponse
 from urllib3.util import Retry
 
+from .archive import ResponseArchive
+from .metrics import ENDPOINT_STAGES, BuildMetrics
+
 LOGGER = logging.getLogger(__name__)
 
 
@@ -18,13 +27,45 @@ class CimaChange:
     nregistro: str
     tipo_cambio: str
     cn: str | None = None
+    # Instante del cambio en ms desde epoch, si CIMA lo informa.
+    fecha: int | None = None
+
+
+@dataclass(frozen=True)
+class ChangePage:
+    changes: list[CimaChange]
+    total: int | None = None
+    page_size: int | None = None
 
 
 class CimaClient:
-    def __init__(self, base_url: str, timeout: int = 60, max_retries: int = 5) -> None:
+    def __init__(
+        self,
+        base_url: str,
+        timeout: int = 60,
+        max_retries: int = 5,
+        metrics: BuildMetrics | None = None,
+        archive: ResponseArchive | None = None,
+        replay: ResponseArchive | None = None,
+    ) -> None:
         self.base_url = base_url.rstrip("/")
         self.timeout = timeout
-        self.session = _build_session(max_retries=max_retries)
+        self.metrics = metrics
+        # archive guarda cada respuesta recibida; replay sirve todas desde un archivo, sin red.
+        self.archive = archive
+        self.replay = replay
+        if replay is not None:
+            LOGGER.info("Modo replay: respuestas de CIMA desde %s sin red", replay.directory)
+        self.session = _build_session(max_retries=max_retries, metrics=metrics)
+
+    def bind_metrics(self, metrics: BuildMetrics | None) -> None:
+        # Un cliente de larga vida (watch) conserva la sesión y su pool de conexiones entre
+        # ejecuciones, pero cada ejecución mide en sus propias métricas.
+        self.metrics = metrics
+        for adapter in self.session.adapters.values():
+            retry = getattr(adapter, "max_retries", None)
+            if isinstance(retry, _ObservedRetry):
+                retry.metrics = metrics
 
     def iter_medicamentos(self) -> Iterator[dict[str, Any]]:
         page = 1
@@ -41,41 +82,102 @@ class CimaClient:
                     yield item
             page += 1
 
+    def get_medicamentos_page_raw(self, page: int) -> bytes:
+        return self._get_bytes("/medicamentos", params={"pagina": page})
+
     def get_medicamento(self, nregistro: str) -> dict[str, Any]:
         data = self._get_json("/medicamento", params={"nregistro": nregistro})
         return data if isinstance(data, dict) else {}
 
-    def get_registro_cambios(self, fecha_ddmmyyyy: str) -> list[CimaChange]:
-        payload = self._get_json("/registroCambios", params={"fecha": fecha_ddmmyyyy})
-        rows = _extract_list(payload)
-        changes: list[CimaChange] = []
-        for row in rows:
-            if not isinstance(row, dict):
-                continue
-            nregistro = str(row.get("nregistro") or row.get("nRegistro") or "").strip()
-            tipo = str(row.get("tipoCambio") or row.get("tipo") or "").strip()
-            if nregistro and tipo:
-                cn = row.get("cn") or row.get("codigoNacional") or row.get("codigo_nacional")
-                cn_norm = str(cn).strip() if cn is not None else None
-                changes.append(CimaChange(nregistro=nregistro, tipo_cambio=tipo, cn=cn_norm))
-        return changes
+    def get_medicamento_raw(self, nregistro: str) -> bytes:
+        return self._get_bytes("/medicamento", params={"nregistro": nregistro})
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        return parse_change_page(self.get_registro_cambios_raw(fecha_ddmmyyyy, page))
+
+    def get_registro_cambios_raw(self, fecha_ddmmyyyy: str, page: int = 1) -> bytes:
+        # La primera página se pide sin `pagina`, igual que antes de paginar (archivos de replay).
+        params: dict[str, Any] = {"fecha": fecha_ddmmyyyy}
+        if page > 1:
+            params["pagina"] = page
+        return self._get_bytes("/registroCambios", params=params)
 
     def _get_json(
         self,
         path: str,
         params: dict[str, Any] | None = None,
     ) -> dict[str, Any] | list[Any]:
-        url = f"{self.base_url}{path}"
-        response = self.session.get(url, params=params, timeout=self.timeout)
-        response.raise_for_status()
-        payload = response.json()
+        payload = json.loads(self._get_bytes(path, params=params))
         if isinstance(payload, (dict, list)):
             return cast(dict[str, Any] | list[Any], payload)
         return {}
 
+    def _get_bytes(self, path: str, params: dict[str, Any] | None = None) -> bytes:
+        if self.replay is not None:
+            if self.metrics is None:
+                return self.replay.get(path, params)
+            with self.metrics.stage(ENDPOINT_STAGES.get(path, "other_fetch")):
+                return self.replay.get(path, params)
 
-def _build_session(max_retries: int) -> Session:
-    retry = Retry(
+        content = self._fetch(path, params)
+        if self.archive is not None:
+            self.archive.put(path, params, content)
+        return content
+
+    def _fetch(self, path: str, params: dict[str, Any] | None) -> bytes:
+        url = f"{self.base_url}{path}"
+        if self.metrics is None:
+            response = self.session.get(url, params=params, timeout=self.timeout)
+            response.raise_for_status()
+            return response.content
+
+        self.metrics.request_started()
+        started = time.perf_counter()
+        status = "error"
+        try:
+            with self.metrics.stage(ENDPOINT_STAGES.get(path, "other_fetch")):
+                response = self.session.get(url, params=params, timeout=self.timeout)
+                status = str(response.status_code)
+                response.raise_for_status()
+                return response.content
+        finally:
+            self.metrics.request_finished(path, status, time.perf_counter() - started)
+
+
+class _ObservedRetry(Retry):
+    metrics: BuildMetrics | None = None
+
+    def new(self, **kw: Any) -> Self:
+        retry = super().new(**kw)
+        retry.metrics = self.metrics
+        return retry
+
+    def increment(
+        self,
+        method: str | None = None,
+        url: str | None = None,
+        response: BaseHTTPResponse | None = None,
+        error: Exception | None = None,
+        _pool: ConnectionPool | None = None,
+        _stacktrace: TracebackType | None = None,
+    ) -> Self:
+        retry = super().increment(method, url, response, error, _pool, _stacktrace)
+        # Solo cuenta si hay reintento: con los intentos agotados increment lanza MaxRetryError.
+        if self.metrics is not None:
+            self.metrics.record_retry(
+                _endpoint_of(url or ""),
+                response.status if response is not None else None,
+            )
+        return retry
+
+
+def _endpoint_of(url: str) -> str:
+    path = urlsplit(url).path
+    return "/" + path.rstrip("/").rsplit("/", 1)[-1] if path else ""
+
+
+def _build_session(max_retries: int, metrics: BuildMetrics | None = None) -> Session:
+    retry = _ObservedRetry(
         total=max_retries,
         connect=max_retries,
         read=max_retries,
@@ -85,6 +187,7 @@ def _build_session(max_retries: int) -> Session:
         allowed_methods=("GET",),
         raise_on_status=False,
     )
+    retry.metrics = metrics
     adapter = HTTPAdapter(max_retries=retry)
     session = requests.Session()
     session.mount("http://", adapter)
@@ -93,6 +196,49 @@ def _build_session(max_retries: int) -> Session:
     return session
 
 
+def parse_change_page(raw: bytes) -> ChangePage:
+    payload = json.loads(raw)
+    rows = _extract_list(payload) if isinstance(payload, (dict, list)) else []
+    total = payload.get("totalFilas") if isinstance(payload, dict) else None
+    page_size = payload.get("tamanioPagina") if isinstance(payload, dict) else None
+    return ChangePage(
+        changes=_parse_changes(rows),
+        total=total if isinstance(total, int) else None,
+        page_size=page_size if isinstance(page_size, int) and page_size > 0 else None,
+    )
+
+
+def _parse_changes(rows: list[Any]) -> list[CimaChange]:
+    changes: list[CimaChange] = []
+    for row in rows:
+        if not isinstance(row, dict):
+            continue
+        nregistro = str(row.get("nregistro") or row.get("nRegistro") or "").strip()
+        tipo = str(row.get("tipoCambio") or row.get("tipo") or "").strip()
+        if nregistro and tipo:
+            cn = row.get("cn") or row.get("codigoNacional") or row.get("codigo_nacional")
+            cn_norm = str(cn).strip() if cn is not None else None
+            changes.append(
+                CimaChange(
+                    nregistro=nregistro,
+                    tipo_cambio=tipo,
+                    cn=cn_norm,
+                    fecha=_change_time(row.get("fecha")),
+                )
+            )
+    return changes
+
+
+def _change_time(value: Any) -> int | None:
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str) and value.strip().isdigit():
+        return int(value.strip())
+    return None
+
+
 def _extract_list(payload: dict[str, Any] | list[Any]) -> list[Any]:
     if isinstance(payload, list):
         return payload
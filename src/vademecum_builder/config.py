@@ -1,17 +1,27 @@
 from __future__ import annotations
 
+import math
 import os
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from enum import Enum
 from pathlib import Path
 
+from .archive import ARCHIVE_INDEX
+from .artifact_codecs import parse_codecs
+from .partials import Partition
+from .patch import DELTA_FORMATS
+from .profiles import OutputProfile, load_profiles
 from .utils import validate_iso_date
 
+# Subdirectorio de OUT_DIR donde escribe una ejecución con LIMIT_MEDICAMENTOS.
+LIMITED_DIR = "limited"
+
 
 class BuildMode(str, Enum):
     FULL = "full"
     INCREMENTAL = "incremental"
+    ROLLING = "rolling"
 
 
 @dataclass(frozen=True)
@@ -27,6 +37,24 @@ class Settings:
     max_error_ids: int
 
     cima_base_url: str = "https://cima.aemps.es/cima/rest"
+    transform_workers: int = 0
+    metrics_path: Path | None = None
+    limit_medicamentos: int | None = None
+    store_dir: Path | None = None
+    rolling_budget: int | None = None
+    rolling_cycle_runs: int = 4
+    delta_format: str = "records"
+    catchup_retention: int = 8
+    full_shards: int = 0
+    partition: Partition | None = None
+    archive_dir: Path | None = None
+    replay_dir: Path | None = None
+    profiles: tuple[OutputProfile, ...] = ()
+    search_index: bool = False
+    lookup_indexes: bool = False
+    output_codecs: tuple[str, ...] = ("gzip",)
+    full_chunks: bool = False
+    change_feed_workers: int = 4
 
     @staticmethod
     def from_sources(
@@ -34,9 +62,14 @@ class Settings:
         cli_version: str | None,
         cli_out_dir: str | None,
         cli_state_path: str | None,
+        cli_limit_medicamentos: int | None = None,
+        cli_shard: str | None = None,
+        cli_archive: str | None = None,
+        cli_replay: str | None = None,
+        allow_limit: bool = True,
     ) -> "Settings":
         mode_raw = (cli_mode or os.getenv("MODE") or BuildMode.FULL.value).strip().lower()
-        if mode_raw not in {BuildMode.FULL.value, BuildMode.INCREMENTAL.value}:
+        if mode_raw not in {mode.value for mode in BuildMode}:
             raise ValueError(f"MODE inválido: {mode_raw}")
         mode = BuildMode(mode_raw)
 
@@ -52,10 +85,45 @@ class Settings:
         timeout = int(os.getenv("HTTP_TIMEOUT") or "60")
         retries = int(os.getenv("HTTP_MAX_RETRIES") or "5")
         max_error_ids = int(os.getenv("MAX_ERROR_IDS") or "2000")
+        cima_base_url = os.getenv("CIMA_BASE_URL") or Settings.cima_base_url
+        transform_workers = _parse_workers(os.getenv("TRANSFORM_WORKERS") or "0")
+        metrics_raw = os.getenv("METRICS_TEXTFILE") or None
+        metrics_path = Path(metrics_raw).resolve() if metrics_raw else None
+        store_raw = os.getenv("STORE_DIR") or None
+        store_dir = Path(store_raw).resolve() if store_raw else None
+        limit_raw = cli_limit_medicamentos or os.getenv("LIMIT_MEDICAMENTOS") or None
+        # Los comandos que no descargan (merge) ignoran el límite y su desvío a LIMITED_DIR.
+        limit_medicamentos = int(limit_raw) if limit_raw and allow_limit else None
+        rolling_budget_raw = os.getenv("ROLLING_BUDGET") or None
+        rolling_budget = int(rolling_budget_raw) if rolling_budget_raw else None
+        rolling_cycle_runs = int(os.getenv("ROLLING_CYCLE_RUNS") or "4")
+        catchup_retention = int(os.getenv("CATCHUP_RETENTION") or "8")
+        full_shards = int(os.getenv("FULL_SHARDS") or "0")
+        shard_raw = cli_shard or os.getenv("BUILD_SHARD") or None
+        partition = Partition.parse(shard_raw) if shard_raw else None
+        archive_raw = cli_archive or os.getenv("ARCHIVE_DIR") or None
+        archive_dir = Path(archive_raw).resolve() if archive_raw else None
+        replay_raw = cli_replay or os.getenv("REPLAY_ARCHIVE") or None
+        replay_dir = Path(replay_raw).resolve() if replay_raw else None
+        search_index = _parse_flag(os.getenv("SEARCH_INDEX") or "0")
+        lookup_indexes = _parse_flag(os.getenv("LOOKUP_INDEXES") or "0")
+        full_chunks = _parse_flag(os.getenv("FULL_CHUNKS") or "0")
+        change_feed_workers = int(os.getenv("CHANGE_FEED_WORKERS") or "4")
+        output_codecs = parse_codecs(os.getenv("OUTPUT_CODECS") or "gzip")
+        profiles_raw = os.getenv("OUTPUT_PROFILES") or None
+        profiles = load_profiles(Path(profiles_raw)) if profiles_raw else ()
+        delta_format = (os.getenv("DELTA_FORMAT") or DELTA_FORMATS[0]).strip().lower()
 
         state_path = Path(
             cli_state_path or os.getenv("STATE_PATH") or out_dir / "state.json"
         ).resolve()
+        if limit_medicamentos is not None:
+            # Una muestra limitada escribe artefactos, manifest, state, almacenes, histórico y
+            # métricas aparte: nunca pisa la salida real ni la cadena de versiones publicada.
+            out_dir = out_dir / LIMITED_DIR
+            state_path = out_dir / "state.json"
+            store_dir = None
+            metrics_path = None
 
         if timeout <= 0:
             raise ValueError("HTTP_TIMEOUT debe ser > 0")
@@ -63,6 +131,30 @@ class Settings:
             raise ValueError("HTTP_MAX_RETRIES debe ser >= 0")
         if max_error_ids <= 0:
             raise ValueError("MAX_ERROR_IDS debe ser > 0")
+        if transform_workers < 0:
+            raise ValueError("TRANSFORM_WORKERS debe ser >= 0")
+        if limit_medicamentos is not None and limit_medicamentos <= 0:
+            raise ValueError("LIMIT_MEDICAMENTOS debe ser > 0")
+        if rolling_budget is not None and rolling_budget < 0:
+            raise ValueError("ROLLING_BUDGET debe ser >= 0")
+        if rolling_cycle_runs <= 0:
+            raise ValueError("ROLLING_CYCLE_RUNS debe ser > 0")
+        if partition is not None and mode is not BuildMode.FULL:
+            raise ValueError("--shard/BUILD_SHARD solo se admite en modo full")
+        if full_shards < 0:
+            raise ValueError("FULL_SHARDS debe ser >= 0")
+        if full_chunks and full_shards > 0:
+            raise ValueError("FULL_CHUNKS y FULL_SHARDS son incompatibles")
+        if change_feed_workers <= 0:
+            raise ValueError("CHANGE_FEED_WORKERS debe ser > 0")
+        if catchup_retention < 0:
+            raise ValueError("CATCHUP_RETENTION debe ser >= 0")
+        if delta_format not in DELTA_FORMATS:
+            raise ValueError(f"DELTA_FORMAT inválido: {delta_format}")
+        if archive_dir is not None and replay_dir is not None:
+            raise ValueError("ARCHIVE_DIR y REPLAY_ARCHIVE son incompatibles")
+        if replay_dir is not None and not (replay_dir / ARCHIVE_INDEX).exists():
+            raise ValueError(f"No hay archivo de respuestas en {replay_dir}")
 
         return Settings(
             mode=mode,
@@ -74,8 +166,58 @@ class Settings:
             http_max_retries=retries,
             state_path=state_path,
             max_error_ids=max_error_ids,
+            cima_base_url=cima_base_url,
+            transform_workers=transform_workers,
+            metrics_path=metrics_path,
+            limit_medicamentos=limit_medicamentos,
+            store_dir=store_dir,
+            rolling_budget=rolling_budget,
+            rolling_cycle_runs=rolling_cycle_runs,
+            delta_format=delta_format,
+            catchup_retention=catchup_retention,
+            full_shards=full_shards,
+            partition=partition,
+            archive_dir=archive_dir,
+            replay_dir=replay_dir,
+            profiles=profiles,
+            search_index=search_index,
+            lookup_indexes=lookup_indexes,
+            output_codecs=output_codecs,
+            full_chunks=full_chunks,
+            change_feed_workers=change_feed_workers,
         )
 
+    def metrics_textfile(self) -> Path:
+        return self.metrics_path or self.out_dir / "metrics" / "vademecum_builder.prom"
+
+    def store_path(self, name: str) -> Path:
+        return resolve_store_dir(self.out_dir, self.store_dir) / name
+
+    def rolling_budget_for(self, known_registrations: int) -> int:
+        if self.rolling_budget is not None:
+            return self.rolling_budget
+        # Reparte el catálogo conocido a partes iguales entre las ejecuciones del ciclo.
+        return math.ceil(known_registrations / self.rolling_cycle_runs)
+
+
+def resolve_store_dir(out_dir: Path, store_dir: Path | None = None) -> Path:
+    return store_dir or out_dir / "store"
+
+
+def _parse_workers(raw: str) -> int:
+    if raw.strip().lower() == "auto":
+        return os.cpu_count() or 1
+    return int(raw)
+
+
+def _parse_flag(raw: str) -> bool:
+    value = raw.strip().lower()
+    if value in {"1", "true", "si", "sí", "yes"}:
+        return True
+    if value in {"0", "false", "no", ""}:
+        return False
+    raise ValueError(f"Valor booleano inválido: {raw}")
+
 
 def _today_utc_iso() -> str:
     return datetime.now(timezone.utc).strftime("%Y-%m-%d")
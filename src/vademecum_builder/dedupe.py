@@ -0,0 +1,175 @@
+from __future__ import annotations
+
+import json
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .artifact_codecs import open_binary_writer, open_text_reader
+from .record_store import RecordStore
+
+# (autorizado, comercializado, fecha de autorización, longitud y texto del nregistro): gana la
+# tupla mayor, así que el nregistro desempata de forma determinista entre registros distintos.
+Rank = tuple[int, int, int, int, str]
+_BITMAP_DIGITS = 7
+
+
+def registration_rank(nregistro: str, med_payload: Mapping[str, Any]) -> Rank:
+    estado = med_payload.get("estado")
+    estado = estado if isinstance(estado, dict) else {}
+    autorizado = med_payload.get("autorizado")
+    if not isinstance(autorizado, bool):
+        autorizado = bool(estado.get("aut")) and not estado.get("rev") and not estado.get("susp")
+    try:
+        fecha_aut = int(estado.get("aut") or 0)
+    except (TypeError, ValueError):
+        fecha_aut = 0
+    comerc = int(bool(med_payload.get("comerc")))
+    return (int(autorizado), comerc, fecha_aut, len(nregistro), nregistro)
+
+
+def rank_from_raw(raw: Sequence[Any]) -> Rank:
+    return (int(raw[0]), int(raw[1]), int(raw[2]), int(raw[3]), str(raw[4]))
+
+
+class CnSet:
+    # Conjunto de CN empaquetado en un bitmap: los CN normalizados son dígitos de 6 o 7
+    # caracteres, así que int("1" + cn) cabe en 2·10^7 bits (2,5 MB) sin perder los ceros a la
+    # izquierda. Los CN más largos, excepcionales, van a un set.
+    def __init__(self) -> None:
+        self._bits = bytearray((2 * 10**_BITMAP_DIGITS) // 8)
+        self._overflow: set[str] = set()
+        self.size = 0
+
+    def add(self, cn: str) -> bool:
+        # True si el CN no estaba.
+        if len(cn) <= _BITMAP_DIGITS and cn.isdigit():
+            value = int("1" + cn)
+            byte, bit = divmod(value, 8)
+            if self._bits[byte] >> bit & 1:
+                return False
+            self._bits[byte] |= 1 << bit
+        else:
+            if cn in self._overflow:
+                return False
+            self._overflow.add(cn)
+        self.size += 1
+        return True
+
+
+@dataclass
+class _Winner:
+    occurrence: int
+    rank: Rank
+
+
+class DuplicateResolver:
+    # Detecta en streaming los CN repetidos (bajo nregistro distintos o dos veces en un mismo
+    # payload) y decide el ganador por `registration_rank`; a igual rango se queda el primero.
+    # Aparte del bitmap, solo los CN repetidos ocupan memoria: el registro vigente de un CN y su
+    # rango se recuperan del almacén de publicados al detectar el duplicado, así que el llamante
+    # debe guardar cada lote con `put_published(rows, ranks)`.
+    def __init__(self, record_store: RecordStore) -> None:
+        self.record_store = record_store
+        self.duplicates = 0
+        self.superseded = 0
+        self._seen = CnSet()
+        self._winners: dict[str, _Winner] = {}
+        self._written: dict[str, int] = {}
+
+    @property
+    def redundant_lines(self) -> int:
+        # Líneas ya escritas en el artefacto que la compactación final retira.
+        return sum(count - 1 for count in self._written.values())
+
+    def resolve(
+        self,
+        rows: Sequence[tuple[str, str, str, str]],
+        ranks: Mapping[str, Rank],
+        *,
+        losers_written: bool = False,
+    ) -> tuple[list[bool], list[dict[str, Any]]]:
+        # `rows` son filas publicadas (cn, nregistro, json, hash) en orden de escritura y `ranks`
+        # el rango de sus nregistro. Devuelve qué filas se publican y los registros vigentes que
+        # quedan desplazados. Con `losers_written` el llamante escribe todas las filas en el
+        # artefacto (pool de procesos) y la compactación retira después las perdedoras.
+        pending: dict[str, tuple[str, str, str, str]] = {}
+        keep: list[bool] = []
+        retracted: list[dict[str, Any]] = []
+        for row in rows:
+            cn, nregistro = row[0], row[1]
+            if self._seen.add(cn):
+                keep.append(True)
+                pending[cn] = row
+                continue
+
+            self.duplicates += 1
+            current, current_rank = self._current(cn, pending, ranks)
+            winner = self._winners.get(cn)
+            if winner is None:
+                winner = _Winner(0, current_rank)
+                self._winners[cn] = winner
+                self._written[cn] = 1
+            rank = ranks[nregistro]
+            wins = rank > winner.rank
+            occurrence = self._written[cn]
+            if wins or losers_written:
+                self._written[cn] += 1
+            keep.append(wins)
+            if wins:
+                retracted.append(current)
+                self._winners[cn] = _Winner(occurrence, rank)
+                self.superseded += 1
+                pending[cn] = row
+        return keep, retracted
+
+    def keep_occurrences(self) -> dict[str, int]:
+        # Para cada CN con líneas redundantes, la aparición (en orden de escritura) que queda.
+        return {
+            cn: winner.occurrence
+            for cn, winner in self._winners.items()
+            if self._written[cn] > 1
+        }
+
+    def _current(
+        self,
+        cn: str,
+        pending: Mapping[str, tuple[str, str, str, str]],
+        ranks: Mapping[str, Rank],
+    ) -> tuple[dict[str, Any], Rank]:
+        row = pending.get(cn)
+        if row is not None:
+            record: dict[str, Any] = json.loads(row[2])
+            return record, ranks[row[1]]
+        record, raw_rank = self.record_store.published_with_rank(cn)
+        if raw_rank is None:
+            # Fila publicada sin rango: cualquier registro con datos de estado la sustituye.
+            nregistro = str(record["nregistro"])
+            return record, (0, 0, 0, len(nregistro), nregistro)
+        return record, rank_from_raw(raw_rank)
+
+
+def compact_jsonl(path: Path, keep: Mapping[str, int], codec: str = "gzip") -> int:
+    # Reescribe un JSONL comprimido dejando, para cada CN de `keep`, solo su aparición `keep[cn]`
+    # (ninguna si no llega a haber tantas). Devuelve las líneas que quedan.
+    tmp_path = path.with_name(path.name + ".tmp")
+    seen: dict[str, int] = {}
+    kept = 0
+    with (
+        open_text_reader(path, codec) as source,
+        open_binary_writer(tmp_path, codec) as raw,
+    ):
+        for line in source:
+            if not line.strip():
+                continue
+            cn = str(json.loads(line)["cn"])
+            if cn in keep:
+                occurrence = seen.get(cn, 0)
+                seen[cn] = occurrence + 1
+                if keep[cn] != occurrence:
+                    continue
+            raw.write(line.encode("utf-8"))
+            kept += 1
+    tmp_path.replace(path)
+    return kept
@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+import heapq
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+DEFAULT_SPILL_ENTRIES = 500_000
+
+
+class SpillingSorter:
+    # Agrupa pares (clave, valor) en memoria acotada: se ordenan por tramos de `spill_entries`
+    # que se vuelcan a `directory` y se mezclan en streaming al leer. Los valores se comparan como
+    # texto, así que los numéricos deben llegar con ancho fijo.
+    def __init__(self, directory: Path, *, spill_entries: int = DEFAULT_SPILL_ENTRIES) -> None:
+        self.directory = directory
+        self._spill_entries = spill_entries
+        self._pending: list[tuple[str, str]] = []
+        self._runs: list[Path] = []
+
+    def extend(self, pairs: Iterable[tuple[str, str]]) -> None:
+        self._pending.extend(pairs)
+        if len(self._pending) >= self._spill_entries:
+            self._spill()
+
+    def groups(self) -> Iterator[tuple[str, list[str]]]:
+        # Claves en orden y, por clave, valores ordenados y sin repetir.
+        self._spill()
+        current: str | None = None
+        values: list[str] = []
+        for key, value in heapq.merge(*(_iter_run(run) for run in self._runs)):
+            if key != current:
+                if current is not None:
+                    yield current, values
+                current, values = key, []
+            if not values or values[-1] != value:
+                values.append(value)
+        if current is not None:
+            yield current, values
+
+    def _spill(self) -> None:
+        if not self._pending:
+            return
+        self._pending.sort()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        run = self.directory / f"run-{len(self._runs):05d}.txt"
+        with run.open("w", encoding="utf-8") as handle:
+            handle.writelines(f"{key}\t{value}\n" for key, value in self._pending)
+        self._runs.append(run)
+        self._pending = []
+
+
+def _iter_run(path: Path) -> Iterator[tuple[str, str]]:
+    with path.open("r", encoding="utf-8") as handle:
+        for line in handle:
+            key, value = line.rstrip("\n").split("\t")
+            yield key, value
@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from collections.abc import Iterable
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+FRESHNESS_FILE = "freshness.sqlite"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS registrations (
+    nregistro TEXT PRIMARY KEY,
+    last_fetch TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    deleted INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS registrations_staleness
+    ON registrations (deleted, last_fetch, nregistro);
+"""
+
+
+def payload_hash(payload: dict[str, Any]) -> str:
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class FreshnessStore:
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+        # Registros del listado cuya descarga falló en esta ejecución (solo viven en la conexión).
+        self._conn.execute("CREATE TEMP TABLE unfetched (nregistro TEXT PRIMARY KEY)")
+
+    def __enter__(self) -> "FreshnessStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self._conn.close()
+
+    def count(self) -> int:
+        row = self._conn.execute("SELECT COUNT(*) FROM registrations WHERE deleted = 0").fetchone()
+        return int(row[0])
+
+    def content_hash(self, nregistro: str) -> str | None:
+        row = self._conn.execute(
+            "SELECT content_hash FROM registrations WHERE nregistro = ? AND deleted = 0",
+            (nregistro,),
+        ).fetchone()
+        return str(row[0]) if row else None
+
+    def is_deleted(self, nregistro: str) -> bool:
+        row = self._conn.execute(
+            "SELECT 1 FROM registrations WHERE nregistro = ? AND deleted = 1",
+            (nregistro,),
+        ).fetchone()
+        return row is not None
+
+    def mark_fetched(self, nregistro: str, content_hash: str, fetched_at: str) -> None:
+        self.mark_many_fetched([(nregistro, content_hash)], fetched_at)
+
+    def mark_many_fetched(self, items: Iterable[tuple[str, str]], fetched_at: str) -> None:
+        self._conn.executemany(
+            """
+            INSERT INTO registrations (nregistro, last_fetch, content_hash, deleted)
+            VALUES (?, ?, ?, 0)
+            ON CONFLICT (nregistro) DO UPDATE SET
+                last_fetch = excluded.last_fetch,
+                content_hash = excluded.content_hash,
+                deleted = 0
+            """,
+            ((nregistro, fetched_at, content_hash) for nregistro, content_hash in items),
+        )
+
+    def mark_deleted(self, nregistro: str, fetched_at: str) -> None:
+        self._conn.execute(
+            """
+            INSERT INTO registrations (nregistro, last_fetch, content_hash, deleted)
+            VALUES (?, ?, '', 1)
+            ON CONFLICT (nregistro) DO UPDATE SET last_fetch = excluded.last_fetch, deleted = 1
+            """,
+            (nregistro, fetched_at),
+        )
+
+    def mark_attempted(self, nregistro: str, attempted_at: str) -> None:
+        # Revalidación rolling fallida: conserva el hash pero lo manda al final de la cola, para
+        # que un registro que siempre falla (p. ej. retirado sin `baja` en el registroCambios)
+        # no consuma el presupuesto de todas las ejecuciones.
+        self._conn.execute(
+            "UPDATE registrations SET last_fetch = ? WHERE nregistro = ? AND deleted = 0",
+            (attempted_at, nregistro),
+        )
+
+    def mark_unfetched(self, nregistro: str) -> None:
+        # Conserva su última descarga, así que el rolling lo revisita entre los primeros, pero
+        # `prune_not_seen_since` no lo borra.
+        self._conn.execute("INSERT OR IGNORE INTO unfetched (nregistro) VALUES (?)", (nregistro,))
+
+    def stalest(self, limit: int, exclude: set[str] | None = None) -> list[str]:
+        if limit <= 0:
+            return []
+        exclude = exclude or set()
+        rows = self._conn.execute(
+            """
+            SELECT nregistro FROM registrations
+            WHERE deleted = 0
+            ORDER BY last_fetch ASC, nregistro ASC
+            LIMIT ?
+            """,
+            (limit + len(exclude),),
+        )
+        selected = [str(row[0]) for row in rows if str(row[0]) not in exclude]
+        return selected[:limit]
+
+    def prune_not_seen_since(self, fetched_at: str) -> int:
+        cursor = self._conn.execute(
+            """
+            DELETE FROM registrations
+            WHERE last_fetch < ? AND nregistro NOT IN (SELECT nregistro FROM unfetched)
+            """,
+            (fetched_at,),
+        )
+        return cursor.rowcount
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import os
+import statistics
+import sys
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .config import resolve_store_dir
+from .utils import iso_utc_now_z, peak_rss_bytes, setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+HISTORY_FILE = "history.jsonl"
+THROUGHPUT_METRICS = ("records_per_second", "requests_per_second")
+
+
+@dataclass(frozen=True)
+class RunRecord:
+    finished_at: str
+    mode: str
+    version: str
+    wall_seconds: float
+    records: int
+    records_per_second: float
+    requests: int
+    requests_per_second: float
+    bytes_out: int
+    peak_rss_bytes: int
+    errores: int = 0
+    stage_ms: dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def from_raw(raw: dict[str, Any]) -> "RunRecord":
+        return RunRecord(
+            finished_at=str(raw.get("finished_at") or ""),
+            mode=str(raw.get("mode") or ""),
+            version=str(raw.get("version") or ""),
+            wall_seconds=float(raw.get("wall_seconds") or 0.0),
+            records=int(raw.get("records") or 0),
+            records_per_second=float(raw.get("records_per_second") or 0.0),
+            requests=int(raw.get("requests") or 0),
+            requests_per_second=float(raw.get("requests_per_second") or 0.0),
+            bytes_out=int(raw.get("bytes_out") or 0),
+            peak_rss_bytes=int(raw.get("peak_rss_bytes") or 0),
+            errores=int(raw.get("errores") or 0),
+            stage_ms=dict(raw.get("stage_ms") or {}),
+        )
+
+
+@dataclass(frozen=True)
+class Regression:
+    record: RunRecord
+    baseline: float
+    current: float
+
+    @property
+    def drop(self) -> float:
+        return 1 - self.current / self.baseline if self.baseline else 0.0
+
+
+def run_record_from_stats(mode: str, version: str, stats: dict[str, int]) -> RunRecord:
+    wall = stats.get("wall_ms", 0) / 1000
+    records = stats.get("presentaciones_emitidas", 0) + stats.get("presentaciones_eliminadas", 0)
+    requests = stats.get("http_requests", 0)
+    return RunRecord(
+        finished_at=iso_utc_now_z(),
+        mode=mode,
+        version=version,
+        wall_seconds=round(wall, 3),
+        records=records,
+        records_per_second=round(records / wall, 2) if wall else 0.0,
+        requests=requests,
+        requests_per_second=round(requests / wall, 2) if wall else 0.0,
+        bytes_out=stats.get("bytes_written", 0),
+        peak_rss_bytes=peak_rss_bytes(),
+        errores=stats.get("errores", 0),
+        stage_ms={
+            key.removeprefix("stage_ms_"): value
+            for key, value in stats.items()
+            if key.startswith("stage_ms_")
+        },
+    )
+
+
+def append_run(path: Path, record: RunRecord) -> None:
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with path.open("a", encoding="utf-8") as handle:
+            handle.write(json.dumps(asdict(record), ensure_ascii=False, sort_keys=True) + "\n")
+    except OSError as exc:
+        LOGGER.warning("No se pudo registrar la ejecución en el histórico %s: %s", path, exc)
+
+
+def load_history(path: Path) -> list[RunRecord]:
+    if not path.exists():
+        return []
+    records: list[RunRecord] = []
+    with path.open("r", encoding="utf-8") as handle:
+        for number, line in enumerate(handle, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError:
+                LOGGER.warning("Línea %s inválida en el histórico %s", number, path)
+                continue
+            if isinstance(raw, dict):
+                records.append(RunRecord.from_raw(raw))
+    return records
+
+
+def find_regressions(
+    records: list[RunRecord],
+    *,
+    window: int = 5,
+    threshold: float = 0.25,
+    metric: str = "records_per_second",
+) -> list[Regression]:
+    # La línea base es la mediana de las `window` ejecuciones previas del mismo modo.
+    regressions: list[Regression] = []
+    previous: dict[str, list[float]] = {}
+    for record in records:
+        current = float(getattr(record, metric))
+        history = previous.setdefault(record.mode, [])
+        if len(history) >= min(window, 3) and current > 0:
+            baseline = statistics.median(history[-window:])
+            if baseline > 0 and current < baseline * (1 - threshold):
+                regressions.append(Regression(record=record, baseline=baseline, current=current))
+        if current > 0:
+            history.append(current)
+    return regressions
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder history",
+        description="Muestra el histórico de ejecuciones y detecta caídas de rendimiento.",
+    )
+    parser.add_argument("--out-dir", default=None, help="Por defecto OUT_DIR o ./out.")
+    parser.add_argument(
+        "--store-dir",
+        default=None,
+        help="Por defecto STORE_DIR o <out-dir>/store.",
+    )
+    parser.add_argument("--mode", default=None, help="Filtra por modo (full, incremental...).")
+    parser.add_argument("--last", type=int, default=20, help="Ejecuciones a mostrar.")
+    parser.add_argument("--window", type=int, default=5, help="Tamaño de la línea base móvil.")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.25,
+        help="Caída relativa que se marca como regresión (0.25 = -25%%).",
+    )
+    parser.add_argument("--metric", choices=THROUGHPUT_METRICS, default=THROUGHPUT_METRICS[0])
+    parser.add_argument(
+        "--fail-on-regression",
+        action="store_true",
+        help="Termina con código 1 si la última ejecución está marcada.",
+    )
+    parser.add_argument("--json", action="store_true", help="Salida en JSON.")
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    out_dir = Path(args.out_dir or os.getenv("OUT_DIR") or "./out").resolve()
+    store_raw = args.store_dir or os.getenv("STORE_DIR")
+    store_dir = resolve_store_dir(out_dir, Path(store_raw).resolve() if store_raw else None)
+    records = load_history(store_dir / HISTORY_FILE)
+    if args.mode:
+        records = [record for record in records if record.mode == args.mode]
+
+    regressions = find_regressions(
+        records,
+        window=args.window,
+        threshold=args.threshold,
+        metric=args.metric,
+    )
+    flagged = {id(regression.record): regression for regression in regressions}
+    shown = records[-args.last :] if args.last > 0 else records
+
+    if args.json:
+        payload = [
+            {
+                **asdict(record),
+                "regression": (
+                    {
+                        "baseline": flagged[id(record)].baseline,
+                        "drop": round(flagged[id(record)].drop, 4),
+                    }
+                    if id(record) in flagged
+                    else None
+                ),
+            }
+            for record in shown
+        ]
+        sys.stdout.write(json.dumps(payload, ensure_ascii=False, indent=2) + "\n")
+    else:
+        sys.stdout.write(_format_table(shown, flagged, args.metric))
+
+    latest_flagged = bool(records) and id(records[-1]) in flagged
+    if latest_flagged:
+        regression = flagged[id(records[-1])]
+        LOGGER.warning(
+            "La última ejecución (%s %s) cae un %.0f%% respecto a la línea base (%.2f -> %.2f)",
+            regression.record.mode,
+            regression.record.version,
+            regression.drop * 100,
+            regression.baseline,
+            regression.current,
+        )
+    return 1 if args.fail_on_regression and latest_flagged else 0
+
+
+def _format_table(
+    records: list[RunRecord],
+    flagged: dict[int, Regression],
+    metric: str,
+) -> str:
+    header = (
+        f"{'finished_at':<20} {'mode':<12} {'version':<10} {'wall_s':>9} {'records':>9} "
+        f"{'rec/s':>9} {'req/s':>9} {'MiB_out':>8} {'RSS_MiB':>8}  slowest_stage"
+    )
+    lines = [header, "-" * len(header)]
+    for record in records:
+        slowest = max(record.stage_ms.items(), key=lambda item: item[1], default=("-", 0))
+        mark = ""
+        if id(record) in flagged:
+            mark = f"  << -{flagged[id(record)].drop * 100:.0f}% {metric}"
+        lines.append(
+            f"{record.finished_at:<20} {record.mode:<12} {record.version:<10} "
+            f"{record.wall_seconds:>9.1f} {record.records:>9} {record.records_per_second:>9.1f} "
+            f"{record.requests_per_second:>9.1f} {record.bytes_out / 2**20:>8.2f} "
+            f"{record.peak_rss_bytes / 2**20:>8.1f}  {slowest[0]}={slowest[1]}ms{mark}"
+        )
+    return "\n".join(lines) + "\n"
@@ -13,6 +13,10 @@ class BuildStats:
     presentaciones_emitidas: int = 0
     presentaciones_eliminadas: int = 0
     errores: int = 0
+    revalidados: int = 0
+    sin_cambios: int = 0
+    actualizadas_nomenclator: int = 0
+    presentaciones_sin_cambios: int = 0
 
 
 def map_presentaciones_from_medicamento(payload: dict[str, Any]) -> list[dict[str, Any]]:
@@ -23,6 +27,36 @@ def map_presentaciones_from_medicamento(payload: dict[str, Any]) -> list[dict[st
     return []
 
 
+def presentacion_cn(presentacion: dict[str, Any]) -> str | None:
+    return normalize_cn(
+        presentacion.get("cn")
+        or presentacion.get("codigoNacional")
+        or presentacion.get("codigo_nacional")
+        or presentacion.get("codigo")
+    )
+
+
+def base_records_from_medicamento(
+    *,
+    nregistro: str,
+    med_payload: dict[str, Any],
+    updated_at: str,
+) -> list[dict[str, Any]]:
+    # Registros solo con datos de CIMA: son los que se guardan en el almacén de registros para
+    # volver a aplicarles el nomenclátor sin consultar CIMA.
+    records: list[dict[str, Any]] = []
+    for presentacion in map_presentaciones_from_medicamento(med_payload):
+        rec = base_record_from_cima(
+            nregistro=nregistro,
+            med_payload=med_payload,
+            presentacion=presentacion,
+            updated_at=updated_at,
+        )
+        if rec:
+            records.append(rec)
+    return records
+
+
 def record_from_cima(
     *,
     nregistro: str,
@@ -31,12 +65,38 @@ def record_from_cima(
     updated_at: str,
     nomenclator: NomenclatorEntry | None,
 ) -> dict[str, Any] | None:
-    cn = normalize_cn(
-        presentacion.get("cn")
-        or presentacion.get("codigoNacional")
-        or presentacion.get("codigo_nacional")
-        or presentacion.get("codigo")
+    base = base_record_from_cima(
+        nregistro=nregistro,
+        med_payload=med_payload,
+        presentacion=presentacion,
+        updated_at=updated_at,
     )
+    return apply_nomenclator(base, nomenclator) if base else None
+
+
+def apply_nomenclator(
+    base: dict[str, Any],
+    nomenclator: NomenclatorEntry | None,
+) -> dict[str, Any]:
+    if nomenclator is None:
+        return base
+    return {
+        **base,
+        "lab": base["lab"] or nomenclator.laboratorio,
+        "via": base["via"] or nomenclator.via_administracion,
+        "financiado": nomenclator.financiado,
+        "precio": nomenclator.precio,
+    }
+
+
+def base_record_from_cima(
+    *,
+    nregistro: str,
+    med_payload: dict[str, Any],
+    presentacion: dict[str, Any],
+    updated_at: str,
+) -> dict[str, Any] | None:
+    cn = presentacion_cn(presentacion)
     if not cn:
         return None
 
@@ -57,16 +117,6 @@ def record_from_cima(
     ft = _to_str(med_payload.get("fichaTecnica") or med_payload.get("urlFichaTecnica"))
     pros = _to_str(med_payload.get("prospecto") or med_payload.get("urlProspecto"))
 
-    financiado = None
-    precio = None
-    if nomenclator:
-        financiado = nomenclator.financiado
-        precio = nomenclator.precio
-        if not via:
-            via = nomenclator.via_administracion
-        if not lab:
-            lab = nomenclator.laboratorio
-
     return {
         "cn": cn,
         "nregistro": str(nregistro),
@@ -79,8 +129,8 @@ def record_from_cima(
             "ft": ft,
             "pros": pros,
         },
-        "financiado": financiado,
-        "precio": precio,
+        "financiado": None,
+        "precio": None,
         "updated_at": updated_at,
         "source": "CIMA",
     }
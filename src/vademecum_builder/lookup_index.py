@@ -0,0 +1,255 @@
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import struct
+import sys
+import tempfile
+from array import array
+from collections.abc import Callable, Iterable, Sequence
+from contextlib import nullcontext
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+from .external_sort import DEFAULT_SPILL_ENTRIES, SpillingSorter
+from .metrics import BuildMetrics
+from .search_index import _little_endian, tokenize
+
+ATC_INDEX_FILE = "vademecum_atc.idx"
+LAB_INDEX_FILE = "vademecum_lab.idx"
+# Niveles de la jerarquía ATC: grupo anatómico, terapéutico, farmacológico, químico y sustancia.
+ATC_LEVELS = (1, 3, 4, 5, 7)
+LOOKUP_KINDS = ("atc", "lab")
+
+_MAGIC = b"VMLKUP01"
+# magic, tipo, nº de claves y offset absoluto de las secciones de claves y de CN.
+_HEADER = struct.Struct("<8s8sIQQ")
+
+
+def normalize_atc(code: str) -> str:
+    return "".join(ch for ch in code.upper() if ch.isalnum())
+
+
+def normalize_lab(name: str) -> str:
+    return " ".join(tokenize(name))
+
+
+def atc_keys(record: dict[str, Any]) -> set[str]:
+    # Cada código se indexa también bajo sus niveles superiores: N02BE01 cuenta en N, N02, N02B…
+    keys: set[str] = set()
+    for raw in record.get("atc") or []:
+        code = normalize_atc(str(raw))
+        keys.update(code[:level] for level in ATC_LEVELS if len(code) >= level)
+        if code:
+            keys.add(code)
+    return keys
+
+
+def lab_keys(record: dict[str, Any]) -> set[str]:
+    lab = normalize_lab(str(record.get("lab") or ""))
+    return {lab} if lab else set()
+
+
+_KEY_FUNCTIONS: dict[str, Callable[[dict[str, Any]], set[str]]] = {
+    "atc": atc_keys,
+    "lab": lab_keys,
+}
+_NORMALIZERS: dict[str, Callable[[str], str]] = {"atc": normalize_atc, "lab": normalize_lab}
+
+
+class LookupIndexBuilder:
+    # Índice secundario clave → lista ordenada de CN, construido en streaming con un
+    # SpillingSorter para no acumular todos los pares en memoria.
+    def __init__(
+        self,
+        kind: str,
+        path: Path,
+        *,
+        metrics: BuildMetrics | None = None,
+        spill_entries: int = DEFAULT_SPILL_ENTRIES,
+    ) -> None:
+        if kind not in LOOKUP_KINDS:
+            raise ValueError(f"Tipo de índice desconocido: {kind}")
+        self.kind = kind
+        self.path = path
+        self.metrics = metrics
+        self.records = 0
+        self._keys = _KEY_FUNCTIONS[kind]
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(prefix=f"{kind}-", dir=path.parent)
+        self._tmp_dir = Path(self._tmp.name)
+        self._sorter = SpillingSorter(self._tmp_dir, spill_entries=spill_entries)
+        # Claves de los registros desplazados por un CN duplicado y las del registro vigente.
+        self._stale: dict[str, set[str]] = {}
+        self._current: dict[str, set[str]] = {}
+
+    def __enter__(self) -> "LookupIndexBuilder":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._tmp.cleanup()
+
+    def add(self, records: Sequence[dict[str, Any]]) -> None:
+        with self.metrics.stage("indexing") if self.metrics else nullcontext():
+            for record in records:
+                cn = str(record["cn"])
+                keys = self._keys(record)
+                if cn in self._stale:
+                    self._current[cn] = keys
+                self._sorter.extend((key, cn) for key in keys)
+                self.records += 1
+
+    def retract(self, records: Sequence[dict[str, Any]]) -> None:
+        for record in records:
+            cn = str(record["cn"])
+            self._stale.setdefault(cn, set()).update(self._keys(record))
+            self._current.pop(cn, None)
+            self.records -= 1
+
+    def close(self) -> int:
+        key_offsets = array("Q", [0])
+        cn_offsets = array("Q", [0])
+        keys_blob = bytearray()
+        cns_path = self._tmp_dir / "cns.bin"
+        with cns_path.open("wb") as cns_out:
+            # Las claves (ATC y laboratorios) son pocas; las listas de CN van a disco.
+            for key, cns in self._sorter.groups():
+                if self._stale:
+                    cns = [cn for cn in cns if not self._is_stale(key, cn)]
+                    if not cns:
+                        continue
+                keys_blob += key.encode()
+                key_offsets.append(len(keys_blob))
+                encoded = "\n".join(cns).encode()
+                cns_out.write(encoded)
+                cn_offsets.append(cn_offsets[-1] + len(encoded))
+
+        keys_count = len(key_offsets) - 1
+        keys_at = _HEADER.size
+        cns_at = keys_at + key_offsets.itemsize * len(key_offsets) + len(keys_blob)
+        with self.path.open("wb") as out:
+            out.write(_HEADER.pack(_MAGIC, self.kind.encode(), keys_count, keys_at, cns_at))
+            out.write(_little_endian(key_offsets))
+            out.write(keys_blob)
+            out.write(_little_endian(cn_offsets))
+            with cns_path.open("rb") as handle:
+                for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+                    out.write(chunk)
+        self._tmp.cleanup()
+        return self.path.stat().st_size
+
+    def _is_stale(self, key: str, cn: str) -> bool:
+        return key in self._stale.get(cn, ()) and key not in self._current.get(cn, ())
+
+
+class LookupIndex:
+    # Lector mapeado en memoria: resuelve una clave por bisección sin tocar el artefacto full.
+    def __init__(self, path: Path) -> None:
+        self._handle = path.open("rb")
+        self._mm = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, kind, keys, keys_at, cns_at = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un índice secundario")
+        self.kind = bytes(kind).rstrip(b"\0").decode()
+        self.keys = int(keys)
+        self._keys_at = int(keys_at)
+        self._keys_blob = self._keys_at + 8 * (self.keys + 1)
+        self._cns_at = int(cns_at)
+        self._cns_blob = self._cns_at + 8 * (self.keys + 1)
+
+    def __enter__(self) -> "LookupIndex":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._handle.close()
+
+    def query(self, text: str) -> list[str]:
+        # Coincidencia exacta de la clave normalizada; si no existe, unión de las claves que
+        # empiezan por ella (p. ej. un prefijo ATC que no es un nivel, o un laboratorio abreviado).
+        key = _NORMALIZERS[self.kind](text).encode()
+        if not key:
+            return []
+        position = self._lower_bound(key)
+        if position < self.keys and self._key(position) == key:
+            return self._cns(position)
+        found: set[str] = set()
+        while position < self.keys and self._key(position).startswith(key):
+            found.update(self._cns(position))
+            position += 1
+        return sorted(found)
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self.keys
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def _key(self, index: int) -> bytes:
+        start, end = struct.unpack_from("<QQ", self._mm, self._keys_at + 8 * index)
+        return self._mm[self._keys_blob + start : self._keys_blob + end]
+
+    def _cns(self, index: int) -> list[str]:
+        start, end = struct.unpack_from("<QQ", self._mm, self._cns_at + 8 * index)
+        raw = self._mm[self._cns_blob + start : self._cns_blob + end].decode()
+        return raw.split("\n") if raw else []
+
+
+def lookup(out_dir: Path, *, atc: str | None = None, lab: str | None = None) -> list[str]:
+    # CN que cumplen todos los criterios dados.
+    criteria: Iterable[tuple[str, str]] = [
+        (file_name, text)
+        for file_name, text in ((ATC_INDEX_FILE, atc), (LAB_INDEX_FILE, lab))
+        if text is not None
+    ]
+    result: set[str] | None = None
+    for file_name, text in criteria:
+        with LookupIndex(out_dir / file_name) as index:
+            cns = set(index.query(text))
+        result = cns if result is None else result & cns
+    return sorted(result or ())
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder lookup",
+        description="Lista los CN por código ATC (o prefijo) y/o laboratorio usando los índices.",
+    )
+    parser.add_argument("--atc", default=None, help="Código o prefijo ATC, p. ej. N02B.")
+    parser.add_argument("--lab", default=None, help="Laboratorio (sin distinguir tildes).")
+    parser.add_argument(
+        "--out-dir",
+        default="./out",
+        help="Directorio con los índices. Por defecto: ./out",
+    )
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = _build_parser()
+    args = parser.parse_args(argv)
+    if args.atc is None and args.lab is None:
+        parser.error("indica --atc y/o --lab")
+    cns = lookup(Path(args.out_dir), atc=args.atc, lab=args.lab)
+    sys.stdout.write(json.dumps(cns, ensure_ascii=False) + "\n")
+    return 0
@@ -1,7 +1,7 @@
 from __future__ import annotations
 
 import json
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import Any
 
@@ -10,14 +10,25 @@ from typing import Any
 class Manifest:
     version: str
     mode: str
-    file: str
+    # En un full particionado `file`, `sha256` y `size` van a null y `layout` vale "sharded".
+    file: str | None
     deleted_file: str | None
-    sha256: str
-    size: int
+    sha256: str | None
+    size: int | None
     generated_at: str
     base_version: str | None
     source_versions: dict[str, str]
     stats: dict[str, int]
+    delta_format: str | None = None
+    layout: str | None = None
+    # Versión publicada justo antes de este delta: la única desde la que se puede aplicar.
+    previous_version: str | None = None
+    catchup: list[dict[str, Any]] = field(default_factory=list)
+    shards: list[dict[str, Any]] = field(default_factory=list)
+    profiles: list[dict[str, Any]] = field(default_factory=list)
+    indexes: list[dict[str, Any]] = field(default_factory=list)
+    encodings: list[dict[str, Any]] = field(default_factory=list)
+    chunks: list[dict[str, Any]] = field(default_factory=list)
 
     def to_raw(self) -> dict[str, Any]:
         payload: dict[str, Any] = {
@@ -33,6 +44,24 @@ class Manifest:
         }
         if self.deleted_file:
             payload["deleted_file"] = self.deleted_file
+        if self.delta_format:
+            payload["delta_format"] = self.delta_format
+        if self.layout:
+            payload["layout"] = self.layout
+        if self.previous_version:
+            payload["previous_version"] = self.previous_version
+        if self.catchup:
+            payload["catchup"] = self.catchup
+        if self.shards:
+            payload["shards"] = self.shards
+        if self.profiles:
+            payload["profiles"] = self.profiles
+        if self.indexes:
+            payload["indexes"] = self.indexes
+        if self.encodings:
+            payload["encodings"] = self.encodings
+        if self.chunks:
+            payload["chunks"] = self.chunks
         return payload
 
 
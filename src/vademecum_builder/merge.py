@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import argparse
+import heapq
+import logging
+from collections.abc import Mapping, Sequence
+from contextlib import ExitStack
+from dataclasses import replace
+from functools import partial
+from pathlib import Path
+
+from .build_full import RecordSink, complete_full_build, write_medicamento
+from .config import BuildMode, Settings
+from .dedupe import DuplicateResolver
+from .freshness import FreshnessStore
+from .incremental import BuildStats
+from .metrics import BuildMetrics
+from .nomenclator_loader import NomenclatorEntry, load_nomenclator
+from .partials import PARTIALS_DIR, PartialMeta, Partition, iter_partial
+from .record_store import RecordStore
+from .shards import ShardedOutput
+from .utils import open_gzip_jsonl_writer, setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+# Contadores de los nodos que se suman a las métricas del merge; el resto (wall_ms,
+# bytes_written) describe solo la ejecución del merge.
+_SUMMED_PREFIXES = ("stage_ms_", "http_")
+
+
+def load_partials(directory: Path) -> list[tuple[Partition, PartialMeta]]:
+    metas = sorted(directory.glob("partial-*-of-*.json"))
+    if not metas:
+        raise ValueError(f"No hay parciales en {directory}")
+    loaded = [PartialMeta.read(path) for path in metas]
+    partitions = [Partition.parse(meta.partition) for meta in loaded]
+
+    count = partitions[0].count
+    expected = {Partition(index=index, count=count) for index in range(1, count + 1)}
+    missing = sorted(str(item) for item in expected - set(partitions))
+    if missing or len(partitions) != count:
+        raise ValueError(f"Faltan parciales o sobran de otra partición: {', '.join(missing)}")
+    versions = {meta.version for meta in loaded}
+    if len(versions) != 1:
+        raise ValueError(f"Los parciales tienen versiones distintas: {', '.join(sorted(versions))}")
+    for partition in partitions:
+        if not partition.data_path(directory).exists():
+            raise ValueError(f"Falta el artefacto del parcial {partition}")
+    return sorted(zip(partitions, loaded, strict=True), key=lambda pair: pair[0].index)
+
+
+def run_merge(settings: Settings, partials_dir: Path) -> int:
+    partials = load_partials(partials_dir)
+    metrics = BuildMetrics()
+    with metrics.stage("nomenclator_load"):
+        nomenclator_data = load_nomenclator(
+            url=settings.nomenclator_url,
+            path=settings.nomenclator_path,
+            out_dir=settings.out_dir,
+            timeout=settings.http_timeout,
+        )
+
+    extra: dict[str, int] = {}
+    for _, meta in partials:
+        for key, value in meta.metrics.items():
+            if key.startswith(_SUMMED_PREFIXES):
+                extra[key] = extra.get(key, 0) + value
+
+    LOGGER.info("Merge de %s parciales version=%s", len(partials), settings.version)
+    return complete_full_build(
+        settings,
+        metrics=metrics,
+        nomenclator_data=nomenclator_data,
+        write=partial(
+            _write_merged,
+            settings=settings,
+            partials_dir=partials_dir,
+            partials=partials,
+        ),
+        extra_metrics=extra,
+    )
+
+
+def _write_merged(
+    *,
+    settings: Settings,
+    partials_dir: Path,
+    partials: list[tuple[Partition, PartialMeta]],
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    main_file: Path,
+    metrics: BuildMetrics,
+    freshness: FreshnessStore,
+    record_store: RecordStore,
+    sharded: ShardedOutput | None,
+    sinks: Sequence[RecordSink],
+    dedupe: DuplicateResolver,
+) -> tuple[BuildStats, list[str]]:
+    # Cada parcial está ordenado por posición en el listado: una mezcla k-way en streaming
+    # reproduce el orden de un FULL de un solo nodo.
+    medicamentos = presentaciones = 0
+    with ExitStack() as stack:
+        writer = None if sharded else stack.enter_context(open_gzip_jsonl_writer(main_file))
+        streams = [iter_partial(partition.data_path(partials_dir)) for partition, _ in partials]
+        for item in heapq.merge(*streams, key=lambda item: item.ordinal):
+            presentaciones += write_medicamento(
+                nregistro=item.nregistro,
+                digest=item.payload_hash,
+                rank=item.rank,
+                base_records=item.base_records,
+                nomenclator_map=nomenclator_map,
+                writer=writer,
+                sharded=sharded,
+                sinks=sinks,
+                dedupe=dedupe,
+                freshness=freshness,
+                record_store=record_store,
+                metrics=metrics,
+            )
+            medicamentos += 1
+
+    failed_ids = [nregistro for _, meta in partials for nregistro in meta.failed_nregistro]
+    for nregistro in failed_ids:
+        freshness.mark_unfetched(nregistro)
+    stats = BuildStats(
+        medicamentos_procesados=medicamentos,
+        presentaciones_emitidas=presentaciones,
+        errores=sum(meta.errores for _, meta in partials),
+    )
+    return stats, failed_ids[: settings.max_error_ids]
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder merge",
+        description=(
+            "Combina los parciales de un FULL distribuido (--shard i/N) en el artefacto full, "
+            "manifest.json y state.json canónicos."
+        ),
+    )
+    parser.add_argument(
+        "--partials-dir",
+        default=None,
+        help=f"Directorio con los parciales. Por defecto <out-dir>/{PARTIALS_DIR}.",
+    )
+    parser.add_argument("--out-dir", default=None, help="Por defecto OUT_DIR o ./out.")
+    parser.add_argument(
+        "--state-path",
+        default=None,
+        help="Ruta de state. Por defecto STATE_PATH o <out-dir>/state.json.",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        base = Settings.from_sources(
+            cli_mode=BuildMode.FULL.value,
+            cli_version=None,
+            cli_out_dir=args.out_dir,
+            cli_state_path=args.state_path,
+            allow_limit=False,
+        )
+        partials_dir = (
+            Path(args.partials_dir).resolve() if args.partials_dir else base.out_dir / PARTIALS_DIR
+        )
+        partials = load_partials(partials_dir)
+    except ValueError as exc:
+        LOGGER.error("No se puede hacer el merge: %s", exc)
+        return 2
+
+    # La versión sale de los parciales; el merge nunca se ejecuta como nodo.
+    settings = replace(base, version=partials[0][1].version, partition=None)
+    return run_merge(settings, partials_dir)
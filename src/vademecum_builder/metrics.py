@@ -0,0 +1,246 @@
+from __future__ import annotations
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from collections.abc import Iterator, Mapping
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Protocol
+
+STAGES = (
+    "listing_fetch",
+    "detail_fetch",
+    "change_feed_fetch",
+    "nomenclator_load",
+    "nomenclator_diff",
+    "record_mapping",
+    "serialization",
+    "compression",
+    "catchup",
+    "indexing",
+    "hashing",
+    "state_write",
+)
+ENDPOINT_STAGES = {
+    "/medicamentos": "listing_fetch",
+    "/medicamento": "detail_fetch",
+    "/registroCambios": "change_feed_fetch",
+}
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+_PREFIX = "vademecum"
+
+
+@dataclass
+class Histogram:
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=list)
+    total: float = 0.0
+    count: int = 0
+
+    def __post_init__(self) -> None:
+        if not self.counts:
+            self.counts = [0] * (len(self.buckets) + 1)
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+
+class StageObserver(Protocol):
+    def stage_entered(self, name: str) -> None: ...
+
+    def stage_exited(self, name: str) -> None: ...
+
+
+_stage_observers: list[StageObserver] = []
+
+
+def add_stage_observer(observer: StageObserver) -> None:
+    _stage_observers.append(observer)
+
+
+def remove_stage_observer(observer: StageObserver) -> None:
+    if observer in _stage_observers:
+        _stage_observers.remove(observer)
+
+
+class BuildMetrics:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.stage_seconds: dict[str, float] = defaultdict(float)
+        self.request_latency: dict[str, Histogram] = {}
+        self.requests: Counter[tuple[str, str]] = Counter()
+        self.retries: Counter[str] = Counter()
+        self.throttled: Counter[str] = Counter()
+        self.in_flight = 0
+        self.in_flight_max = 0
+        self.bytes_written: Counter[str] = Counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        observers = tuple(_stage_observers)
+        for observer in observers:
+            observer.stage_entered(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+            for observer in observers:
+                observer.stage_exited(name)
+
+    def add_stage_time(self, name: str, seconds: float) -> None:
+        with self._lock:
+            self.stage_seconds[name] += seconds
+
+    def request_started(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.in_flight_max = max(self.in_flight_max, self.in_flight)
+
+    def request_finished(self, endpoint: str, status: str, seconds: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[(endpoint, status)] += 1
+            histogram = self.request_latency.get(endpoint)
+            if histogram is None:
+                histogram = self.request_latency[endpoint] = Histogram()
+            histogram.observe(seconds)
+
+    def record_retry(self, endpoint: str, status: int | None) -> None:
+        with self._lock:
+            self.retries[endpoint] += 1
+            if status == 429:
+                self.throttled[endpoint] += 1
+
+    def add_bytes_written(self, artifact: str, size: int) -> None:
+        with self._lock:
+            self.bytes_written[artifact] += size
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def summary(self) -> dict[str, int]:
+        with self._lock:
+            summary = {
+                f"stage_ms_{stage}": int(round(self.stage_seconds.get(stage, 0.0) * 1000))
+                for stage in STAGES
+            }
+            summary["wall_ms"] = int(round(self.elapsed() * 1000))
+            summary["http_requests"] = sum(self.requests.values())
+            summary["http_retries"] = sum(self.retries.values())
+            summary["http_throttled"] = sum(self.throttled.values())
+            summary["bytes_written"] = sum(self.bytes_written.values())
+        return summary
+
+    def render_openmetrics(self, labels: Mapping[str, str]) -> str:
+        return self._render(labels, openmetrics=True)
+
+    def render_text(self, labels: Mapping[str, str]) -> str:
+        # Formato de texto clásico de Prometheus, el que entiende el textfile collector.
+        return self._render(labels, openmetrics=False)
+
+    def _render(self, labels: Mapping[str, str], *, openmetrics: bool) -> str:
+        base = _format_labels(labels)
+        lines: list[str] = []
+
+        def family(name: str, kind: str, help_text: str) -> None:
+            # En OpenMetrics la familia de un counter no lleva _total; en el formato clásico, sí.
+            if kind == "counter" and not openmetrics:
+                name = f"{name}_total"
+            lines.append(f"# HELP {_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {_PREFIX}_{name} {kind}")
+
+        def sample(name: str, value: float, extra: Mapping[str, str] | None = None) -> None:
+            merged = {**labels, **(extra or {})}
+            lines.append(f"{_PREFIX}_{name}{_format_labels(merged)} {_format_value(value)}")
+
+        with self._lock:
+            family("build_info", "gauge", "Build ejecutado.")
+            lines.append(f"{_PREFIX}_build_info{base} 1")
+            family("build_duration_seconds", "gauge", "Duración total del build.")
+            sample("build_duration_seconds", self.elapsed())
+            family("build_last_run_timestamp_seconds", "gauge", "Fin del último build.")
+            sample("build_last_run_timestamp_seconds", time.time())
+
+            family("stage_seconds", "counter", "Tiempo acumulado por etapa.")
+            for stage in STAGES:
+                sample("stage_seconds_total", self.stage_seconds.get(stage, 0.0), {"stage": stage})
+
+            family("http_requests", "counter", "Peticiones HTTP a CIMA completadas.")
+            for (endpoint, status), value in sorted(self.requests.items()):
+                sample("http_requests_total", value, {"endpoint": endpoint, "status": status})
+
+            family("http_retries", "counter", "Reintentos HTTP hacia CIMA.")
+            for endpoint, value in sorted(self.retries.items()):
+                sample("http_retries_total", value, {"endpoint": endpoint})
+
+            family("http_throttled", "counter", "Respuestas 429 recibidas de CIMA.")
+            for endpoint, value in sorted(self.throttled.items()):
+                sample("http_throttled_total", value, {"endpoint": endpoint})
+
+            family("http_in_flight_requests", "gauge", "Peticiones HTTP en curso.")
+            sample("http_in_flight_requests", self.in_flight)
+            family("http_in_flight_requests_max", "gauge", "Máximo de peticiones simultáneas.")
+            sample("http_in_flight_requests_max", self.in_flight_max)
+
+            family(
+                "http_request_duration_seconds",
+                "histogram",
+                "Latencia de peticiones HTTP por endpoint.",
+            )
+            for endpoint, histogram in sorted(self.request_latency.items()):
+                by_endpoint = {"endpoint": endpoint}
+                cumulative = 0
+                for bound, count in zip(histogram.buckets, histogram.counts, strict=False):
+                    cumulative += count
+                    sample(
+                        "http_request_duration_seconds_bucket",
+                        cumulative,
+                        {"endpoint": endpoint, "le": repr(float(bound))},
+                    )
+                sample(
+                    "http_request_duration_seconds_bucket",
+                    histogram.count,
+                    {"endpoint": endpoint, "le": "+Inf"},
+                )
+                sample("http_request_duration_seconds_sum", histogram.total, by_endpoint)
+                sample("http_request_duration_seconds_count", histogram.count, by_endpoint)
+
+            family("artifact_bytes", "gauge", "Bytes escritos por artefacto.")
+            for artifact, value in sorted(self.bytes_written.items()):
+                sample("artifact_bytes", value, {"artifact": artifact})
+
+        if openmetrics:
+            lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+
+def write_textfile(path: Path, metrics: BuildMetrics, labels: Mapping[str, str]) -> None:
+    # node-exporter lee el directorio en cualquier momento: se escribe y se renombra.
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    tmp.write_text(metrics.render_text(labels), encoding="utf-8")
+    tmp.replace(path)
+
+
+def _format_labels(labels: Mapping[str, str]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        escaped = value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{escaped}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
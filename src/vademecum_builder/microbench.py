@@ -0,0 +1,365 @@
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import itertools
+import json
+import logging
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable, Iterator
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from .incremental import _extract_atc, map_presentaciones_from_medicamento, record_from_cima
+from .nomenclator_loader import _detect_delimiter, _parse_table
+from .synthetic import SyntheticDataset
+from .utils import dumps_json_line, normalize_cn, open_gzip_jsonl_writer, setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+SCALES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DEFAULT_BASELINE = Path("benchmarks/microbench_baseline.json")
+# Se generan como mucho tantos payloads distintos y se reciclan para las escalas mayores.
+_MAX_DISTINCT = 20_000
+_ALLOC_SAMPLE = 500
+_ROWS_PER_PARSE_CALL = 1_000
+_DELIMITER_OPS_DIVISOR = 100
+
+
+@dataclass(frozen=True)
+class BenchResult:
+    name: str
+    ops: int
+    ns_per_op: float
+    alloc_bytes_per_op: float
+
+    def to_raw(self) -> dict[str, Any]:
+        return {
+            "ops": self.ops,
+            "ns_per_op": round(self.ns_per_op, 1),
+            "alloc_bytes_per_op": round(self.alloc_bytes_per_op, 1),
+        }
+
+
+@dataclass(frozen=True)
+class Regression:
+    scale: str
+    name: str
+    metric: str
+    baseline: float
+    current: float
+
+    def describe(self) -> str:
+        ratio = self.current / self.baseline if self.baseline else float("inf")
+        return (
+            f"{self.scale}/{self.name} {self.metric}: {self.baseline:.1f} -> {self.current:.1f} "
+            f"(x{ratio:.2f})"
+        )
+
+
+class _Payloads:
+    def __init__(self, scale: int, seed: int) -> None:
+        distinct = min(scale, _MAX_DISTINCT)
+        dataset = SyntheticDataset(size=max(distinct // 2, 1), seed=seed)
+        self.medicamentos: list[tuple[str, dict[str, Any]]] = []
+        self.pairs: list[tuple[str, dict[str, Any], dict[str, Any]]] = []
+        for index in range(dataset.size):
+            med = dataset.medicamento(index)
+            self.medicamentos.append((med["nregistro"], med))
+            for presentacion in map_presentaciones_from_medicamento(med):
+                self.pairs.append((med["nregistro"], med, presentacion))
+        self.raw_cns: list[object] = []
+        for i, (_, _, presentacion) in enumerate(self.pairs):
+            cn = str(presentacion["cn"])
+            variants: list[object] = [cn, f" {cn[:3]}.{cn[3:]} ", int(cn), f"CN{cn}"]
+            self.raw_cns.append(variants[i % len(variants)])
+        self.records = [
+            rec
+            for nregistro, med, presentacion in self.pairs
+            if (
+                rec := record_from_cima(
+                    nregistro=nregistro,
+                    med_payload=med,
+                    presentacion=presentacion,
+                    updated_at="2026-01-01",
+                    nomenclator=None,
+                )
+            )
+        ]
+        self.lines = [dumps_json_line(rec) for rec in self.records]
+        csv_text = dataset.nomenclator_csv()
+        table = list(csv.reader(io.StringIO(csv_text), delimiter=";"))
+        self.nomenclator_header = table[0]
+        self.nomenclator_rows = table[1:]
+        self.delimiter_samples = [
+            csv_text[offset : offset + 2048].replace(";", delimiter)
+            for offset, delimiter in zip(
+                range(0, max(len(csv_text) - 2048, 1), 4096),
+                itertools.cycle([";", ",", "\t", "|"]),
+                strict=False,
+            )
+        ]
+
+
+def run_suite(
+    scale: int,
+    *,
+    seed: int = 0,
+    repeat: int = 3,
+    only: set[str] | None = None,
+) -> list[BenchResult]:
+    payloads = _Payloads(scale, seed)
+    results: list[BenchResult] = []
+    with tempfile.TemporaryDirectory(prefix="vademecum-microbench-") as tmp:
+        for name, factory, ops in _benchmarks(payloads, scale, Path(tmp)):
+            if only and name not in only:
+                continue
+            result = _measure(name, factory, ops, repeat)
+            LOGGER.info(
+                "%s ops=%s ns/op=%.1f bytes/op=%.1f",
+                name,
+                result.ops,
+                result.ns_per_op,
+                result.alloc_bytes_per_op,
+            )
+            results.append(result)
+    return results
+
+
+def _benchmarks(
+    payloads: _Payloads,
+    scale: int,
+    tmp_dir: Path,
+) -> list[tuple[str, Callable[[int], Iterator[None]], int]]:
+    def normalize(ops: int) -> Iterator[None]:
+        for value in itertools.islice(itertools.cycle(payloads.raw_cns), ops):
+            normalize_cn(value)
+            yield None
+
+    def record(ops: int) -> Iterator[None]:
+        for nregistro, med, presentacion in itertools.islice(
+            itertools.cycle(payloads.pairs), ops
+        ):
+            record_from_cima(
+                nregistro=nregistro,
+                med_payload=med,
+                presentacion=presentacion,
+                updated_at="2026-01-01",
+                nomenclator=None,
+            )
+            yield None
+
+    def atc(ops: int) -> Iterator[None]:
+        for _, med in itertools.islice(itertools.cycle(payloads.medicamentos), ops):
+            _extract_atc(med)
+            yield None
+
+    def dumps(ops: int) -> Iterator[None]:
+        for rec in itertools.islice(itertools.cycle(payloads.records), ops):
+            dumps_json_line(rec)
+            yield None
+
+    def parse_table(ops: int) -> Iterator[None]:
+        rows = payloads.nomenclator_rows[:_ROWS_PER_PARSE_CALL]
+        for _ in range(ops):
+            _parse_table(payloads.nomenclator_header, rows)
+            yield None
+
+    def detect(ops: int) -> Iterator[None]:
+        for sample in itertools.islice(itertools.cycle(payloads.delimiter_samples), ops):
+            _detect_delimiter(sample)
+            yield None
+
+    def gzip_writer(ops: int) -> Iterator[None]:
+        with open_gzip_jsonl_writer(tmp_dir / "bench.jsonl.gz") as writer:
+            for line in itertools.islice(itertools.cycle(payloads.lines), ops):
+                writer.write(line)
+                yield None
+
+    rows_calls = max(scale // _ROWS_PER_PARSE_CALL, 1)
+    return [
+        ("normalize_cn", normalize, scale),
+        ("record_from_cima", record, scale),
+        ("_extract_atc", atc, scale),
+        ("dumps_json_line", dumps, scale),
+        ("_parse_table", parse_table, rows_calls),
+        ("_detect_delimiter", detect, max(scale // _DELIMITER_OPS_DIVISOR, 1)),
+        ("gzip_writer", gzip_writer, scale),
+    ]
+
+
+def _measure(
+    name: str,
+    factory: Callable[[int], Iterator[None]],
+    ops: int,
+    repeat: int,
+) -> BenchResult:
+    best = float("inf")
+    for _ in range(max(repeat, 1)):
+        started = time.perf_counter_ns()
+        for _ in factory(ops):
+            pass
+        best = min(best, time.perf_counter_ns() - started)
+
+    # La memoria se mide en una muestra aparte: tracemalloc distorsiona los tiempos.
+    sample = min(ops, _ALLOC_SAMPLE)
+    tracemalloc.start()
+    try:
+        total = 0
+        steps = factory(sample)
+        while True:
+            tracemalloc.reset_peak()
+            base = tracemalloc.get_traced_memory()[0]
+            if next(steps, StopIteration) is StopIteration:
+                break
+            total += tracemalloc.get_traced_memory()[1] - base
+    finally:
+        tracemalloc.stop()
+
+    return BenchResult(
+        name=name,
+        ops=ops,
+        ns_per_op=best / ops,
+        alloc_bytes_per_op=total / sample,
+    )
+
+
+def compare_results(
+    baseline: dict[str, Any],
+    current: dict[str, Any],
+    *,
+    tolerance: float,
+    alloc_tolerance: float,
+) -> list[Regression]:
+    regressions: list[Regression] = []
+    for scale, benches in current.get("scales", {}).items():
+        base_benches = baseline.get("scales", {}).get(scale, {})
+        for name, values in benches.items():
+            base = base_benches.get(name)
+            if not base:
+                continue
+            for metric, limit in (
+                ("ns_per_op", tolerance),
+                ("alloc_bytes_per_op", alloc_tolerance),
+            ):
+                before = float(base.get(metric) or 0.0)
+                after = float(values.get(metric) or 0.0)
+                if before > 0 and after > before * (1 + limit):
+                    regressions.append(
+                        Regression(
+                            scale=scale,
+                            name=name,
+                            metric=metric,
+                            baseline=before,
+                            current=after,
+                        )
+                    )
+    return regressions
+
+
+def missing_baselines(baseline: dict[str, Any], current: dict[str, Any]) -> list[str]:
+    # Sin línea base no hay umbral: se informa en lugar de dar la escala por buena.
+    missing: list[str] = []
+    for scale, benches in current.get("scales", {}).items():
+        base_benches = baseline.get("scales", {}).get(scale, {})
+        missing.extend(f"{scale}/{name}" for name in benches if not base_benches.get(name))
+    return missing
+
+
+def _parse_scale(raw: str) -> tuple[str, int]:
+    key = raw.strip().lower()
+    if key in SCALES:
+        return key, SCALES[key]
+    return key, int(key)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder microbench",
+        description="Micro-benchmarks de las funciones por registro con umbrales de regresión.",
+    )
+    parser.add_argument(
+        "--scale",
+        action="append",
+        default=None,
+        help="Escala (10k, 100k, 1m o un entero). Repetible. Por defecto: 10k.",
+    )
+    parser.add_argument("--only", action="append", default=None, help="Benchmark a ejecutar.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.15,
+        help="Regresión máxima tolerada en ns/op (0.15 = +15%%).",
+    )
+    parser.add_argument(
+        "--alloc-tolerance",
+        type=float,
+        default=0.10,
+        help="Regresión máxima tolerada en bytes asignados por op.",
+    )
+    parser.add_argument(
+        "--update-baseline",
+        action="store_true",
+        help="Guarda los resultados como nueva línea base en lugar de comparar.",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    scales = [_parse_scale(raw) for raw in (args.scale or ["10k"])]
+    only = set(args.only) if args.only else None
+    current: dict[str, Any] = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "scales": {},
+    }
+    for label, scale in scales:
+        LOGGER.info("Ejecutando micro-benchmarks escala=%s", label)
+        results = run_suite(scale, seed=args.seed, repeat=args.repeat, only=only)
+        current["scales"][label] = {result.name: result.to_raw() for result in results}
+
+    sys.stdout.write(json.dumps(current, indent=2) + "\n")
+
+    baseline_path = Path(args.baseline)
+    if args.update_baseline:
+        stored: dict[str, Any] = {"scales": {}}
+        if baseline_path.exists():
+            stored = json.loads(baseline_path.read_text(encoding="utf-8"))
+        stored.update({k: v for k, v in current.items() if k != "scales"})
+        for label, benches in current["scales"].items():
+            stored.setdefault("scales", {}).setdefault(label, {}).update(benches)
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        baseline_path.write_text(json.dumps(stored, indent=2) + "\n", encoding="utf-8")
+        LOGGER.info("Línea base actualizada en %s", baseline_path)
+        return 0
+
+    if not baseline_path.exists():
+        LOGGER.warning("No existe línea base en %s; no se comparan resultados.", baseline_path)
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions = compare_results(
+        baseline,
+        current,
+        tolerance=args.tolerance,
+        alloc_tolerance=args.alloc_tolerance,
+    )
+    missing = missing_baselines(baseline, current)
+    for regression in regressions:
+        LOGGER.error("Regresión: %s", regression.describe())
+    for name in missing:
+        LOGGER.error("Sin línea base para %s en %s; usa --update-baseline.", name, baseline_path)
+    return 1 if regressions or missing else 0
@@ -4,6 +4,7 @@ import csv
 import hashlib
 import io
 import logging
+from collections.abc import Iterable, Sequence
 from dataclasses import dataclass
 from pathlib import Path
 from typing import Any
@@ -85,62 +86,118 @@ def _load_csv_like(path: Path) -> dict[str, NomenclatorEntry]:
         has_header = True
 
     if has_header:
-        dict_reader = csv.DictReader(io.StringIO(content), delimiter=delimiter)
-        mapped = _parse_rows(dict_reader)
+        reader = csv.reader(io.StringIO(content), delimiter=delimiter)
+        header = next(reader, [])
+        mapped = _parse_table(header, reader)
         if mapped:
             return mapped
 
-    plain_reader = csv.reader(io.StringIO(content), delimiter=delimiter)
-    rows: list[dict[str, Any]] = []
-    for raw in plain_reader:
-        if not raw:
-            continue
-        rows.append({f"col_{idx}": value for idx, value in enumerate(raw)})
-    return _parse_rows(rows)
+    return _parse_table([], csv.reader(io.StringIO(content), delimiter=delimiter))
 
 
 def _load_excel(path: Path) -> dict[str, NomenclatorEntry]:
+    # Primera hoja, cabecera en la primera fila. Las filas se recorren en streaming y pasan por
+    # el mismo mapeo compilado que el CSV, sin materializar la hoja entera.
+    if path.suffix.lower() == ".xls":
+        return _load_xls(path)
+    try:
+        import openpyxl  # type: ignore
+    except ImportError as exc:
+        raise RuntimeError("openpyxl no instalado para soporte XLSX") from exc
+
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = next(rows, ())
+        return _parse_table(header, (_excel_row(row) for row in rows))
+    finally:
+        workbook.close()
+
+
+def _load_xls(path: Path) -> dict[str, NomenclatorEntry]:
     try:
-        import pandas as pd  # type: ignore
+        import xlrd  # type: ignore
     except ImportError as exc:
-        raise RuntimeError("pandas/openpyxl no instalados para soporte XLS/XLSX") from exc
+        raise RuntimeError("xlrd no instalado para soporte XLS") from exc
+
+    book = xlrd.open_workbook(str(path), on_demand=True)
+    try:
+        sheet = book.sheet_by_index(0)
+        if sheet.nrows == 0:
+            return {}
+        rows = (_excel_row(sheet.row_values(index)) for index in range(1, sheet.nrows))
+        return _parse_table(sheet.row_values(0), rows)
+    finally:
+        book.release_resources()
+
 
-    frame = pd.read_excel(path)
-    rows = frame.to_dict(orient="records")
-    return _parse_rows(rows)
+def _excel_row(row: Sequence[Any]) -> list[Any]:
+    # Excel guarda los números como float: un CN 123456 llega como 123456.0.
+    return [
+        int(value)
+        if isinstance(value, float) and not isinstance(value, bool) and value.is_integer()
+        else value
+        for value in row
+    ]
 
 
-def _parse_rows(rows: Any) -> dict[str, NomenclatorEntry]:
+_CN_KEYS = ("cn", "codigo_nacional", "c_n", "cod_nacional", "codigo nacional")
+_FINANCIADO_KEYS = ("financiado", "financiacion", "financia", "financiado_sns")
+_PRECIO_KEYS = ("precio", "pvp", "precio_iva", "importe")
+_VIA_KEYS = ("via", "via_administracion", "v_a", "administracion")
+_LAB_KEYS = ("laboratorio", "lab", "titular", "nombre_laboratorio")
+
+
+@dataclass(frozen=True)
+class _RowMapping:
+    # Posiciones de columna por campo, en orden de preferencia; se resuelven una vez por fichero
+    # a partir de la cabecera en lugar de construir y normalizar un dict por fila.
+    cn: tuple[int, ...]
+    financiado: tuple[int, ...]
+    precio: tuple[int, ...]
+    via: tuple[int, ...]
+    lab: tuple[int, ...]
+
+    @staticmethod
+    def compile(header: Sequence[Any]) -> "_RowMapping":
+        positions: dict[str, int] = {}
+        for index, name in enumerate(header):
+            positions[str(name).strip().lower()] = index
+
+        def columns(keys: tuple[str, ...]) -> tuple[int, ...]:
+            return tuple(positions[key] for key in keys if key in positions)
+
+        return _RowMapping(
+            cn=columns(_CN_KEYS),
+            financiado=columns(_FINANCIADO_KEYS),
+            precio=columns(_PRECIO_KEYS),
+            via=columns(_VIA_KEYS),
+            lab=columns(_LAB_KEYS),
+        )
+
+
+def _parse_table(
+    header: Sequence[Any],
+    rows: Iterable[Sequence[Any]],
+) -> dict[str, NomenclatorEntry]:
+    mapping = _RowMapping.compile(header)
     mapped: dict[str, NomenclatorEntry] = {}
     for row in rows:
-        if not isinstance(row, dict):
+        if not row:
             continue
 
-        lowered = {str(k).strip().lower(): v for k, v in row.items()}
-        cn = _coalesce(lowered, ["cn", "codigo_nacional", "c_n", "cod_nacional", "codigo nacional"])
+        cn = _coalesce(row, mapping.cn)
         if cn is None:
-            cn = _find_cn_in_values(lowered.values())
+            cn = _find_cn_in_values(row)
         cn_norm = normalize_cn(cn)
         if not cn_norm:
             continue
 
-        financiado = _parse_bool(
-            _coalesce(
-                lowered,
-                ["financiado", "financiacion", "financia", "financiado_sns"],
-            )
-        )
-        precio = _parse_float(_coalesce(lowered, ["precio", "pvp", "precio_iva", "importe"]))
-        via = _parse_str(_coalesce(lowered, ["via", "via_administracion", "v_a", "administracion"]))
-        lab = _parse_str(
-            _coalesce(lowered, ["laboratorio", "lab", "titular", "nombre_laboratorio"])
-        )
-
         mapped[cn_norm] = NomenclatorEntry(
-            financiado=financiado,
-            precio=precio,
-            via_administracion=via,
-            laboratorio=lab,
+            financiado=_parse_bool(_coalesce(row, mapping.financiado)),
+            precio=_parse_float(_coalesce(row, mapping.precio)),
+            via_administracion=_parse_str(_coalesce(row, mapping.via)),
+            laboratorio=_parse_str(_coalesce(row, mapping.lab)),
         )
     return mapped
 
@@ -179,10 +236,10 @@ def _sha256_file(path: Path) -> str:
     return h.hexdigest()
 
 
-def _coalesce(row: dict[str, Any], keys: list[str]) -> Any:
-    for key in keys:
-        if key in row and row[key] not in (None, ""):
-            return row[key]
+def _coalesce(row: Sequence[Any], columns: tuple[int, ...]) -> Any:
+    for column in columns:
+        if column < len(row) and row[column] not in (None, ""):
+            return row[column]
     return None
 
 
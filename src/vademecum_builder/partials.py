@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import gzip
+import json
+import zlib
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any
+
+from .dedupe import Rank, rank_from_raw
+from .utils import dumps_json_line
+
+PARTIALS_DIR = "partials"
+
+
+@dataclass(frozen=True)
+class Partition:
+    index: int
+    count: int
+
+    @staticmethod
+    def parse(raw: str) -> "Partition":
+        # Formato i/N con i en 1..N, como en una matriz de CI.
+        try:
+            index_raw, count_raw = raw.strip().split("/")
+            index, count = int(index_raw), int(count_raw)
+        except ValueError as exc:
+            raise ValueError(f"Partición inválida (se espera i/N): {raw}") from exc
+        if count <= 0 or not 1 <= index <= count:
+            raise ValueError(f"Partición inválida (se espera 1 <= i <= N): {raw}")
+        return Partition(index=index, count=count)
+
+    def __str__(self) -> str:
+        return f"{self.index}/{self.count}"
+
+    def owns(self, nregistro: str) -> bool:
+        # Reparto por hash del nregistro y no por posición en el listado: es estable aunque
+        # los nodos vean el listado en momentos distintos.
+        return zlib.crc32(nregistro.encode("utf-8")) % self.count == self.index - 1
+
+    @property
+    def stem(self) -> str:
+        return f"partial-{self.index:03d}-of-{self.count:03d}"
+
+    def data_path(self, directory: Path) -> Path:
+        return directory / f"{self.stem}.jsonl.gz"
+
+    def meta_path(self, directory: Path) -> Path:
+        return directory / f"{self.stem}.json"
+
+
+@dataclass(frozen=True)
+class PartialMeta:
+    version: str
+    partition: str
+    cima_base: str
+    medicamentos_procesados: int
+    presentaciones_emitidas: int
+    errores: int
+    failed_nregistro: list[str] = field(default_factory=list)
+    metrics: dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def read(path: Path) -> "PartialMeta":
+        raw = json.loads(path.read_text(encoding="utf-8"))
+        return PartialMeta(
+            version=str(raw["version"]),
+            partition=str(raw["partition"]),
+            cima_base=str(raw.get("cima_base") or ""),
+            medicamentos_procesados=int(raw.get("medicamentos_procesados") or 0),
+            presentaciones_emitidas=int(raw.get("presentaciones_emitidas") or 0),
+            errores=int(raw.get("errores") or 0),
+            failed_nregistro=[str(item) for item in raw.get("failed_nregistro") or []],
+            metrics={str(k): int(v) for k, v in (raw.get("metrics") or {}).items()},
+        )
+
+    def write(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(asdict(self), ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+@dataclass(frozen=True)
+class PartialItem:
+    ordinal: int
+    nregistro: str
+    payload_hash: str
+    base_records: list[dict[str, Any]]
+    rank: Rank
+
+
+def partial_line(item: PartialItem) -> str:
+    return dumps_json_line(
+        {
+            "o": item.ordinal,
+            "n": item.nregistro,
+            "h": item.payload_hash,
+            "b": item.base_records,
+            "r": item.rank,
+        }
+    )
+
+
+def iter_partial(path: Path) -> Iterator[PartialItem]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        for line in handle:
+            if not line.strip():
+                continue
+            raw = json.loads(line)
+            yield PartialItem(
+                ordinal=int(raw["o"]),
+                nregistro=str(raw["n"]),
+                payload_hash=str(raw["h"]),
+                base_records=list(raw["b"]),
+                rank=rank_from_raw(raw["r"]),
+            )
@@ -0,0 +1,31 @@
+from __future__ import annotations
+
+import hashlib
+import json
+from typing import Any
+
+DELTA_FORMATS = ("records", "patch")
+HASH_FIELD = "hash"
+# Campos que cambian en cada publicación sin que cambie el contenido.
+_VOLATILE_FIELDS = frozenset({"updated_at"})
+
+
+def record_hash(record: dict[str, Any]) -> str:
+    content = {key: value for key, value in record.items() if key not in _VOLATILE_FIELDS}
+    canonical = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+
+def patch_from(
+    previous: dict[str, Any] | None,
+    record: dict[str, Any],
+    digest: str,
+) -> dict[str, Any]:
+    # Sin registro publicado previo el parche lleva todos los campos (equivale a un upsert).
+    patch: dict[str, Any] = {"cn": record["cn"], HASH_FIELD: digest}
+    for key, value in record.items():
+        if key == "cn":
+            continue
+        if previous is None or key in _VOLATILE_FIELDS or previous.get(key) != value:
+            patch[key] = value
+    return patch
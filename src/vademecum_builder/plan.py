@@ -0,0 +1,396 @@
+from __future__ import annotations
+
+import argparse
+import gzip
+import json
+import logging
+import math
+import statistics
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass, field, replace
+from functools import partial
+from typing import Any
+
+from .archive import open_archive
+from .cima_client import CimaClient, parse_change_page
+from .config import BuildMode, Settings
+from .dedupe import CnSet
+from .freshness import FRESHNESS_FILE, FreshnessStore, payload_hash
+from .incremental import base_records_from_medicamento
+from .state import load_state
+from .transform import TRANSFORM_BATCH_SIZE
+from .utils import dumps_json_line, peak_rss_bytes, setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_SAMPLE_PAGES = 2
+DEFAULT_SAMPLE_DETAILS = 20
+
+
+@dataclass
+class _EndpointSample:
+    seconds: list[float] = field(default_factory=list)
+    sizes: list[int] = field(default_factory=list)
+
+    def timed(self, fetch: Callable[[], bytes]) -> bytes:
+        started = time.perf_counter()
+        data = fetch()
+        self.seconds.append(time.perf_counter() - started)
+        self.sizes.append(len(data))
+        return data
+
+    @property
+    def mean_seconds(self) -> float:
+        return statistics.fmean(self.seconds) if self.seconds else 0.0
+
+    @property
+    def mean_bytes(self) -> float:
+        return statistics.fmean(self.sizes) if self.sizes else 0.0
+
+    def to_raw(self) -> dict[str, Any]:
+        return {
+            "requests": len(self.seconds),
+            "mean_seconds": round(self.mean_seconds, 4),
+            "mean_bytes": round(self.mean_bytes),
+        }
+
+
+@dataclass(frozen=True)
+class CapacityPlan:
+    mode: str
+    registrations: int
+    registrations_source: str
+    listing_pages: int
+    requests: int
+    download_bytes: int
+    fetch_seconds: float
+    transform_cpu_seconds: float
+    wall_seconds: float
+    peak_memory_bytes: int
+    nodes: int
+    transform_workers: int
+    sample: dict[str, dict[str, Any]]
+
+
+def plan_build(
+    settings: Settings,
+    *,
+    client: CimaClient,
+    pages: int = DEFAULT_SAMPLE_PAGES,
+    details: int = DEFAULT_SAMPLE_DETAILS,
+    nodes: int = 1,
+) -> CapacityPlan:
+    # Mide unas pocas peticiones reales y extrapola al catálogo completo. La descarga es
+    # secuencial en cada nodo y la transformación se solapa con ella cuando hay procesos; no se
+    # modelan reintentos, nomenclátor ni las pasadas finales sobre el artefacto.
+    prior_state = load_state(settings.state_path)
+    since = prior_state.last_incremental_date if prior_state is not None else None
+    if settings.mode is not BuildMode.FULL and not since:
+        LOGGER.warning("state.json ausente o inválido: el build hará fallback a FULL.")
+        settings = replace(settings, mode=BuildMode.FULL)
+    elif settings.mode is BuildMode.ROLLING and _known_registrations(settings) == 0:
+        # Igual que run_rolling_build: sin almacén de frescura el build siembra con un FULL.
+        LOGGER.warning("Almacén de frescura vacío: el build hará fallback a FULL.")
+        settings = replace(settings, mode=BuildMode.FULL)
+    if settings.mode is BuildMode.FULL or not since:
+        return _plan_full(settings, client=client, pages=pages, details=details, nodes=nodes)
+    return _plan_delta(settings, client=client, since=since, details=details)
+
+
+def _plan_full(
+    settings: Settings,
+    *,
+    client: CimaClient,
+    pages: int,
+    details: int,
+    nodes: int,
+) -> CapacityPlan:
+    listing = _EndpointSample()
+    nregistros: list[str] = []
+    total: int | None = None
+    page_size = 0
+    for page in range(1, pages + 1):
+        payload = json.loads(listing.timed(partial(client.get_medicamentos_page_raw, page)))
+        items = payload.get("resultados") if isinstance(payload, dict) else payload
+        if isinstance(payload, dict) and isinstance(payload.get("totalFilas"), int):
+            total = payload["totalFilas"]
+        if not isinstance(items, list) or not items:
+            break
+        page_size = max(page_size, len(items))
+        nregistros.extend(
+            str(item.get("nregistro") or item.get("nRegistro") or "")
+            for item in items
+            if isinstance(item, dict)
+        )
+
+    source = "totalFilas"
+    if total is None:
+        total, source = _known_registrations(settings), "freshness"
+    if not total:
+        # Cota inferior: solo se conoce lo visto en las páginas de muestra.
+        LOGGER.warning("Sin totalFilas ni almacén de frescura: se extrapola desde la muestra.")
+        total, source = len(nregistros), "muestra"
+    if settings.limit_medicamentos is not None:
+        total = min(total, settings.limit_medicamentos)
+    # El listado termina con una página vacía salvo que lo corte el límite.
+    listing_pages = math.ceil(total / page_size) if page_size else 1
+    if settings.limit_medicamentos is None or total < settings.limit_medicamentos:
+        listing_pages += 1
+
+    detail, cpu_seconds, payload_peak = _sample_details(
+        settings, client, [nregistro for nregistro in nregistros if nregistro][:details]
+    )
+    # Cada nodo recorre el listado completo y descarga solo su partición.
+    per_node = math.ceil(total / nodes)
+    fetch_seconds = listing_pages * listing.mean_seconds + per_node * detail.mean_seconds
+    return _capacity_plan(
+        settings,
+        registrations=total,
+        registrations_source=source,
+        listing_pages=listing_pages,
+        requests=listing_pages * nodes + total,
+        download_bytes=round(
+            listing_pages * nodes * listing.mean_bytes + total * detail.mean_bytes
+        ),
+        fetch_seconds=fetch_seconds,
+        cpu_seconds=per_node * cpu_seconds,
+        payload_peak=payload_peak,
+        nodes=nodes,
+        sample={"/medicamentos": listing.to_raw(), "/medicamento": detail.to_raw()},
+    )
+
+
+def _plan_delta(
+    settings: Settings,
+    *,
+    client: CimaClient,
+    since: str,
+    details: int,
+) -> CapacityPlan:
+    feed = _EndpointSample()
+    page = parse_change_page(feed.timed(partial(client.get_registro_cambios_raw, since)))
+    changes = page.changes
+    rows = max(page.total or 0, len(changes))
+    page_size = page.page_size or len(changes)
+    feed_pages = math.ceil(rows / page_size) if page_size else 1
+    # El build agrupa los cambios por nregistro: se extrapola la proporción de la primera página.
+    distinct = len({change.nregistro for change in changes})
+    total = round(rows * distinct / len(changes)) if changes else 0
+    # Las páginas del feed se piden en paralelo tras la primera.
+    feed_seconds = feed.mean_seconds * (
+        1 + math.ceil((feed_pages - 1) / settings.change_feed_workers)
+    )
+    if settings.mode is BuildMode.ROLLING:
+        total += settings.rolling_budget_for(_known_registrations(settings))
+    if settings.limit_medicamentos is not None:
+        total = min(total, settings.limit_medicamentos)
+
+    detail, cpu_seconds, payload_peak = _sample_details(
+        settings, client, [change.nregistro for change in changes][:details]
+    )
+    return _capacity_plan(
+        replace(settings, transform_workers=0),
+        registrations=total,
+        registrations_source="registroCambios",
+        listing_pages=feed_pages,
+        requests=feed_pages + total,
+        download_bytes=round(feed_pages * feed.mean_bytes + total * detail.mean_bytes),
+        fetch_seconds=feed_seconds + total * detail.mean_seconds,
+        cpu_seconds=total * cpu_seconds,
+        payload_peak=payload_peak,
+        nodes=1,
+        sample={"/registroCambios": feed.to_raw(), "/medicamento": detail.to_raw()},
+    )
+
+
+def _sample_details(
+    settings: Settings,
+    client: CimaClient,
+    nregistros: list[str],
+) -> tuple[_EndpointSample, float, int]:
+    # Devuelve la muestra de /medicamento, el CPU medio por medicamento (parseo, mapeo,
+    # serialización, hash y compresión) y el pico de memoria de transformar uno.
+    detail = _EndpointSample()
+    cpu_seconds: list[float] = []
+    peak = 0
+    for nregistro in nregistros:
+        try:
+            raw = detail.timed(partial(client.get_medicamento_raw, nregistro))
+        except Exception as exc:
+            LOGGER.warning("Muestra: error al pedir nregistro=%s: %s", nregistro, exc)
+            continue
+        started = time.process_time()
+        _transform(settings, nregistro, raw)
+        cpu_seconds.append(time.process_time() - started)
+        tracemalloc.start()
+        try:
+            _transform(settings, nregistro, raw)
+            peak = max(peak, tracemalloc.get_traced_memory()[1] + len(raw))
+        finally:
+            tracemalloc.stop()
+    return detail, statistics.fmean(cpu_seconds) if cpu_seconds else 0.0, peak
+
+
+def _transform(settings: Settings, nregistro: str, raw: bytes) -> None:
+    med_payload = json.loads(raw)
+    payload_hash(med_payload)
+    records = base_records_from_medicamento(
+        nregistro=nregistro, med_payload=med_payload, updated_at=settings.version
+    )
+    gzip.compress("".join(dumps_json_line(record) for record in records).encode("utf-8"))
+
+
+def _capacity_plan(
+    settings: Settings,
+    *,
+    registrations: int,
+    registrations_source: str,
+    listing_pages: int,
+    requests: int,
+    download_bytes: int,
+    fetch_seconds: float,
+    cpu_seconds: float,
+    payload_peak: int,
+    nodes: int,
+    sample: dict[str, dict[str, Any]],
+) -> CapacityPlan:
+    workers = settings.transform_workers
+    if workers > 0:
+        # El pool transforma mientras el proceso principal descarga: manda el más lento.
+        wall_seconds = max(fetch_seconds, cpu_seconds / workers)
+        in_flight = workers * 2 * TRANSFORM_BATCH_SIZE
+    else:
+        wall_seconds = fetch_seconds + cpu_seconds
+        in_flight = 1
+    tracemalloc.start()
+    try:
+        CnSet()
+        bitmap = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    # RSS de este proceso (mismos módulos que el build) por cada proceso, más el bitmap de CN y
+    # los medicamentos en vuelo. Con fork los procesos comparten páginas: es una cota superior.
+    process_rss = peak_rss_bytes()
+    peak_memory = process_rss * (1 + workers) + bitmap + in_flight * payload_peak
+    return CapacityPlan(
+        mode=settings.mode.value,
+        registrations=registrations,
+        registrations_source=registrations_source,
+        listing_pages=listing_pages,
+        requests=requests,
+        download_bytes=download_bytes,
+        fetch_seconds=round(fetch_seconds, 1),
+        transform_cpu_seconds=round(cpu_seconds, 1),
+        wall_seconds=round(wall_seconds, 1),
+        peak_memory_bytes=peak_memory,
+        nodes=nodes,
+        transform_workers=workers,
+        sample=sample,
+    )
+
+
+def _known_registrations(settings: Settings) -> int:
+    path = settings.store_path(FRESHNESS_FILE)
+    if not path.exists():
+        return 0
+    with FreshnessStore(path) as freshness:
+        return freshness.count()
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder plan",
+        description=(
+            "Estima peticiones, bytes, tiempo y memoria de un build a partir de una muestra de "
+            "peticiones reales, sin escribir artefactos."
+        ),
+    )
+    parser.add_argument(
+        "--mode",
+        choices=[mode.value for mode in BuildMode],
+        default=None,
+        help="Modo a planificar. Si se omite, usa MODE y por defecto full.",
+    )
+    parser.add_argument(
+        "--pages",
+        type=int,
+        default=DEFAULT_SAMPLE_PAGES,
+        help=f"Páginas del listado a muestrear (full). Por defecto: {DEFAULT_SAMPLE_PAGES}",
+    )
+    parser.add_argument(
+        "--details",
+        type=int,
+        default=DEFAULT_SAMPLE_DETAILS,
+        help=f"Medicamentos a muestrear. Por defecto: {DEFAULT_SAMPLE_DETAILS}",
+    )
+    parser.add_argument(
+        "--nodes",
+        type=int,
+        default=1,
+        help="Nodos de un FULL distribuido (--shard i/N). Por defecto: 1",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Procesos de transformación. Por defecto TRANSFORM_WORKERS.",
+    )
+    parser.add_argument("--out-dir", default=None, help="Por defecto OUT_DIR o ./out.")
+    parser.add_argument(
+        "--state-path",
+        default=None,
+        help="Ruta de state. Por defecto STATE_PATH o <out-dir>/state.json.",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        settings = Settings.from_sources(
+            cli_mode=args.mode,
+            cli_version=None,
+            cli_out_dir=args.out_dir,
+            cli_state_path=args.state_path,
+        )
+        if args.pages <= 0 or args.details <= 0 or args.nodes <= 0:
+            raise ValueError("--pages, --details y --nodes deben ser > 0")
+        if args.workers is not None:
+            if args.workers < 0:
+                raise ValueError("--workers debe ser >= 0")
+            settings = replace(settings, transform_workers=args.workers)
+    except ValueError as exc:
+        LOGGER.error("Configuración inválida: %s", exc)
+        return 2
+
+    # Sin archivo de respuestas: el plan no escribe nada; con replay, mide contra el archivo.
+    client = CimaClient(
+        base_url=settings.cima_base_url,
+        timeout=settings.http_timeout,
+        max_retries=settings.http_max_retries,
+        replay=open_archive(settings.replay_dir),
+    )
+    plan = plan_build(
+        settings,
+        client=client,
+        pages=args.pages,
+        details=args.details,
+        nodes=args.nodes,
+    )
+    LOGGER.info(
+        "PLAN %s registros=%s peticiones=%s descarga=%.1f MB tiempo≈%.1f min memoria≈%.0f MB",
+        plan.mode,
+        plan.registrations,
+        plan.requests,
+        plan.download_bytes / 1e6,
+        plan.wall_seconds / 60,
+        plan.peak_memory_bytes / 1e6,
+    )
+    sys.stdout.write(json.dumps(asdict(plan), ensure_ascii=False, indent=2) + "\n")
+    return 0
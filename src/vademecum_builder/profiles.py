@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import json
+import re
+from collections.abc import Iterable, Sequence
+from contextlib import ExitStack
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import TracebackType
+from typing import Any, TextIO
+
+from .artifact_codecs import CODEC_SUFFIXES, CODECS, open_text_writer, parse_codecs
+from .dedupe import compact_jsonl
+from .metrics import BuildMetrics
+from .utils import (
+    dumps_json_line,
+    file_size,
+    open_gzip_text_writer,
+    sha256_file,
+)
+
+PROFILE_CODECS = CODECS
+RECORD_FIELDS = (
+    "cn",
+    "nregistro",
+    "nombre",
+    "lab",
+    "atc",
+    "forma",
+    "via",
+    "docs",
+    "financiado",
+    "precio",
+    "updated_at",
+    "source",
+)
+_NAME_RE = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+@dataclass(frozen=True)
+class OutputProfile:
+    name: str
+    fields: tuple[str, ...] = RECORD_FIELDS
+    where: dict[str, tuple[Any, ...]] = field(default_factory=dict)
+    codec: str = "gzip"
+
+    @staticmethod
+    def from_raw(raw: dict[str, Any]) -> "OutputProfile":
+        name = str(raw.get("name") or "").strip().lower()
+        if not _NAME_RE.match(name):
+            raise ValueError(f"Nombre de perfil inválido: {name!r}")
+        fields = tuple(str(item) for item in raw.get("fields") or RECORD_FIELDS)
+        unknown = sorted(set(fields) - set(RECORD_FIELDS))
+        if unknown:
+            raise ValueError(f"Perfil {name}: campos desconocidos {', '.join(unknown)}")
+        if "cn" not in fields:
+            raise ValueError(f"Perfil {name}: el campo cn es obligatorio")
+        where: dict[str, tuple[Any, ...]] = {}
+        for key, value in (raw.get("where") or {}).items():
+            if key not in RECORD_FIELDS:
+                raise ValueError(f"Perfil {name}: filtro sobre campo desconocido {key}")
+            where[key] = tuple(value) if isinstance(value, list) else (value,)
+        codec = str(raw.get("codec") or PROFILE_CODECS[0]).lower()
+        if codec not in PROFILE_CODECS:
+            raise ValueError(f"Perfil {name}: códec no soportado {codec}")
+        if codec != "gzip":
+            parse_codecs(codec)
+        return OutputProfile(name=name, fields=fields, where=where, codec=codec)
+
+    def matches(self, record: dict[str, Any]) -> bool:
+        return all(record.get(key) in allowed for key, allowed in self.where.items())
+
+    def project(self, record: dict[str, Any]) -> dict[str, Any]:
+        return {key: record.get(key) for key in self.fields}
+
+
+def load_profiles(path: Path) -> tuple[OutputProfile, ...]:
+    try:
+        raw = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as exc:
+        raise ValueError(f"No se pudo leer OUTPUT_PROFILES {path}: {exc}") from exc
+    if not isinstance(raw, list):
+        raise ValueError("OUTPUT_PROFILES debe ser una lista JSON de perfiles")
+    profiles = tuple(OutputProfile.from_raw(item) for item in raw)
+    names = [profile.name for profile in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError("OUTPUT_PROFILES tiene nombres de perfil repetidos")
+    return profiles
+
+
+class _ProfileOutput:
+    def __init__(self, profile: OutputProfile, data_path: Path, deleted_path: Path | None):
+        self.profile = profile
+        self.data_path = data_path
+        self.deleted_path = deleted_path
+        self.records = 0
+        self.deletes = 0
+        # Por CN, líneas ya escritas que un duplicado preferente ha desplazado.
+        self.retracted: dict[str, int] = {}
+
+
+class ProfileFanout:
+    # Escribe todos los perfiles desde el mismo flujo de registros: cada perfil extra cuesta una
+    # proyección y su serialización, no otra descarga. En los deltas, un registro que deja de
+    # cumplir el filtro de un perfil se publica como baja de ese perfil.
+    def __init__(
+        self,
+        profiles: Sequence[OutputProfile],
+        out_dir: Path,
+        *,
+        version: str,
+        delta: bool,
+        metrics: BuildMetrics,
+    ) -> None:
+        self.metrics = metrics
+        self.delta = delta
+        self._stack = ExitStack()
+        self._outputs: list[tuple[_ProfileOutput, TextIO, TextIO | None]] = []
+        for profile in profiles:
+            suffix = CODEC_SUFFIXES[profile.codec]
+            if delta:
+                data_path = out_dir / f"vademecum_{profile.name}_delta_{version}.jsonl{suffix}"
+                deleted_path: Path | None = out_dir / f"deleted_{profile.name}_{version}.txt.gz"
+            else:
+                data_path = out_dir / f"vademecum_{profile.name}_full.jsonl{suffix}"
+                deleted_path = None
+            output = _ProfileOutput(profile, data_path, deleted_path)
+            writer = self._stack.enter_context(open_text_writer(data_path, profile.codec))
+            deleted_writer = (
+                self._stack.enter_context(open_gzip_text_writer(deleted_path))
+                if deleted_path is not None
+                else None
+            )
+            self._outputs.append((output, writer, deleted_writer))
+
+    def __enter__(self) -> "ProfileFanout":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._stack.close()
+
+    def add(self, records: Sequence[dict[str, Any]]) -> None:
+        for output, writer, deleted_writer in self._outputs:
+            profile = output.profile
+            lines: list[str] = []
+            dropped: list[str] = []
+            with self.metrics.stage("serialization"):
+                for record in records:
+                    if profile.matches(record):
+                        lines.append(dumps_json_line(profile.project(record)))
+                    elif deleted_writer is not None:
+                        dropped.append(f"{record['cn']}\n")
+            with self.metrics.stage("compression"):
+                writer.write("".join(lines))
+                if deleted_writer is not None and dropped:
+                    deleted_writer.write("".join(dropped))
+            output.records += len(lines)
+            output.deletes += len(dropped)
+
+    def retract(self, records: Sequence[dict[str, Any]]) -> None:
+        for output, _, _ in self._outputs:
+            for record in records:
+                if output.profile.matches(record):
+                    cn = str(record["cn"])
+                    output.retracted[cn] = output.retracted.get(cn, 0) + 1
+                    output.records -= 1
+
+    def delete(self, cns: Iterable[str]) -> None:
+        lines = [f"{cn}\n" for cn in cns]
+        for output, _, deleted_writer in self._outputs:
+            if deleted_writer is not None and lines:
+                deleted_writer.write("".join(lines))
+                output.deletes += len(lines)
+
+    def close(self) -> list[dict[str, Any]]:
+        self._stack.close()
+        entries: list[dict[str, Any]] = []
+        for output, _, _ in self._outputs:
+            if output.retracted:
+                # Las líneas desplazadas preceden siempre a la vigente.
+                with self.metrics.stage("compression"):
+                    compact_jsonl(output.data_path, output.retracted, output.profile.codec)
+            with self.metrics.stage("hashing"):
+                sha = sha256_file(output.data_path)
+            size = file_size(output.data_path)
+            self.metrics.add_bytes_written(output.data_path.name, size)
+            entry: dict[str, Any] = {
+                "name": output.profile.name,
+                "file": output.data_path.name,
+                "sha256": sha,
+                "size": size,
+                "codec": output.profile.codec,
+                "fields": list(output.profile.fields),
+                "records": output.records,
+            }
+            if output.deleted_path is not None:
+                self.metrics.add_bytes_written(
+                    output.deleted_path.name, file_size(output.deleted_path)
+                )
+                entry["deleted_file"] = output.deleted_path.name
+                entry["deletes"] = output.deletes
+            entries.append(entry)
+        return entries
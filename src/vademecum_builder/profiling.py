@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import cProfile
+import io
+import logging
+import pstats
+import sys
+import threading
+import tracemalloc
+from collections import Counter
+from collections.abc import Callable
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import FrameType
+
+from .metrics import add_stage_observer, remove_stage_observer
+
+LOGGER = logging.getLogger(__name__)
+
+PROFILE_MODES = ("cprofile", "sample")
+SAMPLE_INTERVAL_SECONDS = 0.005
+# Una de cada N entradas a cada etapa registra los sitios de asignación.
+ALLOC_SAMPLE_EVERY = 50
+
+
+def run_profiled(
+    build: Callable[[], int],
+    *,
+    mode: str,
+    out_dir: Path,
+    top: int = 25,
+) -> int:
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Modo de perfilado inválido: {mode}")
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    sampler = _StackSampler(threading.get_ident(), SAMPLE_INTERVAL_SECONDS)
+    profiler = cProfile.Profile() if mode == "cprofile" else None
+    allocations = _AllocationObserver() if mode == "cprofile" else None
+
+    if allocations is not None:
+        tracemalloc.start()
+        add_stage_observer(allocations)
+    sampler.start()
+    if profiler is not None:
+        profiler.enable()
+    try:
+        return build()
+    finally:
+        if profiler is not None:
+            profiler.disable()
+        sampler.stop()
+        if allocations is not None:
+            remove_stage_observer(allocations)
+            tracemalloc.stop()
+
+        collapsed = out_dir / "stacks.collapsed"
+        sampler.write_collapsed(collapsed)
+        written = [collapsed]
+        if profiler is not None:
+            stats_path = out_dir / "build.pstats"
+            profiler.dump_stats(stats_path)
+            top_path = out_dir / "top_functions.txt"
+            top_path.write_text(_format_top_functions(profiler, top), encoding="utf-8")
+            written += [stats_path, top_path]
+        if allocations is not None:
+            alloc_path = out_dir / "allocations.txt"
+            alloc_path.write_text(allocations.report(top), encoding="utf-8")
+            written.append(alloc_path)
+        LOGGER.info("Perfil escrito en %s", ", ".join(str(path) for path in written))
+
+
+class _StackSampler:
+    def __init__(self, thread_id: int, interval: float) -> None:
+        self._thread_id = thread_id
+        self._interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self.stacks: Counter[str] = Counter()
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self._interval):
+            frame = sys._current_frames().get(self._thread_id)
+            if frame is not None:
+                self.stacks[_collapse(frame)] += 1
+
+    def write_collapsed(self, path: Path) -> None:
+        with path.open("w", encoding="utf-8") as handle:
+            for stack, count in self.stacks.most_common():
+                handle.write(f"{stack} {count}\n")
+
+
+def _collapse(frame: FrameType | None) -> str:
+    names: list[str] = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{Path(code.co_filename).name}:{code.co_name}")
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+@dataclass
+class _StageAllocations:
+    calls: int = 0
+    sampled: int = 0
+    net_bytes: int = 0
+    max_peak_bytes: int = 0
+    sites: Counter[str] = field(default_factory=Counter)
+    blocks: Counter[str] = field(default_factory=Counter)
+
+
+@dataclass
+class _OpenStage:
+    name: str
+    start_bytes: int
+    peak_bytes: int
+    snapshot: tracemalloc.Snapshot | None
+
+
+class _AllocationObserver:
+    # Solo observa el hilo que lo instala (el del build): tracemalloc es global, así que las
+    # etapas de otros hilos (shards, páginas del feed) se ignoran en vez de mezclar sus números.
+    # Las etapas anidadas forman una pila; el pico de la externa incluye el de las internas y las
+    # entradas muestreadas comparan dos snapshots sin vaciar las trazas de nadie.
+    def __init__(self) -> None:
+        self.stages: dict[str, _StageAllocations] = {}
+        self._thread_id = threading.get_ident()
+        self._open: list[_OpenStage] = []
+
+    def stage_entered(self, name: str) -> None:
+        if threading.get_ident() != self._thread_id:
+            return
+        stage = self.stages.setdefault(name, _StageAllocations())
+        stage.calls += 1
+        sampled = (stage.calls - 1) % ALLOC_SAMPLE_EVERY == 0
+        current, peak = tracemalloc.get_traced_memory()
+        if self._open:
+            parent = self._open[-1]
+            parent.peak_bytes = max(parent.peak_bytes, peak)
+        tracemalloc.reset_peak()
+        snapshot = tracemalloc.take_snapshot() if sampled else None
+        self._open.append(_OpenStage(name, current, current, snapshot))
+
+    def stage_exited(self, name: str) -> None:
+        if threading.get_ident() != self._thread_id or not self._open:
+            return
+        opened = self._open.pop()
+        current, peak = tracemalloc.get_traced_memory()
+        peak = max(opened.peak_bytes, peak)
+        if self._open:
+            parent = self._open[-1]
+            parent.peak_bytes = max(parent.peak_bytes, peak)
+        stage = self.stages[opened.name]
+        stage.net_bytes += current - opened.start_bytes
+        stage.max_peak_bytes = max(stage.max_peak_bytes, peak - opened.start_bytes)
+        if opened.snapshot is None:
+            return
+        stage.sampled += 1
+        for stat in tracemalloc.take_snapshot().compare_to(opened.snapshot, "lineno"):
+            frame = stat.traceback[0]
+            if frame.filename == __file__ or stat.size_diff <= 0:
+                continue
+            site = f"{frame.filename}:{frame.lineno}"
+            stage.sites[site] += stat.size_diff
+            stage.blocks[site] += max(stat.count_diff, 0)
+
+    def report(self, top: int) -> str:
+        lines = [
+            "Asignaciones por etapa (tracemalloc).",
+            "net_bytes: memoria retenida al salir de la etapa, sumada sobre todas las entradas.",
+            "max_peak_bytes: mayor pico de memoria dentro de una sola entrada a la etapa.",
+            f"Sitios: 1 de cada {ALLOC_SAMPLE_EVERY} entradas, bytes asignados y vivos al salir.",
+            "",
+        ]
+        for name, stage in sorted(self.stages.items(), key=lambda item: -item[1].net_bytes):
+            lines.append(
+                f"== {name} calls={stage.calls} sampled={stage.sampled} "
+                f"net_bytes={stage.net_bytes} max_peak_bytes={stage.max_peak_bytes}"
+            )
+            for site, size in stage.sites.most_common(top):
+                lines.append(f"  {size:>12} B {stage.blocks[site]:>8} blocks  {site}")
+            lines.append("")
+        return "\n".join(lines)
+
+
+def _format_top_functions(profiler: cProfile.Profile, top: int) -> str:
+    buffer = io.StringIO()
+    stats = pstats.Stats(profiler, stream=buffer)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+    buffer.write("\n")
+    stats.sort_stats(pstats.SortKey.TIME).print_stats(top)
+    return buffer.getvalue()
@@ -0,0 +1,337 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+from collections.abc import Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+from .nomenclator_loader import NomenclatorEntry
+from .patch import record_hash
+
+RECORDS_FILE = "records.sqlite"
+# Filas por sentencia al volcar el snapshot del nomenclátor: acota la memoria del diff.
+_CHUNK_SIZE = 5000
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS records (
+    cn TEXT PRIMARY KEY,
+    nregistro TEXT NOT NULL,
+    base TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS records_nregistro ON records (nregistro);
+CREATE TABLE IF NOT EXISTS published (
+    cn TEXT PRIMARY KEY,
+    nregistro TEXT NOT NULL,
+    record TEXT NOT NULL,
+    record_hash TEXT NOT NULL,
+    rank TEXT
+);
+CREATE INDEX IF NOT EXISTS published_nregistro ON published (nregistro);
+CREATE TABLE IF NOT EXISTS chain_versions (
+    version TEXT PRIMARY KEY,
+    mode TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chain_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    version TEXT NOT NULL,
+    cn TEXT NOT NULL,
+    op TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS chain_changes_version ON chain_changes (version, cn);
+CREATE TABLE IF NOT EXISTS nomenclator (
+    cn TEXT PRIMARY KEY,
+    entry_hash TEXT NOT NULL
+);
+"""
+
+
+@dataclass(frozen=True)
+class NomenclatorDiff:
+    changed: list[str]
+    removed: list[str]
+
+    @property
+    def cns(self) -> list[str]:
+        return sorted({*self.changed, *self.removed})
+
+
+def serialize_base_record(record: dict[str, Any]) -> tuple[str, str, str]:
+    return (
+        record["cn"],
+        record["nregistro"],
+        json.dumps(record, ensure_ascii=False, separators=(",", ":")),
+    )
+
+
+def published_row(record: dict[str, Any], line: str) -> tuple[str, str, str, str]:
+    return (record["cn"], record["nregistro"], line.rstrip("\n"), record_hash(record))
+
+
+def nomenclator_entry_hash(entry: NomenclatorEntry) -> str:
+    canonical = json.dumps(
+        [entry.financiado, entry.precio, entry.via_administracion, entry.laboratorio],
+        ensure_ascii=False,
+        separators=(",", ":"),
+    )
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RecordStore:
+    # Guarda por CN los registros base (solo datos de CIMA), el último registro publicado y el
+    # hash de cada entrada del último nomenclátor aplicado. Con ello se emiten cambios de precio
+    # o financiación sin consultar CIMA y se calculan los deltas por campo.
+    def __init__(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(published)")}
+        if "rank" not in columns:
+            # Almacenes creados antes de guardar el rango del registro publicado.
+            self._conn.execute("ALTER TABLE published ADD COLUMN rank TEXT")
+
+    def __enter__(self) -> "RecordStore":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if exc_type is None:
+            self._conn.commit()
+        else:
+            self._conn.rollback()
+        self._conn.close()
+
+    def count(self) -> int:
+        return int(self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0])
+
+    def clear(self) -> None:
+        self._conn.execute("DELETE FROM records")
+        self._conn.execute("DELETE FROM published")
+
+    def replace_nregistro(self, nregistro: str, base_records: Iterable[dict[str, Any]]) -> None:
+        self._conn.execute("DELETE FROM records WHERE nregistro = ?", (nregistro,))
+        self.put_many(base_records)
+
+    def delete_nregistro(self, nregistro: str) -> None:
+        self._conn.execute("DELETE FROM records WHERE nregistro = ?", (nregistro,))
+        self._conn.execute("DELETE FROM published WHERE nregistro = ?", (nregistro,))
+
+    def put_many(self, base_records: Iterable[dict[str, Any]]) -> None:
+        self.put_serialized(serialize_base_record(record) for record in base_records)
+
+    def put_serialized(self, rows: Iterable[tuple[str, str, str]]) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO records (cn, nregistro, base) VALUES (?, ?, ?)",
+            rows,
+        )
+
+    def iter_base_records(self, cns: Iterable[str]) -> Iterator[dict[str, Any]]:
+        cursor = self._conn.cursor()
+        for chunk in _chunks(cns, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows = cursor.execute(
+                f"SELECT base FROM records WHERE cn IN ({placeholders}) ORDER BY cn",
+                chunk,
+            )
+            for (base,) in rows:
+                yield json.loads(base)
+
+    def put_published(
+        self,
+        rows: Iterable[tuple[str, str, str, str]],
+        ranks: Mapping[str, Sequence[Any]] | None = None,
+    ) -> None:
+        # `ranks` (por nregistro) se guarda junto a la fila para resolver CN duplicados en un
+        # FULL sin mantener en memoria el rango de cada registro.
+        self._conn.executemany(
+            """
+            INSERT OR REPLACE INTO published (cn, nregistro, record, record_hash, rank)
+            VALUES (?, ?, ?, ?, ?)
+            """,
+            (
+                (*row, json.dumps(ranks[row[1]]) if ranks and row[1] in ranks else None)
+                for row in rows
+            ),
+        )
+
+    def published_with_rank(self, cn: str) -> tuple[dict[str, Any], list[Any] | None]:
+        record, rank = self._conn.execute(
+            "SELECT record, rank FROM published WHERE cn = ?", (cn,)
+        ).fetchone()
+        return json.loads(record), json.loads(rank) if rank else None
+
+    def published_for(self, cns: Iterable[str]) -> dict[str, tuple[dict[str, Any], str]]:
+        found: dict[str, tuple[dict[str, Any], str]] = {}
+        for chunk in _chunks(cns, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT cn, record, record_hash FROM published WHERE cn IN ({placeholders})",
+                chunk,
+            )
+            for cn, record, digest in rows:
+                found[str(cn)] = (json.loads(record), str(digest))
+        return found
+
+    def snapshot_published(self) -> None:
+        # Copia temporal (solo de esta conexión) de lo publicado antes de vaciar el almacén.
+        self._conn.execute("DROP TABLE IF EXISTS temp.previous_published")
+        self._conn.execute(
+            """
+            CREATE TEMP TABLE previous_published (
+                cn TEXT PRIMARY KEY,
+                record TEXT NOT NULL,
+                record_hash TEXT NOT NULL
+            )
+            """
+        )
+        self._conn.execute(
+            "INSERT INTO previous_published SELECT cn, record, record_hash FROM published"
+        )
+
+    def unchanged_updated_at(self, cns: Iterable[str]) -> dict[str, str]:
+        # `updated_at` previo de los CN cuyo contenido publicado no cambió desde el snapshot.
+        found: dict[str, str] = {}
+        for chunk in _chunks(cns, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"""
+                SELECT p.cn, prev.record FROM published p
+                JOIN previous_published prev ON prev.cn = p.cn
+                WHERE p.cn IN ({placeholders}) AND prev.record_hash = p.record_hash
+                """,
+                chunk,
+            )
+            for cn, record in rows:
+                updated_at = json.loads(record).get("updated_at")
+                if updated_at:
+                    found[str(cn)] = str(updated_at)
+        return found
+
+    def previous_updated_at(self, records: Sequence[dict[str, Any]]) -> dict[str, str]:
+        # Igual que `unchanged_updated_at`, pero para registros aún no publicados en esta ejecución.
+        hashes = {str(record["cn"]): record_hash(record) for record in records}
+        found: dict[str, str] = {}
+        for chunk in _chunks(hashes, 500):
+            placeholders = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"""
+                SELECT cn, record, record_hash FROM previous_published
+                WHERE cn IN ({placeholders})
+                """,
+                chunk,
+            )
+            for cn, record, previous_hash in rows:
+                updated_at = json.loads(record).get("updated_at")
+                if updated_at and previous_hash == hashes[str(cn)]:
+                    found[str(cn)] = str(updated_at)
+        return found
+
+    def reset_chain(self, version: str) -> None:
+        # Un FULL corta la cadena: las versiones anteriores ya no pueden ponerse al día con deltas.
+        self._conn.execute("DELETE FROM chain_changes")
+        self._conn.execute("DELETE FROM chain_versions")
+        self._conn.execute(
+            "INSERT INTO chain_versions (version, mode) VALUES (?, 'full')",
+            (version,),
+        )
+
+    def record_chain(self, version: str, upserted: Iterable[str], deleted: Iterable[str]) -> None:
+        # Se registran primero los upserts y luego las bajas, en el mismo orden en que el cliente
+        # aplica el delta: en la versión, una baja anula un upsert del mismo CN.
+        self._conn.execute("DELETE FROM chain_changes WHERE version = ?", (version,))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO chain_versions (version, mode) VALUES (?, 'incremental')",
+            (version,),
+        )
+        insert = "INSERT INTO chain_changes (version, cn, op) VALUES (?, ?, ?)"
+        self._conn.executemany(insert, ((version, cn, "U") for cn in upserted))
+        self._conn.executemany(insert, ((version, cn, "D") for cn in deleted))
+
+    def chain_versions(self) -> list[str]:
+        rows = self._conn.execute("SELECT version FROM chain_versions ORDER BY version")
+        return [str(row[0]) for row in rows]
+
+    def prune_chain(self, keep_from: str) -> None:
+        self._conn.execute("DELETE FROM chain_versions WHERE version < ?", (keep_from,))
+        self._conn.execute("DELETE FROM chain_changes WHERE version <= ?", (keep_from,))
+
+    def iter_squashed(self, from_version: str) -> Iterator[tuple[str, str | None]]:
+        # Último cambio de cada CN posterior a from_version: (cn, registro publicado) si el último
+        # es un upsert, (cn, None) si es una baja.
+        rows = self._conn.execute(
+            """
+            SELECT c.cn, c.op, p.record FROM chain_changes c
+            JOIN (
+                SELECT MAX(seq) AS seq FROM chain_changes WHERE version > ? GROUP BY cn
+            ) last ON last.seq = c.seq
+            LEFT JOIN published p ON p.cn = c.cn
+            ORDER BY c.cn
+            """,
+            (from_version,),
+        )
+        for cn, op, record in rows:
+            if op == "D":
+                yield str(cn), None
+            elif record is not None:
+                yield str(cn), str(record)
+
+    def has_nomenclator_snapshot(self) -> bool:
+        return self._conn.execute("SELECT 1 FROM nomenclator LIMIT 1").fetchone() is not None
+
+    def diff_nomenclator(self, by_cn: Mapping[str, NomenclatorEntry]) -> NomenclatorDiff:
+        # Diff en SQLite contra una tabla temporal con los hashes actuales; después la tabla
+        # temporal sustituye al snapshot. Solo vuelven a memoria los CN almacenados que cambian.
+        self._conn.execute("DROP TABLE IF EXISTS temp.nomenclator_current")
+        self._conn.execute(
+            "CREATE TEMP TABLE nomenclator_current (cn TEXT PRIMARY KEY, entry_hash TEXT NOT NULL)"
+        )
+        for chunk in _chunks(by_cn.items(), _CHUNK_SIZE):
+            self._conn.executemany(
+                "INSERT INTO nomenclator_current (cn, entry_hash) VALUES (?, ?)",
+                [(cn, nomenclator_entry_hash(entry)) for cn, entry in chunk],
+            )
+        changed = [
+            str(row[0])
+            for row in self._conn.execute(
+                """
+                SELECT c.cn FROM nomenclator_current c
+                JOIN records r ON r.cn = c.cn
+                LEFT JOIN nomenclator n ON n.cn = c.cn
+                WHERE n.entry_hash IS NULL OR n.entry_hash != c.entry_hash
+                """
+            )
+        ]
+        removed = [
+            str(row[0])
+            for row in self._conn.execute(
+                """
+                SELECT n.cn FROM nomenclator n
+                JOIN records r ON r.cn = n.cn
+                LEFT JOIN nomenclator_current c ON c.cn = n.cn
+                WHERE c.cn IS NULL
+                """
+            )
+        ]
+        self._conn.execute("DELETE FROM nomenclator")
+        self._conn.execute("INSERT INTO nomenclator SELECT cn, entry_hash FROM nomenclator_current")
+        self._conn.execute("DROP TABLE temp.nomenclator_current")
+        return NomenclatorDiff(changed=changed, removed=removed)
+
+
+def _chunks(items: Iterable[Any], size: int) -> Iterator[list[Any]]:
+    chunk: list[Any] = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
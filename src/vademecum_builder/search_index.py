@@ -0,0 +1,394 @@
+from __future__ import annotations
+
+import argparse
+import bisect
+import heapq
+import json
+import mmap
+import re
+import struct
+import sys
+import tempfile
+import unicodedata
+from array import array
+from collections import Counter
+from collections.abc import Sequence
+from contextlib import nullcontext
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from types import TracebackType
+from typing import Any, BinaryIO
+
+from .external_sort import DEFAULT_SPILL_ENTRIES, SpillingSorter
+from .metrics import BuildMetrics
+
+SEARCH_INDEX_FILE = "vademecum_search.idx"
+# Prefijos indexados por token; consultas más largas se verifican contra el nombre.
+MAX_PREFIX = 12
+
+_MAGIC = b"VMSRCH01"
+# magic, docs, keys, y offset absoluto de cada sección (docs, claves, postings).
+_HEADER = struct.Struct("<8sIIQQQ")
+# Pares de offsets consecutivos de las tablas, también en little-endian.
+_SPAN = struct.Struct("<QQ")
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def normalize(text: str) -> str:
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(normalize(text))
+
+
+def _keys_for(nombre: str) -> set[str]:
+    keys: set[str] = set()
+    for token in tokenize(nombre):
+        for length in range(1, min(len(token), MAX_PREFIX) + 1):
+            keys.add("p:" + token[:length])
+        padded = f" {token} "
+        for start in range(len(padded) - 2):
+            keys.add("t:" + padded[start : start + 3])
+    return keys
+
+
+def _encode_postings(ordinals: Sequence[int]) -> bytes:
+    # Ordinales crecientes codificados como diferencias en varint (7 bits por byte).
+    out = bytearray()
+    previous = 0
+    for ordinal in ordinals:
+        delta = ordinal - previous
+        previous = ordinal
+        while delta >= 0x80:
+            out.append((delta & 0x7F) | 0x80)
+            delta >>= 7
+        out.append(delta)
+    return bytes(out)
+
+
+def _decode_postings(data: bytes) -> list[int]:
+    ordinals: list[int] = []
+    value = shift = previous = 0
+    for byte in data:
+        value |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        previous += value
+        ordinals.append(previous)
+        value = shift = 0
+    return ordinals
+
+
+class SearchIndexBuilder:
+    # Construye el índice en memoria acotada: los pares (clave, ordinal) pasan por un
+    # SpillingSorter y los documentos se escriben directamente a un temporal.
+    kind = "search"
+
+    def __init__(
+        self,
+        path: Path,
+        *,
+        metrics: BuildMetrics | None = None,
+        spill_entries: int = DEFAULT_SPILL_ENTRIES,
+    ) -> None:
+        self.path = path
+        self.metrics = metrics
+        self.records = 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._tmp = tempfile.TemporaryDirectory(prefix="search-", dir=path.parent)
+        self._tmp_dir = Path(self._tmp.name)
+        self._docs = (self._tmp_dir / "docs.bin").open("wb")
+        self._doc_offsets = array("Q", [0])
+        self._retracted: dict[str, int] = {}
+        self._sorter = SpillingSorter(self._tmp_dir, spill_entries=spill_entries)
+
+    def __enter__(self) -> "SearchIndexBuilder":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self._docs.close()
+        self._tmp.cleanup()
+
+    def add(self, records: Sequence[dict[str, Any]]) -> None:
+        with self.metrics.stage("indexing") if self.metrics else nullcontext():
+            self._add(records)
+
+    def retract(self, records: Sequence[dict[str, Any]]) -> None:
+        # El documento desplazado sale de la tabla al cerrar y los demás se renumeran, igual que
+        # la compactación retira su línea del full.
+        for record in records:
+            cn = str(record["cn"])
+            self._retracted[cn] = self._retracted.get(cn, 0) + 1
+            self.records -= 1
+
+    def _add(self, records: Sequence[dict[str, Any]]) -> None:
+        for record in records:
+            ordinal = len(self._doc_offsets) - 1
+            nombre = str(record.get("nombre") or "")
+            doc = f"{record['cn']}\t{nombre}".encode()
+            self._docs.write(doc)
+            self._doc_offsets.append(self._doc_offsets[-1] + len(doc))
+            self._sorter.extend((key, f"{ordinal:010d}") for key in _keys_for(nombre))
+            self.records += 1
+
+    def close(self) -> int:
+        self._docs.close()
+        stale = sorted(self._stale_ordinals())
+        docs_path, doc_offsets = self._live_docs(stale)
+        key_offsets = array("Q", [0])
+        posting_offsets = array("Q", [0])
+        keys_path = self._tmp_dir / "keys.bin"
+        postings_path = self._tmp_dir / "postings.bin"
+        with keys_path.open("wb") as keys_out, postings_path.open("wb") as postings_out:
+            for key, ordinals in self._sorter.groups():
+                # Se filtra antes de escribir la clave para que claves y postings sigan alineadas.
+                live = [int(ordinal) for ordinal in ordinals]
+                if stale:
+                    live = _renumber(live, stale)
+                    if not live:
+                        continue
+                encoded_key = key.encode()
+                keys_out.write(encoded_key)
+                key_offsets.append(key_offsets[-1] + len(encoded_key))
+                postings = _encode_postings(live)
+                postings_out.write(postings)
+                posting_offsets.append(posting_offsets[-1] + len(postings))
+
+        docs_count = len(doc_offsets) - 1
+        keys_count = len(key_offsets) - 1
+        docs_at = _HEADER.size
+        keys_at = docs_at + doc_offsets.itemsize * len(doc_offsets)
+        keys_at += docs_path.stat().st_size
+        postings_at = keys_at + key_offsets.itemsize * len(key_offsets)
+        postings_at += keys_path.stat().st_size
+        with self.path.open("wb") as out:
+            out.write(_HEADER.pack(_MAGIC, docs_count, keys_count, docs_at, keys_at, postings_at))
+            out.write(_little_endian(doc_offsets))
+            _copy(docs_path, out)
+            out.write(_little_endian(key_offsets))
+            _copy(keys_path, out)
+            out.write(_little_endian(posting_offsets))
+            _copy(postings_path, out)
+        self._tmp.cleanup()
+        return self.path.stat().st_size
+
+    def _live_docs(self, stale: list[int]) -> tuple[Path, array[int]]:
+        # Copia los documentos vigentes a otro temporal con su tabla de offsets.
+        docs_path = self._tmp_dir / "docs.bin"
+        if not stale:
+            return docs_path, self._doc_offsets
+        live_path = self._tmp_dir / "docs-live.bin"
+        offsets = array("Q", [0])
+        dropped = set(stale)
+        with docs_path.open("rb") as source, live_path.open("wb") as out:
+            for ordinal in range(len(self._doc_offsets) - 1):
+                doc = source.read(self._doc_offsets[ordinal + 1] - self._doc_offsets[ordinal])
+                if ordinal in dropped:
+                    continue
+                out.write(doc)
+                offsets.append(offsets[-1] + len(doc))
+        return live_path, offsets
+
+    def _stale_ordinals(self) -> set[int]:
+        # Ordinales de las primeras apariciones de cada CN retirado.
+        if not self._retracted:
+            return set()
+        pending = dict(self._retracted)
+        stale: set[int] = set()
+        with (self._tmp_dir / "docs.bin").open("rb") as handle:
+            for ordinal in range(len(self._doc_offsets) - 1):
+                doc = handle.read(self._doc_offsets[ordinal + 1] - self._doc_offsets[ordinal])
+                cn = doc.decode().partition("\t")[0]
+                if pending.get(cn):
+                    pending[cn] -= 1
+                    stale.add(ordinal)
+        return stale
+
+
+def _renumber(ordinals: list[int], stale: list[int]) -> list[int]:
+    # Quita los ordinales retirados y resta a cada uno los retirados que tiene delante.
+    renumbered: list[int] = []
+    for ordinal in ordinals:
+        position = bisect.bisect_left(stale, ordinal)
+        if position < len(stale) and stale[position] == ordinal:
+            continue
+        renumbered.append(ordinal - position)
+    return renumbered
+
+
+def _little_endian(offsets: array[int]) -> bytes:
+    if sys.byteorder == "big":
+        offsets = array(offsets.typecode, offsets)
+        offsets.byteswap()
+    return offsets.tobytes()
+
+
+def _copy(source: Path, out: BinaryIO) -> None:
+    with source.open("rb") as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b""):
+            out.write(chunk)
+
+
+@dataclass(frozen=True)
+class SearchHit:
+    cn: str
+    nombre: str
+    ordinal: int
+
+
+class SearchIndex:
+    # Lector sobre el fichero mapeado en memoria: las claves se buscan por bisección en la tabla
+    # de offsets y solo se decodifican las listas de las claves consultadas.
+    def __init__(self, path: Path) -> None:
+        self._handle = path.open("rb")
+        self._mm = mmap.mmap(self._handle.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, docs, keys, docs_at, keys_at, postings_at = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError(f"{path} no es un índice de búsqueda")
+        self.docs = int(docs)
+        self.keys = int(keys)
+        self._docs_at = int(docs_at)
+        self._docs_blob = self._docs_at + 8 * (self.docs + 1)
+        self._keys_at = int(keys_at)
+        self._keys_blob = self._keys_at + 8 * (self.keys + 1)
+        self._postings_at = int(postings_at)
+        self._postings_blob = self._postings_at + 8 * (self.keys + 1)
+
+    def __enter__(self) -> "SearchIndex":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._mm.close()
+        self._handle.close()
+
+    def search(self, query: str, limit: int = 10) -> list[SearchHit]:
+        tokens = tokenize(query)
+        if not tokens or limit <= 0:
+            return []
+        matches = self._prefix_matches(tokens)
+        if not matches:
+            return self._trigram_matches(tokens, limit)
+        # Entradas más cortas primero: a igualdad de prefijo son la coincidencia más directa. La
+        # longitud sale de la tabla de offsets, así que solo se decodifican los documentos que se
+        # devuelven (o los que hay que comprobar contra tokens más largos que MAX_PREFIX).
+        long_tokens = [token for token in tokens if len(token) > MAX_PREFIX]
+        if not long_tokens:
+            return [self.hit(ordinal) for ordinal in heapq.nsmallest(limit, matches, self._rank)]
+        hits: list[SearchHit] = []
+        for ordinal in sorted(matches, key=self._rank):
+            hit = self.hit(ordinal)
+            if _all_prefixes(long_tokens, tokenize(hit.nombre)):
+                hits.append(hit)
+                if len(hits) == limit:
+                    break
+        return hits
+
+    def hit(self, ordinal: int) -> SearchHit:
+        start, end = _SPAN.unpack_from(self._mm, self._docs_at + 8 * ordinal)
+        raw = self._mm[self._docs_blob + start : self._docs_blob + end].decode()
+        cn, _, nombre = raw.partition("\t")
+        return SearchHit(cn=cn, nombre=nombre, ordinal=ordinal)
+
+    def _rank(self, ordinal: int) -> tuple[int, int]:
+        start, end = _SPAN.unpack_from(self._mm, self._docs_at + 8 * ordinal)
+        return int(end - start), ordinal
+
+    def _prefix_matches(self, tokens: list[str]) -> set[int]:
+        # Se empieza por la lista más corta (tamaño leído de los offsets) y se corta en cuanto la
+        # intersección queda vacía.
+        keys = []
+        for token in dict.fromkeys(tokens):
+            index = self._find_key(("p:" + token[:MAX_PREFIX]).encode())
+            if index is None:
+                return set()
+            keys.append(index)
+        keys.sort(key=self._postings_size)
+        result = set(self._postings_at_index(keys[0]))
+        for index in keys[1:]:
+            result.intersection_update(self._postings_at_index(index))
+            if not result:
+                break
+        return result
+
+    def _trigram_matches(self, tokens: list[str], limit: int) -> list[SearchHit]:
+        # Sin coincidencia por prefijo (p. ej. una errata): se ordena por trigramas compartidos.
+        scores: Counter[int] = Counter()
+        for token in tokens:
+            padded = f" {token} "
+            for start in range(len(padded) - 2):
+                scores.update(self._postings("t:" + padded[start : start + 3]))
+        best = sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return [self.hit(ordinal) for ordinal, _ in best]
+
+    def _postings(self, key: str) -> list[int]:
+        index = self._find_key(key.encode())
+        return [] if index is None else self._postings_at_index(index)
+
+    def _postings_at_index(self, index: int) -> list[int]:
+        start, end = _SPAN.unpack_from(self._mm, self._postings_at + 8 * index)
+        return _decode_postings(self._mm[self._postings_blob + start : self._postings_blob + end])
+
+    def _postings_size(self, index: int) -> int:
+        start, end = _SPAN.unpack_from(self._mm, self._postings_at + 8 * index)
+        return int(end - start)
+
+    def _find_key(self, key: bytes) -> int | None:
+        low, high = 0, self.keys
+        while low < high:
+            middle = (low + high) // 2
+            candidate = self._key(middle)
+            if candidate < key:
+                low = middle + 1
+            elif candidate > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def _key(self, index: int) -> bytes:
+        start, end = _SPAN.unpack_from(self._mm, self._keys_at + 8 * index)
+        return self._mm[self._keys_blob + start : self._keys_blob + end]
+
+
+def _all_prefixes(query_tokens: list[str], name_tokens: list[str]) -> bool:
+    return all(any(name.startswith(token) for name in name_tokens) for token in query_tokens)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder search",
+        description="Consulta por prefijo el índice de búsqueda generado por el FULL.",
+    )
+    parser.add_argument("query", help="Texto a buscar en el nombre.")
+    parser.add_argument(
+        "--index",
+        default=f"./out/{SEARCH_INDEX_FILE}",
+        help=f"Ruta del índice. Por defecto: ./out/{SEARCH_INDEX_FILE}",
+    )
+    parser.add_argument("--limit", type=int, default=10, help="Resultados. Por defecto: 10")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    with SearchIndex(Path(args.index)) as index:
+        hits = index.search(args.query, args.limit)
+    sys.stdout.write(json.dumps([asdict(hit) for hit in hits], ensure_ascii=False, indent=2) + "\n")
+    return 0
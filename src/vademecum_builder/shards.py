@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import queue
+import threading
+import time
+import zlib
+from collections.abc import Sequence
+from dataclasses import dataclass, field
+from pathlib import Path
+from types import TracebackType
+from typing import Any
+
+# Texto acumulado por shard antes de pasarlo a su hilo: cada envío es un miembro gzip.
+SHARD_BUFFER_BYTES = 256 * 1024
+_QUEUE_DEPTH = 8
+# Valor de `layout` en el manifest de un full particionado.
+SHARDED_LAYOUT = "sharded"
+
+
+def shard_of(cn: str, shards: int) -> int:
+    return zlib.crc32(cn.encode("utf-8")) % shards
+
+
+def shard_file_name(index: int, shards: int) -> str:
+    return f"vademecum_full-{index:03d}-of-{shards:03d}.jsonl.gz"
+
+
+@dataclass(frozen=True)
+class ShardInfo:
+    index: int
+    file: str
+    sha256: str
+    size: int
+    records: int
+    encodings: list[dict[str, Any]] = field(default_factory=list)
+
+    def to_raw(self) -> dict[str, Any]:
+        payload: dict[str, Any] = {
+            "index": self.index,
+            "file": self.file,
+            "sha256": self.sha256,
+            "size": self.size,
+            "records": self.records,
+        }
+        if self.encodings:
+            payload["encodings"] = self.encodings
+        return payload
+
+
+class _ShardWriter(threading.Thread):
+    # Comprime, escribe y calcula el sha256 de un shard en su propio hilo. zlib y hashlib
+    # liberan el GIL, así que los shards avanzan en paralelo con la descarga.
+    def __init__(self, index: int, path: Path) -> None:
+        super().__init__(name=f"shard-writer-{index}", daemon=True)
+        self.index = index
+        self.path = path
+        self.queue: queue.Queue[str | bytes | None] = queue.Queue(maxsize=_QUEUE_DEPTH)
+        self.size = 0
+        self.compression_seconds = 0.0
+        self.hashing_seconds = 0.0
+        self.error: BaseException | None = None
+        self._sha = hashlib.sha256()
+
+    def run(self) -> None:
+        try:
+            with self.path.open("wb") as handle:
+                while (item := self.queue.get()) is not None:
+                    self._write(handle, item)
+        except BaseException as exc:
+            self.error = exc
+            while self.queue.get() is not None:
+                pass
+
+    def _write(self, handle: Any, item: str | bytes) -> None:
+        if isinstance(item, str):
+            started = time.perf_counter()
+            item = gzip.compress(item.encode("utf-8"), mtime=0)
+            self.compression_seconds += time.perf_counter() - started
+        started = time.perf_counter()
+        self._sha.update(item)
+        self.hashing_seconds += time.perf_counter() - started
+        handle.write(item)
+        self.size += len(item)
+
+    def hexdigest(self) -> str:
+        return self._sha.hexdigest()
+
+
+class ShardedOutput:
+    def __init__(self, out_dir: Path, shards: int) -> None:
+        if shards <= 0:
+            raise ValueError("El número de shards debe ser > 0")
+        out_dir.mkdir(parents=True, exist_ok=True)
+        self.shards = shards
+        self._writers = [
+            _ShardWriter(index, out_dir / shard_file_name(index, shards))
+            for index in range(shards)
+        ]
+        self._buffers: list[list[str]] = [[] for _ in range(shards)]
+        self._buffered = [0] * shards
+        self._records = [0] * shards
+        self._wrote = [False] * shards
+        self._closed = False
+        for writer in self._writers:
+            writer.start()
+
+    def __enter__(self) -> "ShardedOutput":
+        return self
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        if not self._closed:
+            self._stop()
+
+    @property
+    def compression_seconds(self) -> float:
+        return sum(writer.compression_seconds for writer in self._writers)
+
+    @property
+    def hashing_seconds(self) -> float:
+        return sum(writer.hashing_seconds for writer in self._writers)
+
+    def add_lines(self, records: Sequence[dict[str, Any]], lines: Sequence[str]) -> None:
+        for record, line in zip(records, lines, strict=True):
+            index = shard_of(record["cn"], self.shards)
+            self._buffers[index].append(line)
+            self._buffered[index] += len(line)
+            self._records[index] += 1
+            if self._buffered[index] >= SHARD_BUFFER_BYTES:
+                self._flush(index)
+
+    def add_members(self, members: Sequence[bytes], counts: Sequence[int]) -> None:
+        for index, (member, count) in enumerate(zip(members, counts, strict=True)):
+            if member:
+                self._put(index, member)
+            self._records[index] += count
+
+    def close(self) -> list[ShardInfo]:
+        for index in range(self.shards):
+            self._flush(index)
+            if not self._wrote[index]:
+                self._put(index, gzip.compress(b"", mtime=0))
+        self._stop()
+        for writer in self._writers:
+            if writer.error is not None:
+                raise writer.error
+        return [
+            ShardInfo(
+                index=writer.index,
+                file=writer.path.name,
+                sha256=writer.hexdigest(),
+                size=writer.size,
+                records=self._records[writer.index],
+            )
+            for writer in self._writers
+        ]
+
+    def _flush(self, index: int) -> None:
+        if self._buffers[index]:
+            self._put(index, "".join(self._buffers[index]))
+            self._buffers[index] = []
+            self._buffered[index] = 0
+
+    def _put(self, index: int, item: str | bytes) -> None:
+        writer = self._writers[index]
+        if writer.error is not None:
+            raise writer.error
+        writer.queue.put(item)
+        self._wrote[index] = True
+
+    def _stop(self) -> None:
+        self._closed = True
+        for writer in self._writers:
+            writer.queue.put(None)
+        for writer in self._writers:
+            writer.join()
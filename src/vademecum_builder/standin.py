@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import argparse
+import json
+import logging
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import TracebackType
+from typing import Any
+from urllib.parse import parse_qs, urlsplit
+
+from .synthetic import SyntheticDataset
+from .utils import setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+STATS_PATH = "/_standin/stats"
+
+
+@dataclass(frozen=True)
+class StandinConfig:
+    size: int = 2000
+    page_size: int = 200
+    seed: int = 0
+    latency_ms: float = 0.0
+    latency_sigma: float = 0.5
+    slow_rate: float = 0.0
+    slow_ms: float = 2000.0
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    change_rate: float = 0.02
+
+
+class _StandinState:
+    def __init__(self, config: StandinConfig) -> None:
+        self.config = config
+        self.dataset = SyntheticDataset(size=config.size, seed=config.seed)
+        self.changes = self.dataset.changes(config.change_rate)
+        self.lock = threading.Lock()
+        self.rng = random.Random(config.seed)
+        self.requests: Counter[str] = Counter()
+
+    def draw(self) -> tuple[float, int | None]:
+        cfg = self.config
+        with self.lock:
+            delay = 0.0
+            if cfg.latency_ms > 0:
+                delay = self.rng.lognormvariate(math.log(cfg.latency_ms), cfg.latency_sigma)
+            if cfg.slow_rate > 0 and self.rng.random() < cfg.slow_rate:
+                delay += cfg.slow_ms
+            roll = self.rng.random()
+            status: int | None = None
+            if roll < cfg.rate_429:
+                status = 429
+            elif roll < cfg.rate_429 + cfg.rate_5xx:
+                status = self.rng.choice((500, 502, 503, 504))
+        return delay / 1000.0, status
+
+    def count(self, key: str) -> None:
+        with self.lock:
+            self.requests[key] += 1
+
+    def snapshot(self) -> dict[str, int]:
+        with self.lock:
+            return dict(self.requests)
+
+
+class StandinServer:
+    def __init__(self, config: StandinConfig, host: str = "127.0.0.1", port: int = 0) -> None:
+        self.state = _StandinState(config)
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self.state))
+        self._server.daemon_threads = True
+        self._thread: threading.Thread | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host!s}:{port}"
+
+    def start(self) -> "StandinServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self._server.serve_forever()
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> "StandinServer":
+        return self.start()
+
+    def __exit__(
+        self,
+        exc_type: type[BaseException] | None,
+        exc: BaseException | None,
+        tb: TracebackType | None,
+    ) -> None:
+        self.stop()
+
+
+def _make_handler(state: _StandinState) -> type[BaseHTTPRequestHandler]:
+    class _Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        disable_nagle_algorithm = True
+
+        def do_GET(self) -> None:
+            parts = urlsplit(self.path)
+            params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+            if parts.path == STATS_PATH:
+                self._send(200, {"requests": state.snapshot()})
+                return
+
+            delay, status = state.draw()
+            if delay > 0:
+                time.sleep(delay)
+            if status is not None:
+                state.count(f"{parts.path} {status}")
+                self._send(status, {"error": "injected"})
+                return
+
+            body = _route(state, parts.path, params)
+            if body is None:
+                state.count(f"{parts.path} 404")
+                self._send(404, {"error": "not found"})
+                return
+            state.count(f"{parts.path} 200")
+            self._send(200, body)
+
+        def _send(self, status: int, body: Any) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            LOGGER.debug("standin %s", format % args)
+
+    return _Handler
+
+
+def _route(state: _StandinState, path: str, params: dict[str, str]) -> Any:
+    dataset = state.dataset
+    page_size = state.config.page_size
+    if path == "/medicamentos":
+        page = max(int(params.get("pagina") or 1), 1)
+        start = (page - 1) * page_size
+        end = min(start + page_size, dataset.size)
+        return {
+            "totalFilas": dataset.size,
+            "pagina": page,
+            "tamanioPagina": page_size,
+            "resultados": [dataset.listing_item(i) for i in range(start, end)],
+        }
+    if path == "/medicamento":
+        index = dataset.index_of(params.get("nregistro") or "")
+        return dataset.medicamento(index) if index is not None else None
+    if path == "/registroCambios":
+        page = max(int(params.get("pagina") or 1), 1)
+        start = (page - 1) * page_size
+        return {
+            "totalFilas": len(state.changes),
+            "pagina": page,
+            "tamanioPagina": page_size,
+            "resultados": state.changes[start : start + page_size],
+        }
+    return None
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder standin",
+        description="Servidor local que imita la API REST de CIMA con datos sintéticos.",
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--log-level", default="INFO")
+    add_config_arguments(parser)
+    return parser
+
+
+def add_config_arguments(parser: argparse.ArgumentParser) -> None:
+    defaults = StandinConfig()
+    parser.add_argument("--size", type=int, default=defaults.size, help="Nº de medicamentos.")
+    parser.add_argument("--page-size", type=int, default=defaults.page_size)
+    parser.add_argument("--seed", type=int, default=defaults.seed)
+    parser.add_argument(
+        "--latency-ms",
+        type=float,
+        default=defaults.latency_ms,
+        help="Mediana de la latencia inyectada (distribución lognormal).",
+    )
+    parser.add_argument("--latency-sigma", type=float, default=defaults.latency_sigma)
+    parser.add_argument(
+        "--slow-rate",
+        type=float,
+        default=defaults.slow_rate,
+        help="Fracción de peticiones con cola lenta.",
+    )
+    parser.add_argument("--slow-ms", type=float, default=defaults.slow_ms)
+    parser.add_argument("--rate-429", type=float, default=defaults.rate_429)
+    parser.add_argument("--rate-5xx", type=float, default=defaults.rate_5xx)
+    parser.add_argument("--change-rate", type=float, default=defaults.change_rate)
+
+
+def config_from_args(args: argparse.Namespace) -> StandinConfig:
+    return StandinConfig(
+        size=args.size,
+        page_size=args.page_size,
+        seed=args.seed,
+        latency_ms=args.latency_ms,
+        latency_sigma=args.latency_sigma,
+        slow_rate=args.slow_rate,
+        slow_ms=args.slow_ms,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        change_rate=args.change_rate,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+    config = config_from_args(args)
+    server = StandinServer(config, host=args.host, port=args.port)
+    LOGGER.info("Stand-in de CIMA escuchando en %s (%s)", server.url, asdict(config))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stop()
+    return 0
@@ -17,6 +17,8 @@ class StateData:
     total_presentaciones_full: int = 0
     stats_last_run: dict[str, Any] | None = None
     failed_nregistro_last_run: list[str] | None = None
+    # Páginas del registroCambios ya descargadas si la ejecución anterior falló a medias.
+    change_feed: dict[str, Any] | None = None
 
     @staticmethod
     def from_raw(raw: dict[str, Any]) -> "StateData":
@@ -31,10 +33,13 @@ class StateData:
                 else {}
             ),
             failed_nregistro_last_run=list(raw.get("failed_nregistro_last_run") or []),
+            change_feed=(
+                raw.get("change_feed") if isinstance(raw.get("change_feed"), dict) else None
+            ),
         )
 
     def to_raw(self) -> dict[str, Any]:
-        return {
+        payload: dict[str, Any] = {
             "last_success_version": self.last_success_version,
             "last_full_version": self.last_full_version,
             "last_incremental_date": self.last_incremental_date,
@@ -42,6 +47,9 @@ class StateData:
             "stats_last_run": self.stats_last_run or {},
             "failed_nregistro_last_run": self.failed_nregistro_last_run or [],
         }
+        if self.change_feed:
+            payload["change_feed"] = self.change_feed
+        return payload
 
 
 def load_state(path: Path) -> StateData | None:
@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import random
+from dataclasses import dataclass
+from typing import Any
+
+_PRINCIPIOS = [
+    ("IBUPROFENO", "M01AE01"),
+    ("PARACETAMOL", "N02BE01"),
+    ("OMEPRAZOL", "A02BC01"),
+    ("AMOXICILINA", "J01CA04"),
+    ("METAMIZOL", "N02BB02"),
+    ("ATORVASTATINA", "C10AA05"),
+    ("ENALAPRIL", "C09AA02"),
+    ("METFORMINA", "A10BA02"),
+    ("SALBUTAMOL", "R03AC02"),
+    ("LORAZEPAM", "N05BA06"),
+    ("SERTRALINA", "N06AB06"),
+    ("LEVOTIROXINA", "H03AA01"),
+]
+_LABS = [
+    "CINFA, S.A.",
+    "Laboratorios Normon, S.A.",
+    "KERN PHARMA, S.L.",
+    "Teva Pharma, S.L.U.",
+    "Sandoz Farmacéutica, S.A.",
+    "Laboratorios Farmalán, S.A.",
+    "Stada, S.L.",
+    "Bayer Hispania, S.L.",
+]
+_FORMAS = [
+    ("COMPRIMIDOS RECUBIERTOS CON PELÍCULA", "VÍA ORAL"),
+    ("CÁPSULAS DURAS", "VÍA ORAL"),
+    ("SOLUCIÓN INYECTABLE", "VÍA INTRAVENOSA"),
+    ("SUSPENSIÓN ORAL", "VÍA ORAL"),
+    ("SOLUCIÓN PARA INHALACIÓN EN ENVASE A PRESIÓN", "VÍA INHALATORIA"),
+    ("GRANULADO PARA SOLUCIÓN ORAL", "VÍA ORAL"),
+]
+_DOSIS = ["5 mg", "10 mg", "20 mg", "40 mg", "100 mg", "250 mg", "500 mg", "600 mg", "1 g"]
+_ENVASES = [10, 14, 20, 28, 30, 40, 50, 56, 60, 100]
+_FIRST_NREGISTRO = 60000
+
+
+@dataclass(frozen=True)
+class SyntheticDataset:
+    size: int
+    seed: int = 0
+
+    def nregistro(self, index: int) -> str:
+        return str(_FIRST_NREGISTRO + index)
+
+    def index_of(self, nregistro: str) -> int | None:
+        try:
+            index = int(nregistro) - _FIRST_NREGISTRO
+        except ValueError:
+            return None
+        return index if 0 <= index < self.size else None
+
+    def listing_item(self, index: int) -> dict[str, Any]:
+        principio, _ = _PRINCIPIOS[index % len(_PRINCIPIOS)]
+        return {"nregistro": self.nregistro(index), "nombre": principio}
+
+    def medicamento(self, index: int) -> dict[str, Any]:
+        rng = random.Random(self.seed * 1_000_003 + index)
+        principio, atc = _PRINCIPIOS[index % len(_PRINCIPIOS)]
+        lab = rng.choice(_LABS)
+        forma, via = rng.choice(_FORMAS)
+        dosis = rng.choice(_DOSIS)
+        nregistro = self.nregistro(index)
+        nombre = f"{principio} {lab.split(',')[0].split(' ')[0].upper()} {dosis} {forma} EFG"
+        presentaciones = [
+            {
+                "cn": str(100000 + index * 4 + offset),
+                "nombre": f"{nombre}, {rng.choice(_ENVASES)} unidades",
+                "viaAdministracion": via if rng.random() < 0.8 else None,
+                "comerc": rng.random() < 0.9,
+            }
+            for offset in range(rng.randint(1, 3))
+        ]
+        return {
+            "nregistro": nregistro,
+            "nombre": nombre,
+            "labtitular": lab,
+            "atc": [
+                {"codigo": atc[:1], "nombre": "Nivel 1"},
+                {"codigo": atc[:3], "nombre": "Nivel 2"},
+                {"codigo": atc, "nombre": principio},
+            ],
+            "formaFarmaceutica": forma,
+            "viaAdministracion": via,
+            "fichaTecnica": f"https://cima.aemps.es/cima/pdfs/ft/{nregistro}/FT_{nregistro}.pdf",
+            "prospecto": f"https://cima.aemps.es/cima/pdfs/p/{nregistro}/P_{nregistro}.pdf",
+            "autorizado": rng.random() < 0.95,
+            "presentaciones": presentaciones,
+        }
+
+    def presentaciones_count(self) -> int:
+        return sum(len(self.medicamento(i)["presentaciones"]) for i in range(self.size))
+
+    def changes(self, rate: float) -> list[dict[str, Any]]:
+        rng = random.Random(self.seed * 7_919 + self.size)
+        rows: list[dict[str, Any]] = []
+        for index in range(self.size):
+            if rng.random() >= rate:
+                continue
+            tipo = "Baja" if rng.random() < 0.1 else "Modificacion"
+            row: dict[str, Any] = {"nregistro": self.nregistro(index), "tipoCambio": tipo}
+            if tipo == "Baja":
+                row["cn"] = str(100000 + index * 4)
+            rows.append(row)
+        return rows
+
+    def nomenclator_csv(self) -> str:
+        rng = random.Random(self.seed * 104_729 + self.size)
+        lines = ["cn;financiado;precio;via_administracion;laboratorio"]
+        for index in range(self.size):
+            med = self.medicamento(index)
+            for presentacion in med["presentaciones"]:
+                precio = f"{rng.uniform(1, 120):.2f}".replace(".", ",")
+                financiado = "si" if rng.random() < 0.7 else "no"
+                lines.append(
+                    f"{presentacion['cn']};{financiado};{precio};"
+                    f"{med['viaAdministracion']};{med['labtitular']}"
+                )
+        return "\n".join(lines) + "\n"
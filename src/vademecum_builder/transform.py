@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import gzip
+import json
+import time
+from collections import deque
+from collections.abc import Iterable, Iterator, Mapping
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+from .dedupe import Rank, registration_rank
+from .freshness import payload_hash
+from .incremental import apply_nomenclator, base_records_from_medicamento
+from .nomenclator_loader import NomenclatorEntry
+from .record_store import published_row, serialize_base_record
+from .shards import shard_of
+from .utils import dumps_json_line
+
+# Cada tarea agrupa varios medicamentos para amortizar el coste de IPC.
+TRANSFORM_BATCH_SIZE = 32
+
+_worker_nomenclator: Mapping[str, NomenclatorEntry] = {}
+_worker_updated_at = ""
+_worker_shards = 0
+
+
+@dataclass(frozen=True)
+class RawMedicamento:
+    nregistro: str
+    payload: bytes
+
+
+@dataclass(frozen=True)
+class TransformedBatch:
+    data: bytes
+    medicamentos: int
+    presentaciones: int
+    failed: list[str] = field(default_factory=list)
+    hashes: list[tuple[str, str]] = field(default_factory=list)
+    base_records: list[tuple[str, str, str]] = field(default_factory=list)
+    published: list[tuple[str, str, str, str]] = field(default_factory=list)
+    ranks: list[tuple[str, Rank]] = field(default_factory=list)
+    shard_data: list[bytes] = field(default_factory=list)
+    shard_counts: list[int] = field(default_factory=list)
+    mapping_seconds: float = 0.0
+    serialization_seconds: float = 0.0
+    compression_seconds: float = 0.0
+
+
+def transform_in_pool(
+    batches: Iterable[list[RawMedicamento]],
+    *,
+    workers: int,
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    updated_at: str,
+    shards: int = 0,
+) -> Iterator[TransformedBatch]:
+    # El nomenclátor viaja en los initargs: con fork se hereda sin serializar y con
+    # spawn se serializa una vez por proceso, nunca por tarea.
+    with ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(nomenclator_map, updated_at, shards),
+    ) as executor:
+        pending: deque[Future[TransformedBatch]] = deque()
+        for batch in batches:
+            pending.append(executor.submit(_transform_batch, batch))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def iter_batches(
+    items: Iterable[RawMedicamento],
+    size: int = TRANSFORM_BATCH_SIZE,
+) -> Iterator[list[RawMedicamento]]:
+    batch: list[RawMedicamento] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _init_worker(
+    nomenclator_map: Mapping[str, NomenclatorEntry],
+    updated_at: str,
+    shards: int,
+) -> None:
+    global _worker_nomenclator, _worker_updated_at, _worker_shards
+    _worker_nomenclator = nomenclator_map
+    _worker_updated_at = updated_at
+    _worker_shards = shards
+
+
+def _transform_batch(batch: list[RawMedicamento]) -> TransformedBatch:
+    lines: list[str] = []
+    cns: list[str] = []
+    medicamentos = 0
+    failed: list[str] = []
+    hashes: list[tuple[str, str]] = []
+    base_rows: list[tuple[str, str, str]] = []
+    published_rows: list[tuple[str, str, str, str]] = []
+    ranks: list[tuple[str, Rank]] = []
+    mapping = serialization = 0.0
+    for item in batch:
+        started = time.perf_counter()
+        try:
+            payload = json.loads(item.payload)
+        except ValueError:
+            failed.append(item.nregistro)
+            continue
+        medicamentos += 1
+        med_payload = payload if isinstance(payload, dict) else {}
+        hashes.append((item.nregistro, payload_hash(med_payload)))
+        ranks.append((item.nregistro, registration_rank(item.nregistro, med_payload)))
+        base_records = base_records_from_medicamento(
+            nregistro=item.nregistro,
+            med_payload=med_payload,
+            updated_at=_worker_updated_at,
+        )
+        records = [
+            apply_nomenclator(base, _worker_nomenclator.get(base["cn"])) for base in base_records
+        ]
+        mapped = time.perf_counter()
+        record_lines = [dumps_json_line(rec) for rec in records]
+        lines.extend(record_lines)
+        cns.extend(record["cn"] for record in records)
+        base_rows.extend(serialize_base_record(base) for base in base_records)
+        published_rows.extend(map(published_row, records, record_lines))
+        mapping += mapped - started
+        serialization += time.perf_counter() - mapped
+
+    started = time.perf_counter()
+    data = b""
+    shard_data: list[bytes] = []
+    shard_counts: list[int] = []
+    if _worker_shards > 0:
+        by_shard: list[list[str]] = [[] for _ in range(_worker_shards)]
+        for cn, line in zip(cns, lines, strict=True):
+            by_shard[shard_of(cn, _worker_shards)].append(line)
+        shard_data = [
+            gzip.compress("".join(chunk).encode("utf-8"), mtime=0) if chunk else b""
+            for chunk in by_shard
+        ]
+        shard_counts = [len(chunk) for chunk in by_shard]
+    elif lines:
+        data = gzip.compress("".join(lines).encode("utf-8"), mtime=0)
+    return TransformedBatch(
+        data=data,
+        medicamentos=medicamentos,
+        presentaciones=len(lines),
+        failed=failed,
+        hashes=hashes,
+        base_records=base_rows,
+        published=published_rows,
+        ranks=ranks,
+        shard_data=shard_data,
+        shard_counts=shard_counts,
+        mapping_seconds=mapping,
+        serialization_seconds=serialization,
+        compression_seconds=time.perf_counter() - started,
+    )
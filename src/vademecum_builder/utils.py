@@ -3,11 +3,21 @@ from __future__ import annotations
 import gzip
 import hashlib
 import json
+import logging
+import resource
+import sys
 from datetime import datetime, timezone
 from pathlib import Path
 from typing import TextIO
 
 
+def setup_logging(level: str) -> None:
+    logging.basicConfig(
+        level=getattr(logging, str(level).upper(), logging.INFO),
+        format="%(asctime)s | %(levelname)s | %(name)s | %(message)s",
+    )
+
+
 def ensure_dir(path: Path) -> None:
     path.mkdir(parents=True, exist_ok=True)
 
@@ -46,6 +56,12 @@ def file_size(path: Path) -> int:
     return path.stat().st_size
 
 
+def peak_rss_bytes() -> int:
+    # ru_maxrss es el pico del proceso completo (KiB en Linux, bytes en macOS).
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return int(peak if sys.platform == "darwin" else peak * 1024)
+
+
 def open_gzip_jsonl_writer(path: Path) -> TextIO:
     path.parent.mkdir(parents=True, exist_ok=True)
     return gzip.open(path, "wt", encoding="utf-8", newline="\n")
@@ -0,0 +1,404 @@
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import logging
+import lzma
+import os
+import re
+import sys
+from collections.abc import Iterator
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, BinaryIO, cast
+
+from .artifact_codecs import open_decompressor
+from .dedupe import CnSet
+from .patch import HASH_FIELD
+from .shards import shard_of
+from .utils import setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+CN_PATTERN = re.compile(r"\d{6,}")
+RECORD_FIELDS = ("cn", "nregistro", "nombre", "updated_at", "source")
+PATCH_FIELDS = ("cn", HASH_FIELD)
+# Errores detallados por fichero; a partir de aquí solo se cuentan.
+MAX_ERRORS_PER_FILE = 20
+_READ_CHUNK = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class FileCheck:
+    # kind: records (JSONL), deleted (un CN por línea), encoding (solo integridad y nº de líneas)
+    # u opaque (solo sha256 y tamaño).
+    file: str
+    kind: str
+    codec: str = "gzip"
+    sha256: str | None = None
+    size: int | None = None
+    required: tuple[str, ...] = ()
+    records: int | None = None
+    shard: tuple[int, int] | None = None
+    dictionary: str | None = None
+    collect_cns: bool = False
+    chunks: tuple[tuple[int, int, str], ...] = ()
+
+
+@dataclass
+class FileReport:
+    file: str
+    lines: int = 0
+    errors: list[str] = field(default_factory=list)
+    error_count: int = 0
+    cns: set[str] = field(default_factory=set)
+
+    def error(self, message: str) -> None:
+        self.error_count += 1
+        if len(self.errors) < MAX_ERRORS_PER_FILE:
+            self.errors.append(f"{self.file}: {message}")
+
+
+@dataclass(frozen=True)
+class VerifyReport:
+    version: str
+    files: int
+    lines: int
+    error_count: int
+    errors: list[str]
+
+    @property
+    def ok(self) -> bool:
+        return self.error_count == 0
+
+
+def verify_release(out_dir: Path, *, workers: int = 1) -> VerifyReport:
+    # Cada fichero se lee una sola vez: el mismo flujo alimenta el sha256 (bytes comprimidos) y
+    # las comprobaciones de los registros (bytes descomprimidos). Los ficheros son independientes
+    # y se reparten entre procesos; los cruces (delta/bajas, códecs) se resuelven al final.
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    checks, disjoint, same_lines = plan_checks(manifest)
+    if workers > 1 and len(checks) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(checks))) as pool:
+            reports = list(pool.map(verify_file, [out_dir] * len(checks), checks))
+    else:
+        reports = [verify_file(out_dir, check) for check in checks]
+
+    by_file = {report.file: report for report in reports}
+    cross = FileReport(file="manifest.json")
+    for data_file, deleted_file in disjoint:
+        common = by_file[data_file].cns & by_file[deleted_file].cns
+        if common:
+            cross.error(
+                f"{len(common)} CN en {data_file} y en {deleted_file} "
+                f"(p. ej. {', '.join(sorted(common)[:5])})"
+            )
+    for encoded, canonical in same_lines:
+        if by_file[encoded].lines != by_file[canonical].lines:
+            cross.error(
+                f"{encoded} tiene {by_file[encoded].lines} líneas y "
+                f"{canonical} {by_file[canonical].lines}"
+            )
+
+    reports.append(cross)
+    return VerifyReport(
+        version=str(manifest.get("version")),
+        files=len(checks),
+        lines=sum(report.lines for report in reports),
+        error_count=sum(report.error_count for report in reports),
+        errors=[message for report in reports for message in report.errors],
+    )
+
+
+def plan_checks(
+    manifest: dict[str, Any],
+) -> tuple[list[FileCheck], list[tuple[str, str]], list[tuple[str, str]]]:
+    # Devuelve las comprobaciones por fichero, los pares (datos, bajas) que no deben compartir
+    # CN y los pares (códec alternativo, gzip canónico) que deben tener las mismas líneas.
+    checks: list[FileCheck] = []
+    disjoint: list[tuple[str, str]] = []
+    same_lines: list[tuple[str, str]] = []
+    patch = manifest.get("delta_format") == "patch" and manifest.get("mode") != "full"
+
+    def add_encodings(canonical: str, encodings: list[dict[str, Any]]) -> None:
+        for entry in encodings:
+            if entry["codec"] == "gzip":
+                continue
+            checks.append(
+                FileCheck(
+                    file=entry["file"],
+                    kind="encoding",
+                    codec=entry["codec"],
+                    sha256=entry["sha256"],
+                    size=entry["size"],
+                    dictionary=entry.get("dictionary"),
+                )
+            )
+            same_lines.append((entry["file"], canonical))
+            if entry.get("dictionary"):
+                checks.append(
+                    FileCheck(
+                        file=entry["dictionary"], kind="opaque", sha256=entry["dictionary_sha256"]
+                    )
+                )
+
+    shards = manifest.get("shards") or []
+    for shard in shards:
+        checks.append(
+            FileCheck(
+                file=shard["file"],
+                kind="records",
+                sha256=shard["sha256"],
+                size=shard["size"],
+                required=RECORD_FIELDS,
+                records=shard["records"],
+                shard=(shard["index"], len(shards)),
+            )
+        )
+        add_encodings(shard["file"], shard.get("encodings") or [])
+    if not shards:
+        deleted_file = manifest.get("deleted_file")
+        checks.append(
+            FileCheck(
+                file=manifest["file"],
+                kind="records",
+                sha256=manifest["sha256"],
+                size=manifest["size"],
+                required=PATCH_FIELDS if patch else RECORD_FIELDS,
+                collect_cns=deleted_file is not None,
+                chunks=tuple(
+                    (chunk["offset"], chunk["size"], chunk["sha256"])
+                    for chunk in manifest.get("chunks") or []
+                ),
+            )
+        )
+        add_encodings(manifest["file"], manifest.get("encodings") or [])
+        if deleted_file:
+            checks.append(FileCheck(file=deleted_file, kind="deleted", collect_cns=True))
+            disjoint.append((manifest["file"], deleted_file))
+
+    for catchup in manifest.get("catchup") or []:
+        checks.append(
+            FileCheck(
+                file=catchup["file"],
+                kind="records",
+                sha256=catchup["sha256"],
+                size=catchup["size"],
+                required=(
+                    PATCH_FIELDS if catchup.get("delta_format") == "patch" else RECORD_FIELDS
+                ),
+                records=catchup["upserts"],
+                collect_cns=True,
+            )
+        )
+        checks.append(
+            FileCheck(
+                file=catchup["deleted_file"],
+                kind="deleted",
+                records=catchup["deletes"],
+                collect_cns=True,
+            )
+        )
+        disjoint.append((catchup["file"], catchup["deleted_file"]))
+
+    for profile in manifest.get("profiles") or []:
+        profile_deleted = profile.get("deleted_file")
+        checks.append(
+            FileCheck(
+                file=profile["file"],
+                kind="records",
+                codec=profile.get("codec", "gzip"),
+                sha256=profile["sha256"],
+                size=profile["size"],
+                required=("cn",),
+                records=profile["records"],
+                collect_cns=profile_deleted is not None,
+            )
+        )
+        if profile_deleted:
+            checks.append(
+                FileCheck(
+                    file=profile_deleted,
+                    kind="deleted",
+                    records=profile.get("deletes"),
+                    collect_cns=True,
+                )
+            )
+            disjoint.append((profile["file"], profile_deleted))
+
+    for index in manifest.get("indexes") or []:
+        checks.append(
+            FileCheck(file=index["file"], kind="opaque", sha256=index["sha256"], size=index["size"])
+        )
+    return checks, disjoint, same_lines
+
+
+def verify_file(out_dir: Path, check: FileCheck) -> FileReport:
+    report = FileReport(file=check.file)
+    path = out_dir / check.file
+    if not path.is_file():
+        report.error("no existe")
+        return report
+    chunks = check.chunks
+    if chunks and any(
+        offset != sum(size for _, size, _ in chunks[:position])
+        for position, (offset, _, _) in enumerate(chunks)
+    ):
+        report.error("los chunks del manifest no son contiguos")
+        chunks = ()
+    try:
+        with path.open("rb") as handle:
+            tee = _HashingReader(handle, chunks, report)
+            if check.kind != "opaque":
+                dictionary = (out_dir / check.dictionary).read_bytes() if check.dictionary else None
+                with open_decompressor(cast(BinaryIO, tee), check.codec, dictionary) as stream:
+                    _check_lines(_lines(stream), check, report)
+            tee.drain()
+    except (OSError, EOFError, lzma.LZMAError, ValueError) as exc:
+        # gzip/xz/zstd truncados o corruptos; el recuento de líneas queda incompleto.
+        report.error(f"fichero ilegible: {exc}")
+        return report
+
+    if check.sha256 is not None and tee.sha.hexdigest() != check.sha256:
+        report.error("sha256 distinto del manifest")
+    if check.size is not None and tee.size != check.size:
+        report.error(f"tamaño {tee.size} distinto del manifest ({check.size})")
+    if chunks and tee.size != sum(size for _, size, _ in chunks):
+        report.error("los chunks no cubren el fichero completo")
+    if check.records is not None and report.lines != check.records:
+        report.error(f"{report.lines} líneas y el manifest anuncia {check.records}")
+    return report
+
+
+def _check_lines(lines: Iterator[bytes], check: FileCheck, report: FileReport) -> None:
+    seen = CnSet()
+    for number, line in enumerate(lines, start=1):
+        report.lines += 1
+        if check.kind == "encoding":
+            continue
+        cn: Any
+        if check.kind == "deleted":
+            cn = line.decode("utf-8", "replace").strip()
+        else:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                report.error(f"línea {number}: JSON inválido")
+                continue
+            if not isinstance(record, dict):
+                report.error(f"línea {number}: no es un objeto JSON")
+                continue
+            missing = [name for name in check.required if name not in record]
+            if missing:
+                report.error(f"línea {number}: faltan campos {', '.join(missing)}")
+            cn = record.get("cn")
+        if not isinstance(cn, str) or not CN_PATTERN.fullmatch(cn):
+            report.error(f"línea {number}: CN con formato inválido {cn!r}")
+            continue
+        if not seen.add(cn):
+            report.error(f"línea {number}: CN {cn} duplicado")
+        if check.shard is not None and shard_of(cn, check.shard[1]) != check.shard[0]:
+            report.error(f"línea {number}: CN {cn} no pertenece al shard {check.shard[0]}")
+        if check.collect_cns:
+            report.cns.add(cn)
+
+
+def _lines(stream: BinaryIO) -> Iterator[bytes]:
+    pending = b""
+    for block in iter(lambda: stream.read(_READ_CHUNK), b""):
+        *complete, pending = (pending + block).split(b"\n")
+        yield from (line for line in complete if line.strip())
+    if pending.strip():
+        yield pending
+
+
+class _HashingReader:
+    # Envuelve el fichero comprimido: todo lo que lee el descompresor pasa por el sha256 del
+    # fichero y por el del chunk en curso.
+    def __init__(
+        self,
+        handle: BinaryIO,
+        chunks: tuple[tuple[int, int, str], ...],
+        report: FileReport,
+    ) -> None:
+        self._handle = handle
+        self._chunks = chunks
+        self._report = report
+        self._chunk = 0
+        self._chunk_sha = hashlib.sha256()
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._handle.read(size)
+        self.sha.update(data)
+        if self._chunks:
+            self._feed_chunks(data)
+        self.size += len(data)
+        return data
+
+    def readable(self) -> bool:
+        return True
+
+    def drain(self) -> None:
+        while self.read(_READ_CHUNK):
+            pass
+
+    def _feed_chunks(self, data: bytes) -> None:
+        # Los chunks son contiguos desde el offset 0 (comprobado antes de leer).
+        position = self.size
+        view = memoryview(data)
+        while view and self._chunk < len(self._chunks):
+            offset, size, sha = self._chunks[self._chunk]
+            take = min(len(view), offset + size - position)
+            self._chunk_sha.update(view[:take])
+            position += take
+            view = view[take:]
+            if position == offset + size:
+                if self._chunk_sha.hexdigest() != sha:
+                    self._report.error(f"sha256 distinto en el chunk de offset {offset}")
+                self._chunk += 1
+                self._chunk_sha = hashlib.sha256()
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder verify",
+        description=(
+            "Comprueba los artefactos que describe manifest.json antes de publicarlos: "
+            "integridad, sha256 y tamaño, registros JSON, formato y unicidad de CN, y que el "
+            "delta y la lista de bajas no compartan CN."
+        ),
+    )
+    parser.add_argument("--out-dir", default=None, help="Por defecto OUT_DIR o ./out.")
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Procesos para verificar ficheros en paralelo. Por defecto, nº de CPUs.",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    out_dir = Path(args.out_dir or os.getenv("OUT_DIR") or "./out").resolve()
+    try:
+        report = verify_release(out_dir, workers=max(args.workers, 1))
+    except (OSError, ValueError, KeyError) as exc:
+        LOGGER.error("No se puede verificar %s: %s", out_dir, exc)
+        return 2
+
+    sys.stdout.write(
+        json.dumps({**asdict(report), "ok": report.ok}, ensure_ascii=False, indent=2) + "\n"
+    )
+    if not report.ok:
+        LOGGER.error("Verificación fallida: %s errores", report.error_count)
+        return 1
+    LOGGER.info("Verificación correcta: %s ficheros, %s líneas", report.files, report.lines)
+    return 0
@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import argparse
+import logging
+import signal
+import threading
+import time
+from dataclasses import replace
+from datetime import datetime, timezone
+from types import FrameType
+
+from .archive import open_archive
+from .build_full import run_full_build
+from .build_incremental import WarmResources, run_delta_build
+from .cima_client import CimaClient
+from .config import BuildMode, Settings
+from .nomenclator_loader import NomenclatorData, load_nomenclator
+from .state import load_state
+from .utils import setup_logging
+
+LOGGER = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_SECONDS = 300
+DEFAULT_NOMENCLATOR_REFRESH_SECONDS = 3600
+DEFAULT_MAX_CONSECUTIVE_FAILURES = 5
+
+
+def micro_version(now: datetime | None = None) -> str:
+    # Marca de tiempo UTC apta para nombres de fichero que ordena después de la fecha del día.
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%dT%H%M%SZ")
+
+
+def run_watch(
+    settings: Settings,
+    *,
+    interval: int,
+    max_cycles: int | None = None,
+    stop: threading.Event | None = None,
+    nomenclator_refresh: int = DEFAULT_NOMENCLATOR_REFRESH_SECONDS,
+    max_consecutive_failures: int = DEFAULT_MAX_CONSECUTIVE_FAILURES,
+) -> int:
+    # Proceso residente: la sesión HTTP (con su pool de conexiones) y el nomenclátor ya parseado
+    # se reutilizan en cada sondeo del registroCambios, que publica un micro-delta con su manifest.
+    stop = stop or threading.Event()
+    prior_state = load_state(settings.state_path)
+    if prior_state is None or not prior_state.last_incremental_date:
+        LOGGER.warning("state.json ausente o inválido. Se hará un FULL antes de vigilar.")
+        status = run_full_build(settings)
+        if status != 0:
+            return status
+
+    warm = WarmResources(
+        client=CimaClient(
+            base_url=settings.cima_base_url,
+            timeout=settings.http_timeout,
+            max_retries=settings.http_max_retries,
+            archive=open_archive(settings.archive_dir),
+            replay=open_archive(settings.replay_dir),
+        ),
+        nomenclator=_load_nomenclator(settings),
+    )
+    nomenclator_loaded = time.monotonic()
+    LOGGER.info("WATCH iniciado intervalo=%ss", interval)
+
+    cycles = failures = consecutive = 0
+    while not stop.is_set() and (max_cycles is None or cycles < max_cycles):
+        started = time.monotonic()
+        if started - nomenclator_loaded >= nomenclator_refresh:
+            warm = _refresh_nomenclator(settings, warm)
+            nomenclator_loaded = started
+        version = micro_version()
+        try:
+            failed = run_delta_build(replace(settings, version=version), rolling=False, warm=warm)
+        except Exception as exc:
+            # Un sondeo fallido no detiene el proceso: el siguiente vuelve a pedir el mismo día.
+            LOGGER.exception("Error en el micro-delta version=%s: %s", version, exc)
+            failed = 1
+        cycles += 1
+        if failed:
+            failures += 1
+            consecutive += 1
+            if consecutive >= max_consecutive_failures:
+                LOGGER.error(
+                    "WATCH detenido tras %s sondeos fallidos seguidos (ciclos=%s)",
+                    consecutive,
+                    cycles,
+                )
+                return 1
+        else:
+            consecutive = 0
+        if max_cycles is not None and cycles >= max_cycles:
+            break
+        stop.wait(max(interval - (time.monotonic() - started), 0))
+
+    LOGGER.info("WATCH detenido ciclos=%s fallidos=%s", cycles, failures)
+    # Si ningún sondeo salió bien, el proceso no ha publicado nada útil.
+    return 1 if cycles and failures == cycles else 0
+
+
+def _load_nomenclator(settings: Settings) -> NomenclatorData | None:
+    return load_nomenclator(
+        url=settings.nomenclator_url,
+        path=settings.nomenclator_path,
+        out_dir=settings.out_dir,
+        timeout=settings.http_timeout,
+    )
+
+
+def _refresh_nomenclator(settings: Settings, warm: WarmResources) -> WarmResources:
+    # Si la recarga falla se conserva el nomenclátor anterior en lugar de publicar sin precios.
+    try:
+        nomenclator = _load_nomenclator(settings)
+    except Exception as exc:
+        LOGGER.warning("Falló la recarga del nomenclátor (%s). Se mantiene el anterior.", exc)
+        return warm
+    if nomenclator is None and warm.nomenclator is not None:
+        LOGGER.warning("Recarga del nomenclátor sin datos. Se mantiene el anterior.")
+        return warm
+    previous_ref = warm.nomenclator.source_ref if warm.nomenclator else "none"
+    current_ref = nomenclator.source_ref if nomenclator else "none"
+    if current_ref == previous_ref:
+        return warm
+    LOGGER.info("Nomenclátor actualizado %s -> %s", previous_ref, current_ref)
+    return replace(warm, nomenclator=nomenclator)
+
+
+def _build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="vademecum_builder watch",
+        description=(
+            "Proceso residente: sondea el registroCambios cada intervalo y publica micro-deltas "
+            "con marca de tiempo y el manifest actualizado."
+        ),
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=DEFAULT_INTERVAL_SECONDS,
+        help=f"Segundos entre sondeos. Por defecto: {DEFAULT_INTERVAL_SECONDS}",
+    )
+    parser.add_argument(
+        "--max-cycles",
+        type=int,
+        default=None,
+        help="Termina tras N sondeos. Por defecto, hasta recibir SIGTERM o SIGINT.",
+    )
+    parser.add_argument(
+        "--nomenclator-refresh",
+        type=int,
+        default=DEFAULT_NOMENCLATOR_REFRESH_SECONDS,
+        help=(
+            "Segundos entre recargas del nomenclátor. "
+            f"Por defecto: {DEFAULT_NOMENCLATOR_REFRESH_SECONDS}"
+        ),
+    )
+    parser.add_argument(
+        "--max-failures",
+        type=int,
+        default=DEFAULT_MAX_CONSECUTIVE_FAILURES,
+        help=(
+            "Termina con código 1 tras N sondeos fallidos seguidos. "
+            f"Por defecto: {DEFAULT_MAX_CONSECUTIVE_FAILURES}"
+        ),
+    )
+    parser.add_argument("--out-dir", default=None, help="Por defecto OUT_DIR o ./out.")
+    parser.add_argument(
+        "--state-path",
+        default=None,
+        help="Ruta de state. Por defecto STATE_PATH o <out-dir>/state.json.",
+    )
+    parser.add_argument("--log-level", default="INFO")
+    return parser
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = _build_parser().parse_args(argv)
+    setup_logging(args.log_level)
+
+    try:
+        if args.interval <= 0:
+            raise ValueError("--interval debe ser > 0")
+        if args.nomenclator_refresh <= 0:
+            raise ValueError("--nomenclator-refresh debe ser > 0")
+        if args.max_failures <= 0:
+            raise ValueError("--max-failures debe ser > 0")
+        settings = Settings.from_sources(
+            cli_mode=BuildMode.INCREMENTAL.value,
+            cli_version=None,
+            cli_out_dir=args.out_dir,
+            cli_state_path=args.state_path,
+        )
+    except ValueError as exc:
+        LOGGER.error("Configuración inválida: %s", exc)
+        return 2
+
+    stop = threading.Event()
+
+    def _request_stop(signum: int, frame: FrameType | None) -> None:
+        LOGGER.info("Señal %s recibida; se termina tras el sondeo en curso.", signum)
+        stop.set()
+
+    signal.signal(signal.SIGTERM, _request_stop)
+    signal.signal(signal.SIGINT, _request_stop)
+    return run_watch(
+        settings,
+        interval=args.interval,
+        max_cycles=args.max_cycles,
+        stop=stop,
+        nomenclator_refresh=args.nomenclator_refresh,
+        max_consecutive_failures=args.max_failures,
+    )
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import copy
+import json
+from collections.abc import Callable, Iterator, Mapping
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+from vademecum_builder import build_full
+from vademecum_builder.config import BuildMode, Settings
+from vademecum_builder.nomenclator_loader import NomenclatorData
+
+
+class FakeCimaClient:
+    # Cliente CIMA en memoria: lista los nregistro de `payloads` en orden y devuelve su detalle.
+    # El payload se lee en cada llamada, así que un test puede cambiarlo entre dos builds.
+    def __init__(self, payloads: Mapping[str, dict[str, Any]]) -> None:
+        self.payloads = payloads
+
+    def iter_medicamentos(self) -> Iterator[dict[str, str]]:
+        for nregistro in self.payloads:
+            yield {"nregistro": nregistro}
+
+    def get_medicamento(self, nregistro: str) -> dict[str, Any]:
+        return copy.deepcopy(self.payloads[nregistro])
+
+    def get_medicamento_raw(self, nregistro: str) -> bytes:
+        return json.dumps(self.payloads[nregistro]).encode("utf-8")
+
+
+def settings(out_dir: Path, **overrides: Any) -> Settings:
+    values: dict[str, Any] = {
+        "mode": BuildMode.FULL,
+        "out_dir": out_dir,
+        "version": "2026-02-15",
+        "nomenclator_url": None,
+        "nomenclator_path": None,
+        "http_timeout": 5,
+        "http_max_retries": 0,
+        "state_path": out_dir / "state.json",
+        "max_error_ids": 10,
+    }
+    values.update(overrides)
+    return Settings(**values)
+
+
+@pytest.fixture
+def make_settings() -> Callable[..., Settings]:
+    return settings
+
+
+@pytest.fixture
+def fake_cima(monkeypatch: pytest.MonkeyPatch) -> Callable[..., None]:
+    # Sustituye el cliente CIMA y el nomenclátor del FULL.
+    def install(
+        payloads: Mapping[str, dict[str, Any]],
+        nomenclator: NomenclatorData | None = None,
+    ) -> None:
+        monkeypatch.setattr(
+            build_full, "CimaClient", lambda *args, **kwargs: FakeCimaClient(payloads)
+        )
+        monkeypatch.setattr(build_full, "load_nomenclator", lambda **kwargs: nomenclator)
+
+    return install
@@ -0,0 +1,123 @@
+from __future__ import annotations
+
+import gzip
+import json
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from vademecum_builder.apply import apply_manifest
+from vademecum_builder.patch import record_hash
+from vademecum_builder.utils import sha256_file
+
+
+def _record(cn: str, precio: float) -> dict[str, object]:
+    return {
+        "cn": cn,
+        "nregistro": f"n{cn}",
+        "nombre": f"Med {cn}",
+        "lab": "Lab",
+        "atc": ["A01"],
+        "forma": None,
+        "via": "Oral",
+        "docs": {"ft": None, "pros": None},
+        "financiado": True,
+        "precio": precio,
+        "updated_at": "2026-01-01",
+        "source": "CIMA",
+    }
+
+
+def _publish(
+    out: Path,
+    version: str,
+    mode: str,
+    rows: list[dict[str, object]],
+    deleted=(),
+    previous: str | None = None,
+) -> Path:
+    out.mkdir(parents=True, exist_ok=True)
+    data = out / f"{mode}_{version}.jsonl.gz"
+    with gzip.open(data, "wt", encoding="utf-8") as handle:
+        handle.writelines(json.dumps(row) + "\n" for row in rows)
+    manifest: dict[str, object] = {
+        "version": version,
+        "mode": mode,
+        "file": data.name,
+        "sha256": sha256_file(data),
+    }
+    if mode == "incremental":
+        manifest["previous_version"] = previous
+        deleted_file = out / f"deleted_{version}.txt.gz"
+        with gzip.open(deleted_file, "wt", encoding="utf-8") as handle:
+            handle.writelines(f"{cn}\n" for cn in deleted)
+        manifest["deleted_file"] = deleted_file.name
+    path = out / "manifest.json"
+    path.write_text(json.dumps(manifest), encoding="utf-8")
+    return path
+
+
+def _rows(db: Path) -> dict[str, tuple[object, ...]]:
+    with sqlite3.connect(db) as conn:
+        rows = conn.execute("SELECT cn, precio, nombre FROM presentaciones").fetchall()
+        version = conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+    return {"version": version, **{row[0]: row[1:] for row in rows}}
+
+
+def test_apply_full_then_patch_delta(tmp_path) -> None:
+    db = tmp_path / "client.sqlite"
+    full = [_record("100001", 10.0), _record("100002", 20.0)]
+    result = apply_manifest(db, _publish(tmp_path / "v1", "2026-01-01", "full", full))
+    assert result is not None and result.upserts == 2
+
+    patch = [{"cn": "100001", "hash": record_hash(_record("100001", 11.0)), "precio": 11.0}]
+    manifest = _publish(
+        tmp_path / "v2", "2026-01-08", "incremental", patch, ["100002"], previous="2026-01-01"
+    )
+    result = apply_manifest(db, manifest)
+    assert result is not None and (result.upserts, result.deletes) == (1, 1)
+
+    assert _rows(db) == {"version": "2026-01-08", "100001": (11.0, "Med 100001")}
+    assert apply_manifest(db, manifest) is None
+
+
+def test_apply_rolls_back_on_sha_mismatch(tmp_path) -> None:
+    db = tmp_path / "client.sqlite"
+    apply_manifest(db, _publish(tmp_path / "v1", "2026-01-01", "full", [_record("100001", 10.0)]))
+
+    manifest = _publish(
+        tmp_path / "v2",
+        "2026-01-08",
+        "incremental",
+        [_record("100001", 99.0)],
+        previous="2026-01-01",
+    )
+    raw = json.loads(manifest.read_text(encoding="utf-8"))
+    manifest.write_text(json.dumps({**raw, "sha256": "0" * 64}), encoding="utf-8")
+
+    with pytest.raises(ValueError, match="sha256"):
+        apply_manifest(db, manifest)
+    assert _rows(db) == {"version": "2026-01-01", "100001": (10.0, "Med 100001")}
+
+
+def test_apply_requires_a_full_when_versions_were_skipped(tmp_path) -> None:
+    db = tmp_path / "client.sqlite"
+    apply_manifest(db, _publish(tmp_path / "v1", "2026-01-01", "full", [_record("100001", 10.0)]))
+
+    # El delta parte de 2026-01-08 y no hay puesta al día desde 2026-01-01.
+    skipped = _publish(
+        tmp_path / "v3",
+        "2026-01-15",
+        "incremental",
+        [_record("100001", 12.0)],
+        previous="2026-01-08",
+    )
+    with pytest.raises(ValueError, match="artefacto full"):
+        apply_manifest(db, skipped)
+
+    orphan = [{"cn": "100009", "hash": "0" * 16, "precio": 5.0}]
+    manifest = _publish(tmp_path / "v2", "2026-01-08", "incremental", orphan, previous="2026-01-01")
+    with pytest.raises(ValueError, match="100009"):
+        apply_manifest(db, manifest)
+    assert _rows(db) == {"version": "2026-01-01", "100001": (10.0, "Med 100001")}
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import gzip
+from dataclasses import replace
+
+import pytest
+
+from vademecum_builder.archive import ArchiveMissError, ResponseArchive
+from vademecum_builder.build_full import run_full_build
+from vademecum_builder.standin import StandinConfig, StandinServer
+
+
+def test_archive_returns_latest_response(tmp_path) -> None:
+    archive = ResponseArchive(tmp_path / "archive")
+    archive.put("/medicamento", {"nregistro": "1"}, b'{"v": 1}')
+    archive.put("/medicamento", {"nregistro": "1"}, b'{"v": 2}')
+
+    reopened = ResponseArchive(tmp_path / "archive")
+    assert reopened.get("/medicamento", {"nregistro": "1"}) == b'{"v": 2}'
+    assert len(reopened) == 1
+    with pytest.raises(ArchiveMissError):
+        reopened.get("/medicamento", {"nregistro": "2"})
+
+
+def test_replay_rebuilds_full_without_network(tmp_path, make_settings) -> None:
+    settings = make_settings(tmp_path / "live", archive_dir=tmp_path / "archive")
+    with StandinServer(StandinConfig(size=12, page_size=5)) as server:
+        assert run_full_build(replace(settings, cima_base_url=server.url)) == 0
+
+    # El servidor ya está parado: cualquier petición real fallaría.
+    replayed = make_settings(
+        tmp_path / "replay", cima_base_url=server.url, replay_dir=tmp_path / "archive"
+    )
+    assert run_full_build(replayed) == 0
+
+    def read(path):
+        with gzip.open(path / "vademecum_full.jsonl.gz", "rt", encoding="utf-8") as handle:
+            return handle.read()
+
+    assert read(replayed.out_dir) == read(settings.out_dir)
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import gzip
+import json
+import lzma
+
+import pytest
+
+from vademecum_builder import artifact_codecs, build_full
+from vademecum_builder.artifact_codecs import dictionary_path, parse_codecs, write_encodings
+from vademecum_builder.metrics import BuildMetrics
+from vademecum_builder.profiles import OutputProfile
+from vademecum_builder.utils import sha256_file
+
+_PAYLOADS = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "presentaciones": [{"cn": f"{nregistro}01"}, {"cn": f"{nregistro}02"}],
+    }
+    for nregistro in ("1001", "1002")
+}
+_OPTIONS = {
+    "version": "2026-03-08",
+    "output_codecs": ("gzip", "xz"),
+    "profiles": (OutputProfile(name="lite", fields=("cn", "nombre"), codec="xz"),),
+}
+
+
+@pytest.mark.parametrize("shards", [0, 2])
+def test_full_build_lists_every_encoding(tmp_path, fake_cima, make_settings, shards) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    assert build_full.run_full_build(make_settings(out_dir, **_OPTIONS, full_shards=shards)) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    artifacts = manifest.get("shards") or [manifest]
+    for artifact in artifacts:
+        gzip_entry, xz_entry = artifact["encodings"]
+        assert gzip_entry == {
+            "codec": "gzip",
+            "file": artifact["file"],
+            "sha256": artifact["sha256"],
+            "size": artifact["size"],
+        }
+        xz_path = out_dir / xz_entry["file"]
+        assert xz_entry["codec"] == "xz"
+        assert xz_path.suffix == ".xz"
+        assert xz_entry["sha256"] == sha256_file(xz_path)
+        assert xz_entry["size"] == xz_path.stat().st_size
+        assert lzma.decompress(xz_path.read_bytes()) == gzip.decompress(
+            (out_dir / artifact["file"]).read_bytes()
+        )
+
+    profile = manifest["profiles"][0]
+    assert profile["codec"] == "xz"
+    assert profile["file"] == "vademecum_lite_full.jsonl.xz"
+    lines = lzma.decompress((out_dir / profile["file"]).read_bytes()).decode().splitlines()
+    assert len(lines) == profile["records"] == 4
+
+
+def test_zstd_encoding_round_trips_with_its_dictionary(tmp_path) -> None:
+    zstandard = pytest.importorskip("zstandard")
+    source = tmp_path / "vademecum_full.jsonl.gz"
+    lines = "".join(
+        f'{{"cn":"{index:06d}","nombre":"Medicamento {index % 97}","source":"CIMA"}}\n'
+        for index in range(5000)
+    )
+    source.write_bytes(gzip.compress(lines.encode(), mtime=0))
+
+    (entry,) = write_encodings(source, parse_codecs("zstd"), metrics=BuildMetrics())
+
+    assert entry["file"] == "vademecum_full.jsonl.zst"
+    dictionary = zstandard.ZstdCompressionDict((tmp_path / entry["dictionary"]).read_bytes())
+    decompressor = zstandard.ZstdDecompressor(dict_data=dictionary)
+    with (tmp_path / entry["file"]).open("rb") as handle:
+        assert decompressor.stream_reader(handle).read() == lines.encode()
+
+
+def test_zstd_without_dictionary_removes_the_previous_one(tmp_path, monkeypatch) -> None:
+    pytest.importorskip("zstandard")
+    source = tmp_path / "vademecum_full.jsonl.gz"
+    source.write_bytes(gzip.compress(b'{"cn":"000001"}\n', mtime=0))
+    dictionary_path(source).write_bytes(b"diccionario anterior")
+    monkeypatch.setattr(artifact_codecs, "_train_dictionary", lambda head: None)
+
+    (entry,) = write_encodings(source, parse_codecs("zstd"), metrics=BuildMetrics())
+
+    assert "dictionary" not in entry
+    assert not dictionary_path(source).exists()
+
+
+def test_parse_codecs_keeps_gzip_first_and_rejects_unknown() -> None:
+    assert parse_codecs("xz") == ("gzip", "xz")
+    assert parse_codecs("xz, gzip") == ("gzip", "xz")
+    with pytest.raises(ValueError):
+        parse_codecs("brotli")
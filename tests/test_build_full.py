@@ -2,10 +2,14 @@ from __future__ import annotations
 
 import gzip
 import json
+from dataclasses import replace
 from pathlib import Path
 
 from vademecum_builder import build_full
 from vademecum_builder.config import BuildMode, Settings
+from vademecum_builder.freshness import FRESHNESS_FILE, FreshnessStore
+from vademecum_builder.shards import shard_of
+from vademecum_builder.utils import sha256_file
 
 
 class _FakeCimaClient:
@@ -29,6 +33,22 @@ class _FakeCimaClient:
         }
 
 
+_PAYLOADS = {
+    "1001": {
+        "nombre": "Medicamento Test",
+        "presentaciones": [{"cn": "12345"}, {"codigoNacional": "678901"}],
+    },
+}
+
+
+class _FlakyPayloads(dict[str, dict[str, object]]):
+    # 1002 sigue en el listado pero su detalle falla.
+    def __getitem__(self, nregistro: str) -> dict[str, object]:
+        if nregistro == "1002":
+            raise RuntimeError("HTTP 500")
+        return super().__getitem__(nregistro)
+
+
 def _read_gzip_jsonl(path: Path) -> list[dict[str, object]]:
     rows: list[dict[str, object]] = []
     with gzip.open(path, "rt", encoding="utf-8") as handle:
@@ -73,3 +93,69 @@ def test_run_full_build_generates_files(tmp_path, monkeypatch) -> None:
     manifest = json.loads(manifest_file.read_text(encoding="utf-8"))
     assert manifest["mode"] == "full"
     assert manifest["stats"]["presentaciones_emitidas"] == 2
+
+
+def test_run_full_build_with_process_pool_matches_serial(
+    tmp_path, fake_cima, make_settings
+) -> None:
+    fake_cima(_PAYLOADS)
+
+    serial = make_settings(tmp_path / "serial")
+    pooled = make_settings(tmp_path / "pooled", transform_workers=2)
+    assert build_full.run_full_build(serial) == 0
+    assert build_full.run_full_build(pooled) == 0
+
+    assert _read_gzip_jsonl(pooled.out_dir / "vademecum_full.jsonl.gz") == _read_gzip_jsonl(
+        serial.out_dir / "vademecum_full.jsonl.gz"
+    )
+    manifest = json.loads((pooled.out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["stats"]["medicamentos_procesados"] == 1
+    assert manifest["stats"]["presentaciones_emitidas"] == 2
+
+
+def test_run_full_build_sharded_output(tmp_path, fake_cima, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, full_shards=3)
+    fake_cima(_PAYLOADS)
+    # Full sin particionar de una ejecución anterior.
+    assert build_full.run_full_build(replace(settings, full_shards=0)) == 0
+    assert (out_dir / "vademecum_full.jsonl.gz").exists()
+
+    assert build_full.run_full_build(settings) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["layout"] == "sharded"
+    assert (manifest["file"], manifest["sha256"], manifest["size"]) == (None, None, None)
+    shards = manifest["shards"]
+    assert [shard["file"] for shard in shards] == [
+        f"vademecum_full-{index:03d}-of-003.jsonl.gz" for index in range(3)
+    ]
+    cns: list[object] = []
+    for shard in shards:
+        path = out_dir / shard["file"]
+        assert sha256_file(path) == shard["sha256"]
+        rows = _read_gzip_jsonl(path)
+        assert len(rows) == shard["records"]
+        assert all(shard_of(str(row["cn"]), 3) == shard["index"] for row in rows)
+        cns.extend(row["cn"] for row in rows)
+    assert sorted(cns) == ["012345", "678901"]
+    assert not (out_dir / "vademecum_full.jsonl.gz").exists()
+
+
+def test_failed_fetches_survive_the_freshness_prune(tmp_path, fake_cima, make_settings) -> None:
+    fake_cima(_FlakyPayloads({**_PAYLOADS, "1002": {}}))
+
+    for name, workers in (("serial", 0), ("pooled", 2)):
+        settings = make_settings(tmp_path / name, transform_workers=workers)
+        with FreshnessStore(settings.store_path(FRESHNESS_FILE)) as freshness:
+            freshness.mark_many_fetched(
+                [("1002", "hash-anterior"), ("1003", "retirado")], "2026-01-01T00:00:00Z"
+            )
+
+        assert build_full.run_full_build(settings) == 0
+
+        with FreshnessStore(settings.store_path(FRESHNESS_FILE)) as freshness:
+            assert freshness.content_hash("1001") is not None
+            assert freshness.content_hash("1002") == "hash-anterior"
+            assert freshness.content_hash("1003") is None
+            assert freshness.stalest(1) == ["1002"]
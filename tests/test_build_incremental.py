@@ -4,18 +4,22 @@ import gzip
 import json
 
 from vademecum_builder import build_incremental
-from vademecum_builder.cima_client import CimaChange
+from vademecum_builder.cima_client import ChangePage, CimaChange
 from vademecum_builder.config import BuildMode, Settings
+from vademecum_builder.incremental import apply_nomenclator, base_records_from_medicamento
+from vademecum_builder.nomenclator_loader import NomenclatorData, NomenclatorEntry
+from vademecum_builder.record_store import RECORDS_FILE, RecordStore, published_row
 from vademecum_builder.state import StateData
+from vademecum_builder.utils import dumps_json_line
 
 
 class _FakeCimaClientBajaFallback:
     def __init__(self, *args: object, **kwargs: object) -> None:
         pass
 
-    def get_registro_cambios(self, fecha_ddmmyyyy: str) -> list[CimaChange]:
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
         assert fecha_ddmmyyyy == "01/02/2026"
-        return [CimaChange(nregistro="2001", tipo_cambio="Baja", cn="765432")]
+        return ChangePage([CimaChange(nregistro="2001", tipo_cambio="Baja", cn="765432")])
 
     def get_medicamento(self, nregistro: str):
         raise RuntimeError(f"simulated error {nregistro}")
@@ -61,3 +65,134 @@ def test_incremental_baja_uses_cn_fallback(tmp_path, monkeypatch) -> None:
     manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
     assert manifest["mode"] == "incremental"
     assert manifest["stats"]["presentaciones_eliminadas"] == 1
+
+
+class _FakeCimaClientSinCambios:
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        pass
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        return ChangePage([])
+
+    def get_medicamento(self, nregistro: str):
+        raise AssertionError("no debe consultar CIMA")
+
+
+def _entry(*, financiado: bool, precio: float) -> NomenclatorEntry:
+    return NomenclatorEntry(
+        financiado=financiado,
+        precio=precio,
+        via_administracion=None,
+        laboratorio=None,
+    )
+
+
+def test_incremental_emits_nomenclator_price_changes_from_store(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, mode=BuildMode.INCREMENTAL)
+    previous = {
+        "111111": _entry(financiado=True, precio=10.0),
+        "222222": _entry(financiado=True, precio=5.0),
+    }
+    current = {"111111": _entry(financiado=False, precio=12.5), "222222": previous["222222"]}
+    with RecordStore(settings.store_path(RECORDS_FILE)) as store:
+        for cn in previous:
+            store.put_many(
+                base_records_from_medicamento(
+                    nregistro=f"n{cn}",
+                    med_payload={"nombre": f"Med {cn}", "presentaciones": [{"cn": cn}]},
+                    updated_at="2026-01-01",
+                )
+            )
+        store.diff_nomenclator(previous)
+
+    prior_state = StateData(
+        last_success_version="2026-02-01",
+        last_full_version="2026-01-01",
+        last_incremental_date="01/02/2026",
+        total_presentaciones_full=2,
+        stats_last_run={},
+        failed_nregistro_last_run=[],
+    )
+    monkeypatch.setattr(build_incremental, "CimaClient", _FakeCimaClientSinCambios)
+    monkeypatch.setattr(
+        build_incremental,
+        "load_nomenclator",
+        lambda **kwargs: NomenclatorData(by_cn=current, source_ref="test"),
+    )
+    monkeypatch.setattr(build_incremental, "load_state", lambda _: prior_state)
+
+    assert build_incremental.run_incremental_build(settings) == 0
+
+    with gzip.open(out_dir / "vademecum_delta_2026-02-15.jsonl.gz", "rt") as handle:
+        rows = [json.loads(line) for line in handle]
+    assert len(rows) == 1
+    assert rows[0]["cn"] == "111111"
+    assert rows[0]["precio"] == 12.5
+    assert rows[0]["financiado"] is False
+    assert rows[0]["updated_at"] == "2026-02-15"
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["stats"]["actualizadas_nomenclator"] == 1
+
+
+class _FakeCimaClientMismoContenido:
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        pass
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        return ChangePage([CimaChange(nregistro="n222222", tipo_cambio="Modificación", cn=None)])
+
+    def get_medicamento(self, nregistro: str) -> dict[str, object]:
+        return {"nombre": "Med 222222", "presentaciones": [{"cn": "222222"}]}
+
+
+def test_patch_delta_carries_only_changed_fields(tmp_path, monkeypatch, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, mode=BuildMode.INCREMENTAL, delta_format="patch")
+    previous = {"111111": _entry(financiado=True, precio=10.0)}
+    current = {"111111": _entry(financiado=True, precio=12.5)}
+    with RecordStore(settings.store_path(RECORDS_FILE)) as store:
+        for cn in ("111111", "222222"):
+            bases = base_records_from_medicamento(
+                nregistro=f"n{cn}",
+                med_payload={"nombre": f"Med {cn}", "presentaciones": [{"cn": cn}]},
+                updated_at="2026-01-01",
+            )
+            store.put_many(bases)
+            published = [apply_nomenclator(base, previous.get(cn)) for base in bases]
+            store.put_published(
+                published_row(record, dumps_json_line(record)) for record in published
+            )
+        store.diff_nomenclator(previous)
+
+    prior_state = StateData(
+        last_success_version="2026-02-01",
+        last_full_version="2026-01-01",
+        last_incremental_date="01/02/2026",
+        total_presentaciones_full=2,
+        stats_last_run={},
+        failed_nregistro_last_run=[],
+    )
+    monkeypatch.setattr(build_incremental, "CimaClient", _FakeCimaClientMismoContenido)
+    monkeypatch.setattr(
+        build_incremental,
+        "load_nomenclator",
+        lambda **kwargs: NomenclatorData(by_cn=current, source_ref="test"),
+    )
+    monkeypatch.setattr(build_incremental, "load_state", lambda _: prior_state)
+
+    assert build_incremental.run_incremental_build(settings) == 0
+
+    with gzip.open(out_dir / "vademecum_patch_2026-02-15.jsonl.gz", "rt") as handle:
+        rows = [json.loads(line) for line in handle]
+    assert len(rows) == 1
+    assert set(rows[0]) == {"cn", "hash", "precio", "updated_at"}
+    assert rows[0]["precio"] == 12.5
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["delta_format"] == "patch"
+    assert manifest["file"] == "vademecum_patch_2026-02-15.jsonl.gz"
+    assert manifest["stats"]["presentaciones_sin_cambios"] == 1
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+from vademecum_builder import build_incremental, build_rolling
+from vademecum_builder.cima_client import ChangePage, CimaChange
+from vademecum_builder.config import BuildMode
+from vademecum_builder.freshness import FRESHNESS_FILE, FreshnessStore, payload_hash
+from vademecum_builder.state import StateData
+
+
+def _payload(nregistro: str, nombre: str) -> dict[str, object]:
+    return {"nombre": nombre, "presentaciones": [{"cn": f"{nregistro}0"}]}
+
+
+_CURRENT = {
+    "3001": _payload("3001", "Sin cambios"),
+    "3002": _payload("3002", "Nombre nuevo"),
+    "3003": _payload("3003", "Pendiente"),
+    "3100": _payload("3100", "Alta"),
+}
+
+
+class _FakeCimaClient:
+    requested: list[str] = []
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        pass
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        return ChangePage([CimaChange(nregistro="3100", tipo_cambio="Alta", cn=None)])
+
+    def get_medicamento(self, nregistro: str) -> dict[str, object]:
+        self.requested.append(nregistro)
+        return _CURRENT[nregistro]
+
+
+def test_rolling_revalidates_stalest_and_publishes_only_changes(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, mode=BuildMode.ROLLING, rolling_budget=2)
+    with FreshnessStore(settings.store_path(FRESHNESS_FILE)) as store:
+        store.mark_fetched("3001", payload_hash(_CURRENT["3001"]), "2026-01-01T00:00:00Z")
+        store.mark_fetched("3002", payload_hash(_payload("3002", "Viejo")), "2026-01-02T00:00:00Z")
+        store.mark_fetched("3003", payload_hash(_CURRENT["3003"]), "2026-02-01T00:00:00Z")
+
+    prior_state = StateData(
+        last_success_version="2026-02-08",
+        last_full_version="2026-01-01",
+        last_incremental_date="08/02/2026",
+        total_presentaciones_full=3,
+        stats_last_run={},
+        failed_nregistro_last_run=[],
+    )
+    _FakeCimaClient.requested = []
+    monkeypatch.setattr(build_incremental, "CimaClient", _FakeCimaClient)
+    monkeypatch.setattr(build_incremental, "load_nomenclator", lambda **kwargs: None)
+    monkeypatch.setattr(build_incremental, "load_state", lambda _: prior_state)
+    monkeypatch.setattr(build_rolling, "load_state", lambda _: prior_state)
+
+    assert build_rolling.run_rolling_build(settings) == 0
+
+    assert _FakeCimaClient.requested == ["3100", "3001", "3002"]
+    with gzip.open(out_dir / "vademecum_delta_2026-02-15.jsonl.gz", "rt") as handle:
+        published = sorted(json.loads(line)["nregistro"] for line in handle)
+    assert published == ["3002", "3100"]
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["mode"] == "incremental"
+    assert manifest["stats"]["revalidados"] == 2
+    assert manifest["stats"]["sin_cambios"] == 1
+
+    with FreshnessStore(settings.store_path(FRESHNESS_FILE)) as store:
+        assert store.count() == 4
+        assert store.stalest(1) == ["3003"]
+
+
+class _FailingCimaClient(_FakeCimaClient):
+    # Un registro retirado sin `baja` en el registroCambios: su detalle falla siempre.
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        return ChangePage([])
+
+    def get_medicamento(self, nregistro: str) -> dict[str, object]:
+        self.requested.append(nregistro)
+        if nregistro == "3001":
+            raise RuntimeError("404")
+        return _CURRENT[nregistro]
+
+
+def test_rolling_rotates_failed_revalidations_to_the_back(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    out_dir = tmp_path / "out"
+    runs = [
+        make_settings(out_dir, mode=BuildMode.ROLLING, version=version, rolling_budget=1)
+        for version in ("2026-02-15", "2026-02-16", "2026-02-17")
+    ]
+    with FreshnessStore(runs[0].store_path(FRESHNESS_FILE)) as store:
+        store.mark_fetched("3001", payload_hash(_CURRENT["3001"]), "2026-01-01T00:00:00Z")
+        store.mark_fetched("3002", payload_hash(_CURRENT["3002"]), "2026-01-02T00:00:00Z")
+        store.mark_fetched("3003", payload_hash(_CURRENT["3003"]), "2026-01-03T00:00:00Z")
+
+    prior_state = StateData(
+        last_success_version="2026-02-08",
+        last_full_version="2026-01-01",
+        last_incremental_date="08/02/2026",
+        total_presentaciones_full=3,
+        stats_last_run={},
+        failed_nregistro_last_run=[],
+    )
+    _FailingCimaClient.requested = []
+    monkeypatch.setattr(build_incremental, "CimaClient", _FailingCimaClient)
+    monkeypatch.setattr(build_incremental, "load_nomenclator", lambda **kwargs: None)
+    monkeypatch.setattr(build_incremental, "load_state", lambda _: prior_state)
+    monkeypatch.setattr(build_rolling, "load_state", lambda _: prior_state)
+
+    for settings in runs:
+        build_rolling.run_rolling_build(settings)
+
+    assert _FailingCimaClient.requested == ["3001", "3002", "3003"]
@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+from vademecum_builder.catchup import write_catchups
+from vademecum_builder.config import BuildMode
+from vademecum_builder.metrics import BuildMetrics
+from vademecum_builder.record_store import RECORDS_FILE, RecordStore, published_row
+from vademecum_builder.utils import dumps_json_line
+
+
+def _publish(store: RecordStore, cn: str, nombre: str) -> None:
+    record = {"cn": cn, "nregistro": f"n{cn}", "nombre": nombre}
+    store.put_published([published_row(record, dumps_json_line(record))])
+
+
+def test_squashed_catchup_keeps_last_operation_per_cn(tmp_path, make_settings) -> None:
+    settings = make_settings(tmp_path / "out", mode=BuildMode.INCREMENTAL, version="2026-01-22")
+    with RecordStore(settings.store_path(RECORDS_FILE)) as store:
+        store.reset_chain("2026-01-01")
+        _publish(store, "100001", "A v1")
+        _publish(store, "100002", "B v1")
+        store.record_chain("2026-01-08", ["100001", "100002"], [])
+        _publish(store, "100003", "C v1")
+        store.record_chain("2026-01-15", ["100003"], ["100001"])
+        _publish(store, "100001", "A v2")
+        store.record_chain("2026-01-22", ["100001"], ["100002"])
+
+        entries = write_catchups(settings=settings, record_store=store, metrics=BuildMetrics())
+
+    # Desde 2026-01-15 basta el delta normal de la ejecución.
+    assert [entry["from_version"] for entry in entries] == ["2026-01-01", "2026-01-08"]
+    for entry in entries:
+        with gzip.open(settings.out_dir / entry["file"], "rt", encoding="utf-8") as handle:
+            upserts = {row["cn"]: row["nombre"] for row in map(json.loads, handle)}
+        with gzip.open(settings.out_dir / entry["deleted_file"], "rt", encoding="utf-8") as handle:
+            deletes = [line.strip() for line in handle]
+        assert upserts == {"100001": "A v2", "100003": "C v1"}
+        assert deletes == ["100002"]
+        assert (entry["upserts"], entry["deletes"]) == (2, 1)
+        assert entry["delta_format"] == "records"
+
+
+def test_catchup_retention_drops_older_versions(tmp_path, make_settings) -> None:
+    settings = make_settings(
+        tmp_path / "out", mode=BuildMode.INCREMENTAL, version="2026-01-22", catchup_retention=2
+    )
+    with RecordStore(settings.store_path(RECORDS_FILE)) as store:
+        store.reset_chain("2026-01-01")
+        for version in ("2026-01-08", "2026-01-15", "2026-01-22"):
+            store.record_chain(version, [], [])
+
+        entries = write_catchups(settings=settings, record_store=store, metrics=BuildMetrics())
+
+        assert [entry["from_version"] for entry in entries] == ["2026-01-08"]
+        assert store.chain_versions() == ["2026-01-08", "2026-01-15", "2026-01-22"]
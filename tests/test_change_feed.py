@@ -0,0 +1,121 @@
+from __future__ import annotations
+
+import pytest
+
+from vademecum_builder.change_feed import (
+    ChangeFeedError,
+    FeedCheckpoint,
+    fetch_change_feed,
+)
+from vademecum_builder.cima_client import ChangePage, CimaChange, CimaClient
+from vademecum_builder.standin import StandinConfig, StandinServer
+
+
+class _PagedFeed:
+    # Cinco filas en páginas de dos; el nregistro 1 cambia dos veces y las fechas no siguen el
+    # orden de las páginas.
+    rows = [
+        CimaChange(nregistro="1", tipo_cambio="Modificación", fecha=300),
+        CimaChange(nregistro="2", tipo_cambio="Modificación", fecha=100),
+        CimaChange(nregistro="3", tipo_cambio="Alta", fecha=400),
+        CimaChange(nregistro="4", tipo_cambio="Modificación", fecha=200),
+        CimaChange(nregistro="1", tipo_cambio="Baja", cn="100001", fecha=500),
+    ]
+
+    def __init__(self, failing: set[int]) -> None:
+        self.failing = failing
+        self.requested: list[int] = []
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        self.requested.append(page)
+        if page in self.failing:
+            raise RuntimeError(f"timeout página {page}")
+        return ChangePage(self.rows[(page - 1) * 2 : page * 2], total=5, page_size=2)
+
+
+def test_failed_window_is_retried_from_the_checkpoint(tmp_path) -> None:
+    spool_dir = tmp_path / "change_feed"
+    checkpoints: list[FeedCheckpoint] = []
+    failing = _PagedFeed(failing={3})
+    with pytest.raises(ChangeFeedError):
+        fetch_change_feed(
+            failing,
+            "01/02/2026",
+            spool_dir=spool_dir,
+            workers=2,
+            checkpoint=None,
+            on_checkpoint=checkpoints.append,
+        )
+    assert sorted(failing.requested) == [1, 2, 3, 3]
+    assert checkpoints[-1].completed == (1, 2)
+
+    feed = _PagedFeed(failing=set())
+    changes = fetch_change_feed(
+        feed,
+        "01/02/2026",
+        spool_dir=spool_dir,
+        workers=2,
+        checkpoint=checkpoints[-1],
+        on_checkpoint=checkpoints.append,
+    )
+
+    # Solo se repiten la primera página (da totalFilas) y la que faltaba.
+    assert feed.requested == [1, 3]
+    assert [(change.nregistro, change.fecha) for change in changes] == [
+        ("2", 100),
+        ("4", 200),
+        ("3", 400),
+        ("1", 500),
+    ]
+    assert changes[-1].tipo_cambio == "Baja"
+
+
+class _GrowingFeed(_PagedFeed):
+    # Entre la primera página y la tercera llega una fila nueva al principio del feed: las filas
+    # se desplazan una posición y totalFilas pasa de 5 a 6.
+    def __init__(self) -> None:
+        super().__init__(failing=set())
+        self.grown = False
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        self.requested.append(page)
+        if page == 3 and not self.grown:
+            self.grown = True
+        rows = self.rows
+        if self.grown:
+            rows = [CimaChange(nregistro="5", tipo_cambio="Alta", fecha=50), *self.rows]
+        return ChangePage(rows[(page - 1) * 2 : page * 2], total=len(rows), page_size=2)
+
+
+def test_feed_growing_mid_fetch_restarts_from_the_first_page(tmp_path) -> None:
+    feed = _GrowingFeed()
+    changes = fetch_change_feed(
+        feed,
+        "01/02/2026",
+        spool_dir=tmp_path / "change_feed",
+        workers=1,
+        checkpoint=None,
+        on_checkpoint=lambda checkpoint: None,
+    )
+
+    assert feed.requested[:3] == [1, 2, 3]
+    assert sorted(feed.requested[3:]) == [1, 2, 3]
+    assert [change.nregistro for change in changes] == ["5", "2", "4", "3", "1"]
+
+
+def test_all_pages_are_fetched_from_the_standin(tmp_path) -> None:
+    with StandinServer(StandinConfig(size=300, page_size=10, change_rate=0.2)) as server:
+        expected = [row["nregistro"] for row in server.state.changes]
+        changes = fetch_change_feed(
+            CimaClient(base_url=server.url, max_retries=0),
+            "01/02/2026",
+            spool_dir=tmp_path / "change_feed",
+            workers=4,
+            checkpoint=None,
+            on_checkpoint=lambda checkpoint: None,
+        )
+        seen = server.state.snapshot()
+
+    assert len(expected) > 20
+    assert [change.nregistro for change in changes] == expected
+    assert seen["/registroCambios 200"] == -(-len(expected) // 10)
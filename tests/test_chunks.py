@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import gzip
+import json
+from dataclasses import replace
+from pathlib import Path
+
+from vademecum_builder import build_full
+from vademecum_builder.chunks import sync_full
+from vademecum_builder.profiles import OutputProfile
+
+_PAYLOADS = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "labtitular": "Laboratorio de pruebas",
+        "formaFarmaceutica": "Comprimido recubierto con película",
+        "presentaciones": [{"cn": f"{nregistro}{suffix}"} for suffix in ("01", "02", "03")],
+    }
+    for nregistro in (str(index) for index in range(1000, 1600))
+}
+
+
+def _rows(path: Path) -> dict[str, dict[str, object]]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return {row["cn"]: row for row in map(json.loads, handle)}
+
+
+def test_second_full_reuses_unchanged_chunks(
+    tmp_path, monkeypatch, fake_cima, make_settings
+) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    dest = tmp_path / "client"
+
+    settings = make_settings(out_dir, version="2026-03-01", full_chunks=True)
+    assert build_full.run_full_build(settings) == 0
+    first = sync_full(dest, str(out_dir))
+    assert first.chunks > 3
+    assert first.reused_chunks == 0
+
+    monkeypatch.setitem(_PAYLOADS["1250"], "nombre", "Medicamento 1250 renombrado")
+    assert build_full.run_full_build(replace(settings, version="2026-03-08")) == 0
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert sum(chunk["records"] for chunk in manifest["chunks"]) == 1800
+
+    rows = _rows(out_dir / manifest["file"])
+    assert rows["125001"]["updated_at"] == "2026-03-08"
+    assert rows["100001"]["updated_at"] == "2026-03-01"
+
+    second = sync_full(dest, str(out_dir))
+    assert second.reused_chunks >= second.chunks - 2
+    assert second.downloaded_bytes < second.reused_bytes / 4
+    assert (dest / manifest["file"]).read_bytes() == (out_dir / manifest["file"]).read_bytes()
+
+
+def test_preserved_dates_survive_in_the_record_store(
+    tmp_path, fake_cima, make_settings
+) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, version="2026-03-01", full_chunks=True)
+    assert build_full.run_full_build(settings) == 0
+    assert build_full.run_full_build(replace(settings, version="2026-03-08")) == 0
+    assert build_full.run_full_build(replace(settings, version="2026-03-15")) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    rows = _rows(out_dir / manifest["file"])
+    assert {row["updated_at"] for row in rows.values()} == {"2026-03-01"}
+
+
+def test_profiles_get_the_preserved_dates_of_the_full(
+    tmp_path, monkeypatch, fake_cima, make_settings
+) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    profile = OutputProfile(name="fechas", fields=("cn", "nombre", "updated_at"))
+    settings = make_settings(out_dir, version="2026-03-01", full_chunks=True, profiles=(profile,))
+    assert build_full.run_full_build(settings) == 0
+    monkeypatch.setitem(_PAYLOADS["1250"], "nombre", "Medicamento 1250 renombrado")
+    assert build_full.run_full_build(replace(settings, version="2026-03-08")) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    full = _rows(out_dir / manifest["file"])
+    profiled = _rows(out_dir / "vademecum_fechas_full.jsonl.gz")
+    assert {cn: row["updated_at"] for cn, row in profiled.items()} == {
+        cn: row["updated_at"] for cn, row in full.items()
+    }
+    assert profiled["125001"]["updated_at"] == "2026-03-08"
+    assert profiled["100001"]["updated_at"] == "2026-03-01"
@@ -0,0 +1,116 @@
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from vademecum_builder import build_full
+from vademecum_builder.dedupe import CnSet, DuplicateResolver
+from vademecum_builder.lookup_index import lookup
+from vademecum_builder.profiles import OutputProfile
+from vademecum_builder.record_store import RecordStore
+from vademecum_builder.search_index import SEARCH_INDEX_FILE, SearchIndex
+
+# 300001 aparece en tres registros y 300002 dos veces en el mismo payload; gana el autorizado
+# y, entre autorizados, el de autorización más reciente.
+_PAYLOADS: dict[str, dict[str, object]] = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "autorizado": autorizado,
+        "estado": estado,
+        "atc": atc,
+        "presentaciones": [{"cn": cn} for cn in cns],
+    }
+    for nregistro, autorizado, estado, atc, cns in (
+        ("2001", False, None, ["A01"], ["300001", "300002", "300002"]),
+        ("2002", True, {"aut": 200}, ["B01"], ["300001"]),
+        ("2003", True, {"aut": 100}, ["C01"], ["300001"]),
+    )
+}
+_OPTIONS = {
+    "version": "2026-03-01",
+    "profiles": (OutputProfile(name="lite", fields=("cn", "nregistro")),),
+    "search_index": True,
+    "lookup_indexes": True,
+}
+
+
+def _read_cns(path: Path) -> list[tuple[str, str]]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return [(row["cn"], row["nregistro"]) for row in map(json.loads, handle)]
+
+
+@pytest.mark.parametrize(
+    "options",
+    [{}, {"transform_workers": 2}, {"full_shards": 2}, {"transform_workers": 2, "full_shards": 2}],
+)
+def test_full_build_keeps_preferred_registration_per_cn(
+    tmp_path, fake_cima, make_settings, options
+) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    assert build_full.run_full_build(make_settings(out_dir, **_OPTIONS, **options)) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["stats"]["cn_duplicados"] == 3
+    assert manifest["stats"]["presentaciones_emitidas"] == 2
+    shards = manifest.get("shards", [])
+    files = [shard["file"] for shard in shards] or [manifest["file"]]
+    rows = sorted(row for name in files for row in _read_cns(out_dir / name))
+    assert rows == [("300001", "2002"), ("300002", "2001")]
+    assert sum(shard["records"] for shard in shards) in (0, 2)
+
+    assert sorted(_read_cns(out_dir / "vademecum_lite_full.jsonl.gz")) == rows
+    assert manifest["profiles"][0]["records"] == 2
+    assert lookup(out_dir, atc="B01") == ["300001"]
+    assert lookup(out_dir, atc="A01") == ["300002"]
+    assert lookup(out_dir, atc="C01") == []
+    with SearchIndex(out_dir / SEARCH_INDEX_FILE) as index:
+        hits = index.search("medicamento", limit=10)
+    assert sorted((hit.cn, hit.nombre) for hit in hits) == [
+        ("300001", "Medicamento 2002"),
+        ("300002", "Medicamento 2001"),
+    ]
+
+
+def test_cn_set_packs_short_codes_and_keeps_long_ones() -> None:
+    cns = CnSet()
+    assert cns.add("000001")
+    assert cns.add("0000001")
+    assert not cns.add("000001")
+    assert cns.add("123456789")
+    assert not cns.add("123456789")
+    assert cns.size == 3
+
+
+def test_resolver_reads_the_current_rank_back_from_the_store(tmp_path) -> None:
+    strong = (1, 1, 200, 4, "2002")
+    weak = (0, 0, 0, 4, "2001")
+    with RecordStore(tmp_path / "records.sqlite") as store:
+        resolver = DuplicateResolver(store)
+        first = [("300001", "2002", '{"cn":"300001","nregistro":"2002"}', "h1")]
+        assert resolver.resolve(first, {"2002": strong}) == ([True], [])
+        store.put_published(first, {"2002": strong})
+
+        # El lote siguiente solo trae su propio rango: el del registro vigente sale del almacén.
+        second = [("300001", "2001", '{"cn":"300001","nregistro":"2001"}', "h2")]
+        assert resolver.resolve(second, {"2001": weak}) == ([False], [])
+        assert resolver.duplicates == 1 and resolver.superseded == 0
+
+
+@pytest.mark.parametrize("options", [{}, {"transform_workers": 2}, {"full_chunks": True}])
+def test_search_ordinals_match_lines_of_the_compacted_full(
+    tmp_path, fake_cima, make_settings, options
+) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    assert build_full.run_full_build(make_settings(out_dir, **_OPTIONS, **options)) == 0
+
+    lines = [cn for cn, _ in _read_cns(out_dir / "vademecum_full.jsonl.gz")]
+    with SearchIndex(out_dir / SEARCH_INDEX_FILE) as index:
+        assert index.docs == len(lines)
+        hits = index.search("medicamento", limit=10)
+    for hit in hits:
+        assert lines[hit.ordinal] == hit.cn
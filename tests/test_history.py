@@ -0,0 +1,59 @@
+from __future__ import annotations
+
+import json
+
+from vademecum_builder import build_full, history
+from vademecum_builder.history import RunRecord, append_run, find_regressions, load_history
+
+
+def _record(mode: str, rps: float, version: str = "2026-01-01") -> RunRecord:
+    return RunRecord(
+        finished_at="2026-01-01T00:00:00Z",
+        mode=mode,
+        version=version,
+        wall_seconds=10.0,
+        records=int(rps * 10),
+        records_per_second=rps,
+        requests=100,
+        requests_per_second=10.0,
+        bytes_out=1000,
+        peak_rss_bytes=1 << 20,
+    )
+
+
+def test_find_regressions_uses_rolling_baseline_per_mode() -> None:
+    records = [
+        _record("full", 100.0),
+        _record("incremental", 5.0),
+        _record("full", 110.0),
+        _record("full", 90.0),
+        _record("full", 60.0, version="2026-02-01"),
+        _record("incremental", 5.0),
+    ]
+    [regression] = find_regressions(records, window=5, threshold=0.25)
+    assert regression.record.version == "2026-02-01"
+    assert regression.baseline == 100.0
+    assert round(regression.drop, 2) == 0.4
+
+
+def test_builds_append_history_and_command_flags_latest(
+    tmp_path, capsys, fake_cima, make_settings
+) -> None:
+    fake_cima({})
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir)
+    assert build_full.run_full_build(settings) == 0
+
+    history_path = out_dir / "store" / "history.jsonl"
+    [stored] = load_history(history_path)
+    assert stored.mode == "full"
+    assert stored.version == "2026-02-15"
+    assert "hashing" in stored.stage_ms
+
+    for rps in (100.0, 100.0, 100.0, 10.0):
+        append_run(history_path, _record("incremental", rps))
+    code = history.main(["--out-dir", str(out_dir), "--json", "--fail-on-regression"])
+    assert code == 1
+    rows = json.loads(capsys.readouterr().out)
+    assert rows[-1]["regression"]["baseline"] == 100.0
+    assert rows[0]["regression"] is None
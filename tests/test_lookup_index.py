@@ -0,0 +1,68 @@
+from __future__ import annotations
+
+import json
+
+from vademecum_builder import build_full
+from vademecum_builder.lookup_index import (
+    ATC_INDEX_FILE,
+    LAB_INDEX_FILE,
+    LookupIndex,
+    LookupIndexBuilder,
+    lookup,
+)
+
+_PAYLOADS = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "labtitular": lab,
+        "atc": [{"codigo": code} for code in atc],
+        "presentaciones": [{"cn": cn} for cn in cns],
+    }
+    for nregistro, lab, atc, cns in (
+        ("1001", "Laboratorios Cinfa, S.A.", ["N02BE01"], ["100001", "100002"]),
+        ("1002", "Kern Pharma", ["N02BA01"], ["100003"]),
+        ("1003", "LABORATORIOS CINFA, S.A.", ["J01CR02"], ["100004"]),
+    )
+}
+
+
+def test_full_build_emits_atc_and_lab_indexes(tmp_path, fake_cima, make_settings) -> None:
+    fake_cima(_PAYLOADS)
+    out_dir = tmp_path / "out"
+    assert build_full.run_full_build(make_settings(out_dir, lookup_indexes=True)) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert [entry["kind"] for entry in manifest["indexes"]] == ["atc", "lab"]
+
+    assert lookup(out_dir, atc="N02B") == ["100001", "100002", "100003"]
+    assert lookup(out_dir, atc="n02be01") == ["100001", "100002"]
+    assert lookup(out_dir, atc="N") == ["100001", "100002", "100003"]
+    assert lookup(out_dir, lab="laboratorios cinfa s.a.") == ["100001", "100002", "100004"]
+    assert lookup(out_dir, atc="N02", lab="Laboratorios Cinfa, S.A.") == ["100001", "100002"]
+    assert lookup(out_dir, atc="A") == []
+
+
+def test_prefix_queries_union_keys_across_spilled_runs(tmp_path) -> None:
+    path = tmp_path / ATC_INDEX_FILE
+    with LookupIndexBuilder("atc", path, spill_entries=2) as builder:
+        builder.add([{"cn": "000003", "atc": ["N02BE01"]}, {"cn": "000001", "atc": ["N02BA01"]}])
+        builder.add([{"cn": "000002", "atc": ["N05BA01"]}, {"cn": "000001", "atc": ["N02BA01"]}])
+        builder.close()
+    assert [p.name for p in tmp_path.iterdir()] == [ATC_INDEX_FILE]
+
+    with LookupIndex(path) as index:
+        assert index.kind == "atc"
+        assert index.query("N0") == ["000001", "000002", "000003"]
+        assert index.query("N02BA01") == ["000001"]
+        assert index.query("") == []
+    assert not (tmp_path / LAB_INDEX_FILE).exists()
+
+
+def test_lab_normalization_folds_accents(tmp_path) -> None:
+    path = tmp_path / LAB_INDEX_FILE
+    with LookupIndexBuilder("lab", path) as builder:
+        builder.add([{"cn": "000001", "lab": "Laboratorios Viñas"}, {"cn": "000002", "lab": None}])
+        builder.close()
+    with LookupIndex(path) as index:
+        assert index.query("LABORATORIOS VIÑAS") == ["000001"]
+        assert index.query("laboratorios") == ["000001"]
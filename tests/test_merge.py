@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import gzip
+import json
+from dataclasses import replace
+from pathlib import Path
+
+from vademecum_builder import build_full, merge
+from vademecum_builder.partials import PARTIALS_DIR, Partition
+
+_PAYLOADS = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "labtitular": "Lab Test",
+        "presentaciones": [{"cn": f"{nregistro}1"}, {"cn": f"{nregistro}2"}],
+    }
+    for nregistro in (f"{1000 + index}" for index in range(8))
+}
+
+
+def _lines(path: Path) -> list[str]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return handle.readlines()
+
+
+def test_merge_of_partials_matches_single_node_build(
+    tmp_path, monkeypatch, fake_cima, make_settings
+) -> None:
+    fake_cima(_PAYLOADS)
+    monkeypatch.setattr(merge, "load_nomenclator", lambda **kwargs: None)
+
+    single = make_settings(tmp_path / "single")
+    assert build_full.run_full_build(single) == 0
+
+    distributed = make_settings(tmp_path / "distributed")
+    for index in (1, 2):
+        node = replace(distributed, partition=Partition(index=index, count=2))
+        assert build_full.run_full_build(node) == 0
+    assert not (distributed.out_dir / "manifest.json").exists()
+
+    assert merge.run_merge(distributed, distributed.out_dir / PARTIALS_DIR) == 0
+
+    expected = _lines(single.out_dir / "vademecum_full.jsonl.gz")
+    assert _lines(distributed.out_dir / "vademecum_full.jsonl.gz") == expected
+    assert len(expected) == 2 * len(_PAYLOADS)
+
+    manifest = json.loads((distributed.out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["mode"] == "full"
+    assert manifest["stats"]["medicamentos_procesados"] == len(_PAYLOADS)
+    assert manifest["stats"]["presentaciones_emitidas"] == len(expected)
+    assert (distributed.out_dir / "state.json").exists()
+
+
+def test_merge_rejects_missing_partials(tmp_path, fake_cima, make_settings) -> None:
+    fake_cima(_PAYLOADS)
+    settings = make_settings(tmp_path / "out", partition=Partition(index=1, count=3))
+    assert build_full.run_full_build(settings) == 0
+
+    code = merge.main(["--out-dir", str(settings.out_dir)])
+    assert code == 2
+    assert not (settings.out_dir / "manifest.json").exists()
+
+
+def test_merge_ignores_the_sample_limit(tmp_path, monkeypatch, fake_cima, make_settings) -> None:
+    fake_cima(_PAYLOADS)
+    monkeypatch.setattr(merge, "load_nomenclator", lambda **kwargs: None)
+    out_dir = tmp_path / "out"
+    for index in (1, 2):
+        node = make_settings(out_dir, partition=Partition(index=index, count=2))
+        assert build_full.run_full_build(node) == 0
+
+    monkeypatch.setenv("LIMIT_MEDICAMENTOS", "1")
+    assert merge.main(["--out-dir", str(out_dir)]) == 0
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["stats"]["medicamentos_procesados"] == len(_PAYLOADS)
+    assert not (out_dir / "limited").exists()
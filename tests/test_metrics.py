@@ -0,0 +1,72 @@
+from __future__ import annotations
+
+import json
+
+import pytest
+import requests
+
+from vademecum_builder.build_full import run_full_build
+from vademecum_builder.cima_client import CimaClient
+from vademecum_builder.metrics import BuildMetrics
+from vademecum_builder.standin import StandinConfig, StandinServer
+
+
+def test_full_build_exports_stage_metrics(tmp_path, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    with StandinServer(StandinConfig(size=5, page_size=10)) as server:
+        settings = make_settings(out_dir, cima_base_url=server.url)
+        assert run_full_build(settings) == 0
+
+    stats = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))["stats"]
+    assert stats["http_requests"] == 7
+    assert stats["bytes_written"] > 0
+    assert {"stage_ms_detail_fetch", "stage_ms_compression", "stage_ms_hashing"} <= set(stats)
+
+    textfile = (out_dir / "metrics" / "vademecum_builder.prom").read_text(encoding="utf-8")
+    assert (
+        'vademecum_http_request_duration_seconds_count{mode="full",endpoint="/medicamento"} 5'
+        in textfile
+    )
+    assert 'vademecum_stage_seconds_total{mode="full",stage="record_mapping"}' in textfile
+    assert "# EOF" not in textfile
+
+    # node-exporter lee el textfile con el parser clásico.
+    parser = pytest.importorskip("prometheus_client.parser")
+    families = {family.name: family for family in parser.text_string_to_metric_families(textfile)}
+    for name in ("stage_seconds", "http_requests", "http_retries", "http_throttled"):
+        assert families[f"vademecum_{name}"].type == "counter"
+    assert {family.type for family in families.values()} <= {"counter", "gauge", "histogram"}
+    requests_family = families["vademecum_http_requests"]
+    assert {sample.name for sample in requests_family.samples} == {"vademecum_http_requests_total"}
+    assert families["vademecum_http_request_duration_seconds"].type == "histogram"
+
+
+def test_openmetrics_rendering_declares_counters_without_total() -> None:
+    metrics = BuildMetrics()
+    metrics.add_stage_time("record_mapping", 0.5)
+    metrics.request_started()
+    metrics.request_finished("/medicamento", "200", 0.1)
+    metrics.record_retry("/medicamento", 429)
+    rendered = metrics.render_openmetrics({"mode": "full"})
+    assert rendered.endswith("# EOF\n")
+
+    parser = pytest.importorskip("prometheus_client.openmetrics.parser")
+    families = {family.name: family for family in parser.text_string_to_metric_families(rendered)}
+    for name in ("stage_seconds", "http_requests", "http_retries", "http_throttled"):
+        assert families[f"vademecum_{name}"].type == "counter"
+    assert {sample.name for sample in families["vademecum_stage_seconds"].samples} == {
+        "vademecum_stage_seconds_total"
+    }
+
+
+def test_client_counts_retries_and_throttling() -> None:
+    metrics = BuildMetrics()
+    with StandinServer(StandinConfig(size=1, rate_429=1.0)) as server:
+        client = CimaClient(server.url, timeout=5, max_retries=1, metrics=metrics)
+        with pytest.raises(requests.HTTPError):
+            client.get_medicamento("60000")
+
+    assert metrics.retries["/medicamento"] == 1
+    assert metrics.throttled["/medicamento"] == 1
+    assert metrics.requests[("/medicamento", "429")] == 1
+    assert metrics.in_flight == 0
@@ -0,0 +1,54 @@
+from __future__ import annotations
+
+import json
+
+from vademecum_builder import microbench
+
+
+def test_suite_reports_every_hot_path() -> None:
+    results = microbench.run_suite(200, repeat=1)
+    names = {result.name for result in results}
+    assert names == {
+        "normalize_cn",
+        "record_from_cima",
+        "_extract_atc",
+        "dumps_json_line",
+        "_parse_table",
+        "_detect_delimiter",
+        "gzip_writer",
+    }
+    assert all(result.ns_per_op > 0 for result in results)
+
+
+def test_main_fails_on_regression_against_baseline(tmp_path) -> None:
+    baseline = tmp_path / "baseline.json"
+    args = ["--scale", "200", "--only", "dumps_json_line", "--baseline", str(baseline)]
+    assert microbench.main([*args, "--repeat", "1", "--update-baseline"]) == 0
+
+    stored = json.loads(baseline.read_text(encoding="utf-8"))
+    stored["scales"]["200"]["dumps_json_line"]["ns_per_op"] = 0.001
+    baseline.write_text(json.dumps(stored), encoding="utf-8")
+    assert microbench.main([*args, "--repeat", "1"]) == 1
+
+
+def test_compare_results_respects_tolerance() -> None:
+    baseline = {"scales": {"10k": {"f": {"ns_per_op": 100.0, "alloc_bytes_per_op": 50.0}}}}
+    within = {"scales": {"10k": {"f": {"ns_per_op": 110.0, "alloc_bytes_per_op": 50.0}}}}
+    beyond = {"scales": {"10k": {"f": {"ns_per_op": 130.0, "alloc_bytes_per_op": 50.0}}}}
+
+    kwargs = {"tolerance": 0.2, "alloc_tolerance": 0.1}
+    assert microbench.compare_results(baseline, within, **kwargs) == []
+    [regression] = microbench.compare_results(baseline, beyond, **kwargs)
+    assert regression.metric == "ns_per_op"
+
+
+def test_main_fails_when_a_requested_scale_has_no_baseline(tmp_path) -> None:
+    baseline = tmp_path / "baseline.json"
+    args = ["--only", "normalize_cn", "--repeat", "1", "--baseline", str(baseline)]
+    assert microbench.main([*args, "--scale", "200", "--update-baseline"]) == 0
+
+    assert microbench.main([*args, "--scale", "300"]) == 1
+    assert microbench.missing_baselines(
+        json.loads(baseline.read_text(encoding="utf-8")),
+        {"scales": {"200": {"normalize_cn": {}, "gzip_writer": {}}}},
+    ) == ["200/gzip_writer"]
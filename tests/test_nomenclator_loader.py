@@ -1,6 +1,9 @@
 from __future__ import annotations
 
-from vademecum_builder.nomenclator_loader import load_nomenclator
+import sys
+from types import SimpleNamespace
+
+from vademecum_builder.nomenclator_loader import NomenclatorEntry, load_nomenclator
 
 
 def test_load_nomenclator_csv_without_headers(tmp_path) -> None:
@@ -10,3 +13,52 @@ def test_load_nomenclator_csv_without_headers(tmp_path) -> None:
     data = load_nomenclator(url=None, path=source, out_dir=tmp_path / "out", timeout=5)
     assert data is not None
     assert "123456" in data.by_cn
+
+
+def test_load_nomenclator_csv_with_headers(tmp_path) -> None:
+    source = tmp_path / "nomenclator.csv"
+    source.write_text(
+        "Codigo Nacional;Financiado;PVP;Laboratorio\n"
+        "123456;si;12,34;Laboratorio X\n"
+        "654321;no;;\n",
+        encoding="utf-8",
+    )
+
+    data = load_nomenclator(url=None, path=source, out_dir=tmp_path / "out", timeout=5)
+    assert data is not None
+    assert data.by_cn["123456"] == NomenclatorEntry(
+        financiado=True, precio=12.34, via_administracion=None, laboratorio="Laboratorio X"
+    )
+    assert data.by_cn["654321"].precio is None
+
+
+def test_load_nomenclator_xlsx_streams_rows(tmp_path, monkeypatch) -> None:
+    calls: dict[str, object] = {}
+
+    class _Sheet:
+        def iter_rows(self, *, values_only: bool):
+            calls["values_only"] = values_only
+            yield ("CN", "Financiado", "PVP")
+            yield (123456.0, True, 7.5)
+            yield (None, None, None)
+
+    class _Workbook:
+        worksheets = [_Sheet()]
+
+        def close(self) -> None:
+            calls["closed"] = True
+
+    def load_workbook(path, *, read_only: bool, data_only: bool):
+        calls["read_only"] = read_only
+        return _Workbook()
+
+    monkeypatch.setitem(sys.modules, "openpyxl", SimpleNamespace(load_workbook=load_workbook))
+    source = tmp_path / "nomenclator.xlsx"
+    source.write_bytes(b"")
+
+    data = load_nomenclator(url=None, path=source, out_dir=tmp_path / "out", timeout=5)
+    assert data is not None
+    assert list(data.by_cn) == ["123456"]
+    assert data.by_cn["123456"].financiado is True
+    assert data.by_cn["123456"].precio == 7.5
+    assert calls == {"read_only": True, "values_only": True, "closed": True}
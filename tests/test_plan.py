@@ -0,0 +1,84 @@
+from __future__ import annotations
+
+from vademecum_builder.cima_client import CimaClient
+from vademecum_builder.config import BuildMode
+from vademecum_builder.plan import plan_build
+from vademecum_builder.standin import StandinConfig, StandinServer
+from vademecum_builder.state import StateData, save_state
+
+
+def test_full_plan_extrapolates_from_a_sample(tmp_path, make_settings) -> None:
+    with StandinServer(StandinConfig(size=45, page_size=10)) as server:
+        settings = make_settings(
+            tmp_path / "out", cima_base_url=server.url, mode=BuildMode.FULL, transform_workers=2
+        )
+        plan = plan_build(
+            settings,
+            client=CimaClient(base_url=server.url, max_retries=0),
+            pages=1,
+            details=3,
+            nodes=2,
+        )
+        seen = server.state.snapshot()
+
+    assert plan.registrations == 45
+    assert plan.registrations_source == "totalFilas"
+    # 5 páginas con datos más la vacía que cierra el listado, recorridas por cada nodo.
+    assert plan.listing_pages == 6
+    assert plan.requests == 6 * 2 + 45
+    assert plan.download_bytes > 0
+    assert plan.peak_memory_bytes > 0
+    assert seen == {"/medicamentos 200": 1, "/medicamento 200": 3}
+    assert not settings.out_dir.exists()
+
+
+def test_incremental_plan_reads_the_change_feed(tmp_path, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    save_state(
+        out_dir / "state.json",
+        StateData(
+            last_success_version="2026-02-01",
+            last_full_version="2026-02-01",
+            last_incremental_date="01/02/2026",
+            total_presentaciones_full=0,
+            stats_last_run={},
+            failed_nregistro_last_run=[],
+        ),
+    )
+    with StandinServer(StandinConfig(size=200, page_size=50, change_rate=0.1)) as server:
+        changes = len(server.state.changes)
+        plan = plan_build(
+            make_settings(out_dir, cima_base_url=server.url, mode=BuildMode.INCREMENTAL),
+            client=CimaClient(base_url=server.url, max_retries=0),
+            details=2,
+        )
+
+    assert plan.mode == "incremental"
+    assert plan.registrations == changes > 0
+    assert plan.requests == changes + 1
+    assert plan.sample["/medicamento"]["requests"] == 2
+
+
+def test_rolling_plan_without_freshness_store_plans_a_full(tmp_path, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    save_state(
+        out_dir / "state.json",
+        StateData(
+            last_success_version="2026-02-01",
+            last_full_version="2026-02-01",
+            last_incremental_date="01/02/2026",
+            total_presentaciones_full=0,
+            stats_last_run={},
+            failed_nregistro_last_run=[],
+        ),
+    )
+    with StandinServer(StandinConfig(size=30, page_size=10)) as server:
+        plan = plan_build(
+            make_settings(out_dir, cima_base_url=server.url, mode=BuildMode.ROLLING),
+            client=CimaClient(base_url=server.url, max_retries=0),
+            pages=1,
+            details=2,
+        )
+
+    assert plan.mode == "full"
+    assert plan.registrations == 30
@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+import pytest
+
+from vademecum_builder import build_full
+from vademecum_builder.nomenclator_loader import NomenclatorData, NomenclatorEntry
+from vademecum_builder.profiles import OutputProfile, load_profiles
+
+_PAYLOADS = {
+    "1001": {
+        "nombre": "Medicamento Test",
+        "labtitular": "Lab Test",
+        "presentaciones": [{"cn": "123456"}, {"cn": "678901"}],
+    }
+}
+
+
+def _read(path: Path) -> list[dict[str, object]]:
+    with gzip.open(path, "rt", encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle]
+
+
+def test_full_build_writes_every_profile_in_one_pass(
+    tmp_path, fake_cima, make_settings
+) -> None:
+    profiles_file = tmp_path / "profiles.json"
+    profiles_file.write_text(
+        json.dumps(
+            [
+                {
+                    "name": "widget",
+                    "fields": ["cn", "nombre", "precio", "financiado"],
+                    "where": {"financiado": True},
+                },
+                {"name": "analytics", "fields": ["cn", "atc", "lab"]},
+            ]
+        ),
+        encoding="utf-8",
+    )
+    out_dir = tmp_path / "out"
+    settings = make_settings(out_dir, profiles=load_profiles(profiles_file))
+    nomenclator = NomenclatorData(
+        by_cn={"123456": NomenclatorEntry(True, 4.5, None, None)},
+        source_ref="test",
+    )
+    fake_cima(_PAYLOADS, nomenclator)
+
+    assert build_full.run_full_build(settings) == 0
+
+    assert _read(out_dir / "vademecum_widget_full.jsonl.gz") == [
+        {"cn": "123456", "nombre": "Medicamento Test", "precio": 4.5, "financiado": True}
+    ]
+    analytics = _read(out_dir / "vademecum_analytics_full.jsonl.gz")
+    assert [row["cn"] for row in analytics] == ["123456", "678901"]
+    assert set(analytics[0]) == {"cn", "atc", "lab"}
+
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert [entry["name"] for entry in manifest["profiles"]] == ["widget", "analytics"]
+    assert manifest["profiles"][0]["records"] == 1
+    assert manifest["file"] == "vademecum_full.jsonl.gz"
+
+
+def test_profile_requires_cn_and_known_fields() -> None:
+    with pytest.raises(ValueError):
+        OutputProfile.from_raw({"name": "widget", "fields": ["nombre"]})
+    with pytest.raises(ValueError):
+        OutputProfile.from_raw({"name": "widget", "fields": ["cn", "desconocido"]})
@@ -0,0 +1,74 @@
+from __future__ import annotations
+
+import threading
+import tracemalloc
+
+import pytest
+
+from vademecum_builder import __main__ as cli
+from vademecum_builder.profiling import _AllocationObserver
+from vademecum_builder.standin import StandinConfig, StandinServer
+
+
+@pytest.mark.parametrize("mode", ["cprofile", "sample"])
+def test_profile_option_writes_reports(tmp_path, monkeypatch, mode) -> None:
+    out_dir = tmp_path / "out"
+    with StandinServer(StandinConfig(size=40, page_size=10)) as server:
+        monkeypatch.setenv("CIMA_BASE_URL", server.url)
+        code = cli.main(
+            [
+                "--mode",
+                "full",
+                "--out-dir",
+                str(out_dir),
+                "--profile",
+                mode,
+                "--limit-medicamentos",
+                "15",
+            ]
+        )
+        requests_seen = server.state.snapshot()
+    assert code == 0
+    assert requests_seen["/medicamento 200"] == 15
+
+    # La muestra limitada escribe aparte y no toca la salida real.
+    assert not (out_dir / "manifest.json").exists()
+    assert not (out_dir / "state.json").exists()
+    assert (out_dir / "limited" / "manifest.json").exists()
+    profile_dir = out_dir / "limited" / "profile"
+    collapsed = (profile_dir / "stacks.collapsed").read_text(encoding="utf-8")
+    assert all(line.rsplit(" ", 1)[1].isdigit() for line in collapsed.splitlines())
+    if mode == "cprofile":
+        assert (profile_dir / "build.pstats").exists()
+        allocations = (profile_dir / "allocations.txt").read_text(encoding="utf-8")
+        assert "== record_mapping" in allocations
+        assert "== detail_fetch" in allocations
+    else:
+        assert not (profile_dir / "build.pstats").exists()
+
+
+def test_allocation_observer_nests_stages_and_ignores_other_threads() -> None:
+    observer = _AllocationObserver()
+    tracemalloc.start()
+    try:
+        observer.stage_entered("outer")
+        kept = bytearray(256 * 1024)
+        observer.stage_entered("inner")
+        buffer = bytearray(1024 * 1024)
+        del buffer
+        observer.stage_exited("inner")
+        other = threading.Thread(target=observer.stage_entered, args=("shard",))
+        other.start()
+        other.join()
+        observer.stage_exited("outer")
+    finally:
+        tracemalloc.stop()
+
+    assert set(observer.stages) == {"outer", "inner"}
+    outer, inner = observer.stages["outer"], observer.stages["inner"]
+    # El pico de la etapa externa incluye el de la interna; lo retenido, solo lo que sigue vivo.
+    assert inner.max_peak_bytes >= 1024 * 1024
+    assert outer.max_peak_bytes >= inner.max_peak_bytes
+    assert 256 * 1024 <= outer.net_bytes < 1024 * 1024
+    assert outer.sampled == inner.sampled == 1
+    assert len(kept) == 256 * 1024
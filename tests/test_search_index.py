@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+from vademecum_builder.search_index import SearchIndex, SearchIndexBuilder
+
+_NAMES = [
+    ("111111", "IBUPROFENO CINFA 400 mg comprimidos"),
+    ("222222", "Ibuprofeno 600 mg"),
+    ("333333", "PARACETAMOL KERN PHARMA 1 g"),
+    ("444444", "Ácido acetilsalicílico 100 mg"),
+    ("555555", "Amoxicilina/Ácido clavulánico 875/125 mg"),
+]
+
+
+def _build(tmp_path):
+    path = tmp_path / "out" / "vademecum_search.idx"
+    with SearchIndexBuilder(path, spill_entries=16) as builder:
+        for cn, nombre in _NAMES:
+            builder.add([{"cn": cn, "nombre": nombre}])
+        builder.close()
+    return path
+
+
+def test_prefix_queries_fold_accents_and_rank_shorter_names_first(tmp_path) -> None:
+    path = _build(tmp_path)
+    assert sorted(p.name for p in path.parent.iterdir()) == ["vademecum_search.idx"]
+
+    with SearchIndex(path) as index:
+        assert index.docs == len(_NAMES)
+        assert [hit.cn for hit in index.search("ibupro")] == ["222222", "111111"]
+        assert [hit.cn for hit in index.search("ibuprofeno 400")] == ["111111"]
+        assert [hit.cn for hit in index.search("acido")] == ["444444", "555555"]
+        assert [hit.cn for hit in index.search("ÁCIDO CLAVUL")] == ["555555"]
+        assert [hit.cn for hit in index.search("acetilsalicilico")] == ["444444"]
+        assert index.search("ibupro", limit=1)[0].nombre == "Ibuprofeno 600 mg"
+
+
+def test_falls_back_to_trigrams_for_typos(tmp_path) -> None:
+    with SearchIndex(_build(tmp_path)) as index:
+        hits = index.search("paracetamlo")
+    assert hits[0].cn == "333333"
+
+
+def test_retracted_record_with_unique_tokens_keeps_tables_aligned(tmp_path) -> None:
+    path = tmp_path / "out" / "vademecum_search.idx"
+    with SearchIndexBuilder(path, spill_entries=16) as builder:
+        builder.add([{"cn": "999999", "nombre": "Zzyzx retirado"}])
+        builder.retract([{"cn": "999999", "nombre": "Zzyzx retirado"}])
+        builder.add([{"cn": "111111", "nombre": "Ibuprofeno 400 mg"}])
+        builder.add([{"cn": "222222", "nombre": "Paracetamol 1 g"}])
+        builder.close()
+
+    with SearchIndex(path) as index:
+        assert index.search("zzyzx") == []
+        assert [hit.cn for hit in index.search("ibupro")] == ["111111"]
+        assert [hit.cn for hit in index.search("paracet")] == ["222222"]
+
+
+def test_short_prefix_decodes_only_the_returned_documents(tmp_path) -> None:
+    path = tmp_path / "out" / "vademecum_search.idx"
+    with SearchIndexBuilder(path, spill_entries=64) as builder:
+        for number in range(200):
+            builder.add([{"cn": f"{700000 + number}", "nombre": "Medicamento " + "x" * number}])
+        builder.close()
+
+    with SearchIndex(path) as index:
+        decoded: list[int] = []
+        hit = index.hit
+        index.hit = lambda ordinal: decoded.append(ordinal) or hit(ordinal)  # type: ignore[method-assign]
+        hits = index.search("m", limit=3)
+    assert [found.cn for found in hits] == ["700000", "700001", "700002"]
+    assert decoded == [0, 1, 2]
@@ -0,0 +1,35 @@
+from __future__ import annotations
+
+import gzip
+import json
+
+from vademecum_builder import bench
+from vademecum_builder.build_full import run_full_build
+from vademecum_builder.standin import StandinConfig, StandinServer
+from vademecum_builder.synthetic import SyntheticDataset
+
+
+def test_full_build_against_standin(tmp_path, make_settings) -> None:
+    config = StandinConfig(size=25, page_size=10)
+    with StandinServer(config) as server:
+        settings = make_settings(tmp_path / "out", cima_base_url=server.url)
+        assert run_full_build(settings) == 0
+        requests_seen = server.state.snapshot()
+
+    with gzip.open(settings.out_dir / "vademecum_full.jsonl.gz", "rt", encoding="utf-8") as handle:
+        rows = [json.loads(line) for line in handle]
+    assert len(rows) == SyntheticDataset(size=25).presentaciones_count()
+    assert requests_seen["/medicamento 200"] == 25
+    assert requests_seen["/medicamentos 200"] == 4
+
+
+def test_bench_reports_both_phases(tmp_path, capsys) -> None:
+    code = bench.main(["--size", "20", "--page-size", "8", "--out-dir", str(tmp_path / "out")])
+    assert code == 0
+
+    report = json.loads(capsys.readouterr().out)
+    assert [phase["phase"] for phase in report["phases"]] == ["full", "incremental"]
+    full = report["phases"][0]
+    assert full["requests"] == 20 + 4
+    assert full["records"] > 0
+    assert full["peak_rss_bytes"] > 0
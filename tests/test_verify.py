@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import gzip
+import json
+from pathlib import Path
+
+from vademecum_builder import build_full
+from vademecum_builder.profiles import OutputProfile
+from vademecum_builder.utils import file_size, sha256_file
+from vademecum_builder.verify import verify_release
+
+_PAYLOADS = {
+    nregistro: {
+        "nombre": f"Medicamento {nregistro}",
+        "presentaciones": [{"cn": f"{nregistro}01"}, {"cn": f"{nregistro}02"}],
+    }
+    for nregistro in ("1001", "1002", "1003")
+}
+
+
+def _full(out_dir: Path, fake_cima, make_settings, **overrides: object) -> None:
+    fake_cima(_PAYLOADS)
+    settings = make_settings(
+        out_dir,
+        version="2026-03-08",
+        output_codecs=("gzip", "xz"),
+        profiles=(OutputProfile(name="lite", fields=("cn", "nombre")),),
+        **overrides,
+    )
+    assert build_full.run_full_build(settings) == 0
+
+
+def test_verify_accepts_a_fresh_release(tmp_path, fake_cima, make_settings) -> None:
+    chunked, sharded = tmp_path / "chunked", tmp_path / "sharded"
+    _full(chunked, fake_cima, make_settings, full_chunks=True)
+    _full(sharded, fake_cima, make_settings, full_shards=2)
+
+    # full (o 2 shards) + su versión xz + el perfil lite
+    for out_dir, files in ((chunked, 3), (sharded, 5)):
+        report = verify_release(out_dir, workers=2)
+        assert report.ok, report.errors
+        assert report.files == files
+
+
+def test_verify_reports_corruption_and_duplicates(tmp_path, fake_cima, make_settings) -> None:
+    out_dir = tmp_path / "out"
+    _full(out_dir, fake_cima, make_settings)
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+
+    xz_path = out_dir / manifest["encodings"][1]["file"]
+    data = bytearray(xz_path.read_bytes())
+    data[len(data) // 2] ^= 0xFF
+    xz_path.write_bytes(bytes(data))
+    # Duplica una línea del full y actualiza el manifest para que solo falle la unicidad.
+    main_path = out_dir / manifest["file"]
+    lines = gzip.decompress(main_path.read_bytes()).splitlines(keepends=True)
+    main_path.write_bytes(gzip.compress(b"".join([*lines, lines[0]]), mtime=0))
+    manifest.update(sha256=sha256_file(main_path), size=file_size(main_path))
+    (out_dir / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+    report = verify_release(out_dir, workers=1)
+
+    assert not report.ok
+    assert any(xz_path.name in error for error in report.errors)
+    assert any("duplicado" in error for error in report.errors)
+
+
+def test_verify_requires_delta_and_deleted_list_to_be_disjoint(tmp_path) -> None:
+    delta = tmp_path / "vademecum_delta_2026-03-09.jsonl.gz"
+    deleted = tmp_path / "deleted_2026-03-09.txt.gz"
+    record = {
+        "cn": "100101",
+        "nregistro": "1001",
+        "nombre": "Medicamento",
+        "updated_at": "2026-03-09",
+        "source": "CIMA",
+    }
+    delta.write_bytes(gzip.compress((json.dumps(record) + "\n").encode(), mtime=0))
+    deleted.write_bytes(gzip.compress(b"100101\n123\n", mtime=0))
+    manifest = {
+        "version": "2026-03-09",
+        "mode": "incremental",
+        "file": delta.name,
+        "deleted_file": deleted.name,
+        "sha256": sha256_file(delta),
+        "size": file_size(delta),
+    }
+    (tmp_path / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+    report = verify_release(tmp_path)
+
+    assert report.error_count == 2
+    assert "formato inválido" in report.errors[0]
+    assert "100101" in report.errors[1]
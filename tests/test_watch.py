@@ -0,0 +1,125 @@
+from __future__ import annotations
+
+import gzip
+import json
+from datetime import datetime, timezone
+
+from vademecum_builder import watch
+from vademecum_builder.cima_client import ChangePage, CimaChange
+from vademecum_builder.config import BuildMode, Settings
+from vademecum_builder.nomenclator_loader import NomenclatorData
+from vademecum_builder.state import StateData, load_state, save_state
+
+
+class _FakeCimaClient:
+    instances = 0
+
+    def __init__(self, *args: object, **kwargs: object) -> None:
+        type(self).instances += 1
+        self.polls = 0
+
+    def bind_metrics(self, metrics: object) -> None:
+        pass
+
+    def get_registro_cambios_page(self, fecha_ddmmyyyy: str, page: int = 1) -> ChangePage:
+        self.polls += 1
+        return ChangePage([CimaChange(nregistro="1001", tipo_cambio="Modificación", cn=None)])
+
+    def get_medicamento(self, nregistro: str) -> dict[str, object]:
+        # El tercer sondeo ve un cambio de nombre; los dos primeros, el mismo contenido.
+        nombre = "Nuevo" if self.polls >= 3 else "Original"
+        return {"nombre": nombre, "presentaciones": [{"cn": "100101"}]}
+
+
+def _settings(tmp_path, make_settings) -> Settings:
+    settings = make_settings(tmp_path / "out", mode=BuildMode.INCREMENTAL, version="2026-03-01")
+    save_state(
+        settings.state_path,
+        StateData(
+            last_success_version="2026-03-01",
+            last_full_version="2026-03-01",
+            last_incremental_date="01/03/2026",
+            total_presentaciones_full=0,
+            stats_last_run={},
+            failed_nregistro_last_run=[],
+        ),
+    )
+    return settings
+
+
+def test_watch_publishes_only_micro_deltas_with_changes(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    settings = _settings(tmp_path, make_settings)
+    out_dir = settings.out_dir
+    nomenclator_loads: list[object] = []
+    monkeypatch.setattr(watch, "CimaClient", _FakeCimaClient)
+    monkeypatch.setattr(
+        watch,
+        "load_nomenclator",
+        lambda **kwargs: nomenclator_loads.append(kwargs) or NomenclatorData({}, "test"),
+    )
+    versions = iter(["2026-03-02T100000Z", "2026-03-02T100500Z", "2026-03-02T101000Z"])
+    monkeypatch.setattr(watch, "micro_version", lambda: next(versions))
+
+    assert watch.run_watch(settings, interval=0, max_cycles=3) == 0
+
+    assert _FakeCimaClient.instances == 1
+    assert len(nomenclator_loads) == 1
+    deltas = sorted(path.name for path in out_dir.glob("vademecum_delta_*"))
+    assert deltas == [
+        "vademecum_delta_2026-03-02T100000Z.jsonl.gz",
+        "vademecum_delta_2026-03-02T101000Z.jsonl.gz",
+    ]
+    with gzip.open(out_dir / deltas[-1], "rt", encoding="utf-8") as handle:
+        (row,) = [json.loads(line) for line in handle]
+    assert row["nombre"] == "Nuevo"
+    manifest = json.loads((out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["version"] == "2026-03-02T101000Z"
+    state = load_state(settings.state_path)
+    assert state is not None
+    assert state.last_incremental_date == "02/03/2026"
+
+
+def test_micro_version_sorts_after_the_daily_version() -> None:
+    version = watch.micro_version(datetime(2026, 3, 2, 9, 5, 7, tzinfo=timezone.utc))
+    assert version == "2026-03-02T090507Z"
+    assert "2026-03-02" < version < "2026-03-03"
+
+
+def test_watch_reloads_the_nomenclator_on_the_refresh_interval(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    settings = _settings(tmp_path, make_settings)
+    refs = iter(["nomen#a", "nomen#a", "nomen#b"])
+    monkeypatch.setattr(watch, "CimaClient", _FakeCimaClient)
+    monkeypatch.setattr(watch, "load_nomenclator", lambda **kwargs: NomenclatorData({}, next(refs)))
+    versions = iter(["2026-03-02T100000Z", "2026-03-02T100500Z"])
+    monkeypatch.setattr(watch, "micro_version", lambda: next(versions))
+
+    assert watch.run_watch(settings, interval=0, max_cycles=2, nomenclator_refresh=0) == 0
+
+    manifest = json.loads((settings.out_dir / "manifest.json").read_text(encoding="utf-8"))
+    assert manifest["version"] == "2026-03-02T100000Z"
+    assert manifest["source_versions"]["nomenclator"] == "nomen#a"
+    # Carga inicial y una recarga antes de cada sondeo.
+    assert next(refs, None) is None
+
+
+def test_watch_exits_non_zero_after_consecutive_failures(
+    tmp_path, monkeypatch, make_settings
+) -> None:
+    settings = _settings(tmp_path, make_settings)
+    calls: list[str] = []
+
+    def _failing_delta(settings: Settings, **kwargs: object) -> int:
+        calls.append(settings.version)
+        raise RuntimeError("CIMA caído")
+
+    monkeypatch.setattr(watch, "CimaClient", _FakeCimaClient)
+    monkeypatch.setattr(watch, "load_nomenclator", lambda **kwargs: None)
+    monkeypatch.setattr(watch, "run_delta_build", _failing_delta)
+
+    assert watch.run_watch(settings, interval=0, max_cycles=10, max_consecutive_failures=3) == 1
+    assert len(calls) == 3
+    assert watch.run_watch(settings, interval=0, max_cycles=2) == 1